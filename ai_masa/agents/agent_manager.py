@@ -8,11 +8,15 @@ class AgentManager(BaseAgent):
     """
     他のエージェントの生存を監視し、状態を報告するエージェント。
     """
-    def __init__(self, name="AgentManager", redis_host='localhost', timeout_seconds=60):
+    # 全エージェントのハートビートを受け取るため、firehoseを購読する
+    subscribe_firehose = True
+
+    def __init__(self, name="AgentManager", redis_host='localhost', timeout_seconds=60, **kwargs):
         super().__init__(
             name=name,
             description="I am an agent manager, monitoring the status of other agents.",
-            redis_host=redis_host
+            redis_host=redis_host,
+            **kwargs
         )
         self.active_agents = {}  # { "agent_name": last_heartbeat_timestamp }
         self.timeout_seconds = timeout_seconds
@@ -27,7 +31,7 @@ class AgentManager(BaseAgent):
         ハートビートメッセージを特別に処理する。
         """
         try:
-            msg = Message.from_json(message_json)
+            msg = Message.from_payload(message_json)
             
             # ブロードキャストCCがあれば、生存通知として記録
             if "_broadcast_" in msg.cc_agents:
@@ -38,7 +42,8 @@ class AgentManager(BaseAgent):
             
             # 自分宛のメッセージであれば、通常の処理（思考など）を行う
             if msg.to_agent == self.name and msg.from_agent != self.name:
-                super()._on_message_received(message_json)
+                # パース済みの Message を渡し、もう一度デコードしないようにする
+                super()._on_message_received(msg)
 
         except Exception as e:
             print(f"[{self.name}] Error in _on_message_received: {e}")
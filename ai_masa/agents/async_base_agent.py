@@ -0,0 +1,260 @@
+import sys
+import asyncio
+import shlex
+from ..models.message import Message
+from ..comms.async_redis_broker import AsyncRedisBroker
+from ..llm.worker_pool import LLMWorkerError, LLMCommandError
+from ..llm.executor import LLMExecutionError
+from .base_agent import BaseAgent
+
+class AsyncBaseAgent(BaseAgent):
+    """
+    asyncio のイベントループ1つで動作するエージェント。
+
+    メッセージごとにタスクを作り、LLMコマンドは asyncio.create_subprocess_exec で
+    実行するため、スレッドを増やさずに多数のジョブを同時に進められる。
+    同じjob_idのメッセージは順番に処理され、同時に処理するジョブ数は
+    max_concurrent_jobs で制限する。
+
+    LLMコマンドはシェルを介さずに実行する (パイプ等が必要な場合はスクリプトにまとめる)。
+    サブクラスが同期版の think_and_respond / _create_llm_session をオーバーライドしている
+    場合は、それらを別スレッドで実行する。_build_prompt はそのまま利用される。
+    """
+    def __init__(self, name, description, user_lang='Japanese', redis_host='localhost',
+                 start_heartbeat=True, max_concurrent_jobs=1000, heartbeat_interval=30, **kwargs):
+        """その他の引数 (llm_command, routing, context_store など) はそのまま BaseAgent に渡す"""
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.heartbeat_interval = heartbeat_interval
+        self._heartbeat_enabled = start_heartbeat
+        self._loop = None
+        self._tasks = set()
+        self._job_locks = {}
+        self._job_slots = None
+        if kwargs.get("broker") is None:
+            kwargs["broker"] = AsyncRedisBroker(host=redis_host, routing=kwargs.get("routing", "global"))
+        # 思考はイベントループ上のタスクで行うため、ワーカースレッド (MessageDispatcher) は作らない。
+        # llm_workers は LLMExecutor の同時実行数の既定値としてだけ使う
+        llm_workers = kwargs.pop("llm_workers", 0)
+        if llm_workers and kwargs.get("llm_timeout") is not None and kwargs.get("llm_concurrency") is None:
+            kwargs["llm_concurrency"] = llm_workers
+        # ハートビートは run() の中でタスクとして送るため、親クラスのタイマーは使わない
+        super().__init__(
+            name, description, user_lang=user_lang, redis_host=redis_host, start_heartbeat=False, **kwargs
+        )
+
+    def _connect_broker(self):
+        # 接続は run() の中で行う
+        pass
+
+    def observe_loop(self):
+        asyncio.run(self.run())
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._job_slots = asyncio.Semaphore(self.max_concurrent_jobs)
+        await self.broker.connect()
+        if self._heartbeat_enabled:
+            self._track(self._loop.create_task(self._heartbeat_loop()))
+        print(f"[{self.name}] Listening on Redis (asyncio)...")
+        try:
+            await self.broker.subscribe(
+                self._on_message_received,
+                shutdown_event=self.shutdown_event,
+                agent_name=self.name,
+                firehose=self.subscribe_firehose
+            )
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.broker.disconnect()
+
+    def _track(self, task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _heartbeat_loop(self):
+        while not self.shutdown_event.is_set():
+            await self.broadcast_async(target=self.name, content="heartbeat", cc=["_broadcast_"], job_id="_system_")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def _dispatch(self, msg, job_id, is_observer=False):
+        """受信ループ (イベントループ上) から呼ばれ、履歴への追加と思考処理をタスクとして起動する"""
+        self._track(self._loop.create_task(self._run_job(msg, job_id, is_observer)))
+
+    def _dispatch_record(self, msg, job_id):
+        # 同じジョブの先に届いたメッセージの思考が終わってから記録する
+        self._track(self._loop.create_task(self._run_job(msg, job_id, is_observer=None)))
+
+    def _job_pending(self, job_id):
+        return job_id in self._job_locks
+
+    def _is_participating(self, job_id):
+        # コンテキストストアへのアクセスでイベントループを止めないよう、ここでは判定せず
+        # 別スレッドで実行する _record に任せる (参加していないジョブのメッセージはそこで捨てられる)
+        return True
+
+    async def _run_job(self, msg, job_id, is_observer):
+        """is_observer が None の場合は記録するだけで思考しない"""
+        # { job_id: [lock, このロックを使用中・待機中のタスク数] }
+        entry = self._job_locks.get(job_id)
+        if entry is None:
+            entry = self._job_locks[job_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # 履歴の読み込み・追加はコンテキストストアへのI/Oになるため、別スレッドで行う
+                await asyncio.to_thread(self._record, msg, job_id, is_observer is not None)
+                if is_observer is None:
+                    return
+                # ジョブの順番が来てから同時実行数の枠を取る
+                async with self._job_slots:
+                    await self.think_and_respond_async(msg, job_id, is_observer=is_observer)
+        except Exception as e:
+            print(f"[{self.name}][{job_id}] Error in think_and_respond_async: {e}")
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._job_locks[job_id]
+
+    async def think_and_respond_async(self, trigger_msg, job_id, is_observer=False):
+        if type(self).think_and_respond is not BaseAgent.think_and_respond:
+            # サブクラス独自の同期実装を尊重する
+            await asyncio.to_thread(self.think_and_respond, trigger_msg, job_id, is_observer=is_observer)
+            return
+
+        # job_sessions (ファイル・Redis) や _compose_prompt (RedisContextStore・history_source) は
+        # ブロックする I/O を含むため、イベントループを止めないよう別スレッドで実行する
+        llm_session_id = await asyncio.to_thread(self.job_sessions.get, job_id)
+        if not llm_session_id:
+            print(f"[{self.name}][{job_id}] No session found. Creating a new one...")
+            llm_session_id = await self._create_llm_session_async(job_id)
+            if not llm_session_id:
+                print(f"[{self.name}][{job_id}] Failed to create LLM session. Aborting.")
+                return
+            await asyncio.to_thread(self.job_sessions.__setitem__, job_id, llm_session_id)
+            print(f"[{self.name}][{job_id}] New session created: {llm_session_id}")
+
+        prompt, is_delta = await asyncio.to_thread(
+            self._compose_prompt, trigger_msg, job_id, is_observer=is_observer, llm_session_id=llm_session_id
+        )
+        llm_response_json = await self._invoke_llm_async(
+            prompt, llm_session_id, job_id=job_id, use_cache=self._use_llm_cache(trigger_msg, job_id, is_delta)
+        )
+        if llm_response_json is None:
+            self._forget_prompt_cursor(job_id)
+        self._handle_llm_response(llm_response_json, job_id)
+
+    async def _create_llm_session_async(self, job_id):
+        if type(self)._create_llm_session is not BaseAgent._create_llm_session:
+            return await asyncio.to_thread(self._create_llm_session, job_id)
+
+        print(f"[{self.name}][{job_id}] Initializing LLM session with role: {self.role_prompt}")
+        if self._use_llm_pool():
+            try:
+                # ワーカーとのやり取りはブロックするため、別スレッドで待つ
+                return await asyncio.to_thread(self.llm_pool.create_session, self.role_prompt)
+            except LLMCommandError as e:
+                print(f"[{self.name}][{job_id}] Error executing LLM session creation command in worker: {e}")
+                return None
+            except LLMWorkerError as e:
+                print(f"[{self.name}][{job_id}] LLM worker error: {e}. Falling back to one-shot command.")
+        stdout = await self._run_command(self.llm_session_create_command, self.role_prompt, job_id, job_id=job_id)
+        if stdout is None:
+            return None
+        # コマンドの標準出力からセッションID（最後の行など）を取得
+        return stdout.strip().split('\n')[-1]
+
+    async def _invoke_llm_async(self, prompt, llm_session_id, job_id=None, use_cache=True):
+        # SQLite はロック待ち (busy_timeout) でブロックしうるため、別スレッドで読み書きする
+        key, cached = await asyncio.to_thread(self._cached_llm_response, prompt, job_id, use_cache)
+        if cached is not None:
+            return cached
+        response = await self._call_llm_async(prompt, llm_session_id, job_id)
+        if key is not None and response is not None:
+            await asyncio.to_thread(self._store_llm_response, key, response, job_id)
+        return response
+
+    async def _call_llm_async(self, prompt, llm_session_id, job_id=None):
+        print(f"[{self.name}][{job_id if job_id is not None else 'N/A'}] 🧠 Thinking...")
+        if self._use_llm_pool():
+            try:
+                return self._parse_llm_output(await asyncio.to_thread(self.llm_pool.call, prompt, llm_session_id))
+            except LLMCommandError as e:
+                print(f"[{self.name}] Error executing LLM command in worker: {e}")
+                return None
+            except LLMWorkerError as e:
+                print(f"[{self.name}] LLM worker error: {e}. Falling back to one-shot command.")
+        command_to_run = self.llm_command.format(session_id=llm_session_id)
+        stdout = await self._run_command(command_to_run, prompt, llm_session_id, job_id=job_id)
+        if stdout is None:
+            return None
+        return self._parse_llm_output(stdout)
+
+    async def _run_command(self, command, input_text, label, job_id=None):
+        """シェルを介さずにコマンドを実行し、成功した場合は標準出力を返す"""
+        if self.llm_executor is not None:
+            # 同時実行数と期限は LLMExecutor に任せる (このタスクが取り消されたらプロセスも kill される)
+            try:
+                future = self.llm_executor.submit(shlex.split(command), input_text, job_id=job_id)
+                result = await asyncio.wrap_future(future)
+            except (LLMExecutionError, ValueError) as e:
+                self._report_llm_error(e, label)
+                return None
+            return self._llm_result_output(result, label)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *shlex.split(command),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except (FileNotFoundError, ValueError):
+            print(f"[{self.name}][{label}] Error: LLM command not found: '{command}'")
+            return None
+        try:
+            stdout, stderr = await process.communicate(input_text.encode())
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        if process.returncode != 0:
+            print(f"[{self.name}][{label}] Error executing LLM command '{command}' (exit {process.returncode})\nStderr: {stderr.decode(errors='replace')}")
+            return None
+        return stdout.decode()
+
+    def broadcast(self, target, content, cc=None, job_id="default"):
+        """同期コード (サブクラスのフックなど) からも呼べるよう、送信をイベントループに予約する"""
+        if self._loop is None:
+            raise RuntimeError(f"[{self.name}] Agent is not running. Call run() first.")
+        coro = self.broadcast_async(target, content, cc=cc, job_id=job_id)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._track(self._loop.create_task(coro))
+        else:
+            asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def broadcast_async(self, target, content, cc=None, job_id="default"):
+        if not target or not content:
+            print(f"[{self.name}][{job_id}] ⚠️ Missing target or content. Aborting broadcast.")
+            return
+        msg = Message(self.name, target, content, cc_agents=cc, job_id=job_id)
+        await self.broker.publish(msg.to_json(), recipients=[target, *msg.cc_agents])
+        print(f"[{self.name}][{job_id}] 🚀 Sent to {target}: {content}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python -m ai_masa.agents.async_base_agent <Name> <Description> [user_lang] [llm_command] [llm_session_create_command]")
+        sys.exit(1)
+
+    agent = AsyncBaseAgent(
+        name=sys.argv[1],
+        description=sys.argv[2],
+        user_lang=sys.argv[3] if len(sys.argv) > 3 else 'Japanese',
+        llm_command=sys.argv[4] if len(sys.argv) > 4 else "echo '{\"to_agent\": \"dummy\", \"content\": \"dummy response\"}'",
+        llm_session_create_command=sys.argv[5] if len(sys.argv) > 5 else "echo 'new_session_id'"
+    )
+    agent.observe_loop()
@@ -1,46 +1,162 @@
 import sys
 import json
+import shlex
+import sqlite3
 import subprocess
 import threading
 import time
 from ..models.message import Message
+from ..models.codec import MessageCodec
 from ..comms.redis_broker import RedisBroker
-from ..models.prompts import JSON_FORMAT_EXAMPLE, PROMPT_TEMPLATE, OBSERVER_INSTRUCTION
+from .dispatcher import MessageDispatcher
+from .seen_ids import SeenIdCache
+from ..llm.worker_pool import LLMWorkerPool, LLMWorkerError, LLMCommandError
+from ..llm.executor import LLMExecutor, LLMExecutionError, LLMTimeoutError, LLMCancelledError
+from ..llm.response_cache import LLMResponseCache
+from ..llm.session_registry import get_session_registry
+from ..context.store import get_context_store
+from ..context.rendered import RenderedHistory
+from ..context.summary import RollingSummary, extractive_summary
+from ..context.relevance import RelevanceIndex
+from ..models.prompts import (
+    JSON_FORMAT_EXAMPLE, PROMPT_TEMPLATE, DELTA_PROMPT_TEMPLATE, OBSERVER_INSTRUCTION,
+    HISTORY_OMITTED_NOTE, HISTORY_SECTION_TEMPLATE, HISTORY_SUMMARY_TITLE, HISTORY_RELEVANT_TITLE,
+    HISTORY_LATEST_TITLE, CompiledPrompt
+)
 
 class BaseAgent:
+    # Trueの場合、addressedルーティングでも全トラフィック (firehose) を購読する
+    subscribe_firehose = False
+    RECORD_POLICIES = ("all", "participating")
+    DELTA_PROMPT = CompiledPrompt(DELTA_PROMPT_TEMPLATE)
+
     def __init__(self, name, description, user_lang='Japanese', redis_host='localhost',
                  llm_command="echo '{\"to_agent\": \"dummy\", \"content\": \"dummy response\"}'",
                  llm_session_create_command="echo 'new_session_id'",
-                 start_heartbeat=True):
+                 start_heartbeat=True, routing='global', broker=None,
+                 llm_workers=0, max_pending=100, overflow='block', block_timeout=30.0,
+                 dedup_size=10000, dedup_ttl=600.0, context_store=None,
+                 record_policy='all', history_source=None, delta_prompts=False,
+                 history_budget=None, history_summarizer=extractive_summary, relevant_history_share=None,
+                 llm_worker_command=None, llm_worker_pool_size=2, llm_timeout=None, llm_concurrency=None,
+                 llm_cache=None, session_registry=None):
+        if record_policy not in self.RECORD_POLICIES:
+            raise ValueError(f"Unknown record_policy: {record_policy!r} (expected one of {self.RECORD_POLICIES})")
         self.name = name
         self.description = description
         self.user_lang = user_lang
         self.language = 'en' # LLM間の会話は英語に固定
         self.llm_command = llm_command
         self.llm_session_create_command = llm_session_create_command
+        # llm_worker_command を指定した場合、LLMの呼び出しは常駐するワーカープロセス (LLMWorkerPool) に送り、
+        # 呼び出しごとにシェルとCLIを起動し直さない。ワーカーが使えなくなったら従来のコマンドに戻る
+        self.llm_pool = LLMWorkerPool(llm_worker_command, size=llm_worker_pool_size) if llm_worker_command else None
+        # llm_timeout (秒) か llm_concurrency を指定した場合、LLMコマンドはシェルを介さずに LLMExecutor で実行する。
+        # 同時実行数を llm_concurrency (省略時は llm_workers) に制限し、期限を過ぎたプロセスは kill する。
+        # ジョブが期限切れ・discard でコンテキストから捨てられたら、そのジョブの実行中の呼び出しも取り消す (cancel_job)
+        self.llm_executor = None
+        if llm_timeout is not None or llm_concurrency is not None:
+            self.llm_executor = LLMExecutor(
+                max_concurrency=llm_concurrency or max(1, llm_workers), timeout=llm_timeout, name=f"{name}-llm"
+            )
+        # llm_cache (SQLiteファイルのパスまたは LLMResponseCache) を指定した場合、(ロールプロンプト, プロンプト,
+        # llm_command) が同じ呼び出しには保存済みの応答を返す。呼び出しごとに使わないようにするには
+        # should_cache_llm_response() をオーバーライドする。差分のプロンプト (delta_prompts) はキャッシュしない
+        self.llm_cache = LLMResponseCache(llm_cache) if isinstance(llm_cache, str) else llm_cache
         
         # job_idごとに会話履歴とLLMセッションIDを管理
-        self.context = {}  # { "job_id_1": [msg1, msg2], "job_id_2": [msg3] }
-        self.job_sessions = {} # { "job_id_1": "llm_session_uuid_a", "job_id_2": "llm_session_uuid_b" }
+        # 会話履歴は上限付きのストアに保持する (context_store で差し替え可能)。dict と同じく context[job_id] で読める
+        # context_store='redis' で、履歴を Redis に置いてエージェント間で共有する (RedisContextStore)
+        if context_store == "redis":
+            context_store = get_context_store("redis", host=redis_host)
+        self.context = get_context_store(context_store if context_store is not None else "memory")
+        # プロンプト用に描画した履歴をジョブごとに保持し、新しいメッセージの分だけ描画を足していく
+        self._rendered_history = RenderedHistory(self.context)
+        # delta_prompts=True の場合、LLMセッションが既に見たメッセージは送らず、前回以降の差分だけを送る
+        # (llm_command が会話を続けるセッションを再開する場合向け)。
+        # { job_id: (llm_session_id, 次に送るメッセージの seq, 最初に送ったプロンプトのテンプレート) }
+        self.delta_prompts = delta_prompts
+        self._prompt_cursors = {}
+        self.prompt_stats = {"full": 0, "delta": 0, "sent_chars": 0, "windowed": 0, "dropped_tokens": 0}
+        # history_budget (トークン数の見積もり) を指定した場合、プロンプトの履歴は新しいものから
+        # 予算に収まるだけにし、省いた古いメッセージは history_summarizer で要約して添える。
+        # 要約はバックグラウンドで作られ、ジョブごとに積み増される (history_summarizer=None で要約なし)
+        self.history_budget = history_budget
+        self._summaries = None
+        if history_budget is not None and history_summarizer is not None:
+            self._summaries = RollingSummary(self.context, history_summarizer)
+        # relevant_history_share (0〜1) を指定した場合、history_budget のその割合を、
+        # 直近の窓から外れた古いメッセージのうち、きっかけのメッセージに関連するもの (BM25) に充てる
+        self.relevant_history_share = relevant_history_share
+        self._relevance = None
+        if history_budget is not None and relevant_history_share:
+            self._relevance = RelevanceIndex(self.context)
+        self.context.add_eviction_listener(self._on_context_evicted)
+        # { "job_id_1": "llm_session_uuid_a", "job_id_2": "llm_session_uuid_b" } (dict と同じように使える)
+        # session_registry='file' / 'redis' で対応を保存し、再起動したエージェントも既存のセッションを作り直さずに使う。
+        # 保存先はエージェント名ごとに分かれ、最初に使われたときに読み込まれる
+        if session_registry in ("file", "redis"):
+            options = {"host": redis_host} if session_registry == "redis" else {}
+            session_registry = get_session_registry(session_registry, namespace=name, **options)
+        self.job_sessions = get_session_registry(session_registry if session_registry is not None else "memory")
+        # record_policy='participating' の場合、自分宛 (to/cc) のメッセージが届いたジョブだけを記録する。
+        # 参加する前の履歴は history_source (RedisHistoryArchive など) があればそこから読み込む
+        self.record_policy = record_policy
+        self.history_source = history_source
+        # プロンプトの送信位置や統計は受信スレッドと複数のワーカーから触るため、このロックで保護する
+        # (job_sessions と context はそれぞれ自身が保護する。ファイルや Redis の I/O をこのロックの中で行わないこと)
+        self._state_lock = threading.RLock()
+        # 再配送された (同じ message_id の) メッセージで二度思考しないよう、受信済みのIDを覚えておく
+        # dedup_size=0 で無効
+        self.seen_ids = SeenIdCache(max_size=dedup_size, ttl=dedup_ttl) if dedup_size > 0 else None
         
-        self.broker = RedisBroker(host=redis_host)
-        self.broker.connect()
+        # routing='addressed' の場合、自分宛 (to/cc) のメッセージだけを受信する
+        # broker を渡した場合 (RedisStreamBroker など) はそちらを使う
+        self.broker = broker if broker is not None else RedisBroker(host=redis_host, routing=routing)
+        self._connect_broker()
         
         # ロールプロンプトを動的に生成
         self.role_prompt = self._generate_role_prompt()
 
+        # llm_workers > 0 の場合、思考 (LLM呼び出し) をワーカースレッドで行い、
+        # 受信スレッドがLLMの応答待ちで止まらないようにする。
+        # 同じjob_idのメッセージは順番に、異なるjob_idは並列に処理される。
+        # overflow='block' でも block_timeout 秒待って空かなければ破棄し、受信スレッドを止め続けない
+        self.dispatcher = None
+        if llm_workers > 0:
+            self.dispatcher = MessageDispatcher(
+                name=self.name, workers=llm_workers, max_pending=max_pending, overflow=overflow,
+                block_timeout=block_timeout
+            ).start()
+
         # 終了イベントとハートビートの設定
         self.shutdown_event = threading.Event()
         self.heartbeat_timer = None
         if start_heartbeat:
             self._start_heartbeat()
 
+    def _connect_broker(self):
+        self.broker.connect()
+
     def shutdown(self):
         """エージェントをシャットダウンし、バックグラウンドスレッドを停止する"""
         print(f"[{self.name}] Shutting down...")
         self.shutdown_event.set()
         if self.heartbeat_timer:
             self.heartbeat_timer.cancel()
+        if self.dispatcher:
+            self.dispatcher.stop(timeout=1)
+        if self._summaries:
+            self._summaries.stop()
+        if self.llm_pool:
+            self.llm_pool.close()
+        if self.llm_executor:
+            self.llm_executor.stop()
+        if self.llm_cache:
+            print(f"[{self.name}] LLM cache: {self.llm_cache.metrics()}")
+        codec = getattr(self.broker, 'codec', None)
+        if isinstance(codec, MessageCodec) and (codec.stats["compressed"] or codec.stats["decompressed"]):
+            print(f"[{self.name}] Compression: {codec.compression_report()}")
 
     def _send_heartbeat(self):
         """ハートビートを送信する"""
@@ -78,30 +194,114 @@ Example:
 
     def observe_loop(self):
         print(f"[{self.name}] Listening on Redis...")
-        self.broker.subscribe(self._on_message_received, shutdown_event=self.shutdown_event)
+        self.broker.subscribe(
+            self._on_message_received,
+            shutdown_event=self.shutdown_event,
+            agent_name=self.name,
+            firehose=self.subscribe_firehose
+        )
 
     def _on_message_received(self, message_json):
+        """
+        受信したメッセージを処理する。思考処理をワーカーに渡した場合は、その完了を表す Future を返す
+        (RedisStreamBroker は完了してから ACK する)。
+        """
         try:
-            msg = Message.from_json(message_json)
+            msg = Message.from_payload(message_json)
             if msg.from_agent == self.name:
                 return
 
             job_id = msg.job_id or "default"
-            
-            self.context.setdefault(job_id, []).append(msg)
-
             is_to_me = msg.to_agent == self.name
+            is_cc = not is_to_me and self.name in msg.cc_agents
+            if not (is_to_me or is_cc) and not self._is_participating(job_id):
+                # 参加していないジョブのメッセージは記録しない
+                return
+
+            if self.seen_ids is not None and self.seen_ids.check(msg.message_id):
+                print(f"[{self.name}][{job_id}] ♻️ Ignoring duplicate message {msg.message_id} from {msg.from_agent}")
+                return
+
+            # 履歴への追加は、同じジョブの先に届いたメッセージの思考が終わってから行う
+            # (先のメッセージへのプロンプトに、後から届いたメッセージが入らないように)
             if is_to_me:
                 print(f"[{self.name}][{job_id}] 📨 Received from {msg.from_agent}: {msg.content}")
-                self.think_and_respond(msg, job_id)
-            elif self.name in msg.cc_agents:
+                completion = self._dispatch(msg, job_id)
+            elif is_cc:
                 print(f"[{self.name}][{job_id}] 👀 (CC) Saw message from {msg.from_agent}")
                 # CCで受信した場合も、観察者として思考する
-                self.think_and_respond(msg, job_id, is_observer=True)
+                completion = self._dispatch(msg, job_id, is_observer=True)
+            else:
+                self._dispatch_record(msg, job_id)
+                return
+            if completion is not None and self.seen_ids is not None:
+                # 思考が失敗・破棄された場合はブローカーが再配送するため、その再配送を重複として捨てないよう ID を忘れる
+                completion.add_done_callback(lambda future: self._forget_if_failed(future, msg.message_id))
+            return completion
 
         except Exception as e:
             print(f"[{self.name}] Error in _on_message_received: {e}")
 
+    def _forget_if_failed(self, completion, message_id):
+        if completion.exception() is not None:
+            self.seen_ids.forget(message_id)
+
+    def _is_participating(self, job_id):
+        """record_policy に従い、宛先でないメッセージも記録するジョブかどうか"""
+        return self.record_policy != "participating" or job_id in self.context or self._job_pending(job_id)
+
+    def _job_pending(self, job_id):
+        """ジョブの思考処理・記録がワーカーで待機中または実行中かどうか"""
+        return self.dispatcher is not None and self.dispatcher.has_pending(job_id)
+
+    def _record(self, msg, job_id, addressed=False):
+        """
+        受信したメッセージを履歴に追加する。record_policy='participating' で参加し始めたジョブは、
+        それまでの履歴を読み込んでから追加する (宛先でないメッセージでは参加しない)。
+        """
+        if self.record_policy == "participating" and job_id not in self.context:
+            if not addressed:
+                return
+            self._backfill_history(job_id, msg)
+        self.context.append(job_id, msg)
+
+    def _record_and_think(self, msg, job_id, is_observer=False):
+        self._record(msg, job_id, addressed=True)
+        self.think_and_respond(msg, job_id, is_observer=is_observer)
+
+    def _dispatch_record(self, msg, job_id):
+        """宛先でないメッセージを記録する。同じジョブの思考処理が待っている場合は、その後に記録する"""
+        if self._job_pending(job_id):
+            self.dispatcher.submit_keyed(job_id, self._record, msg, job_id)
+        else:
+            self._record(msg, job_id)
+
+    def _backfill_history(self, job_id, trigger_msg):
+        """参加し始めたジョブの、それまでの履歴を history_source から読み込む"""
+        if self.history_source is None:
+            return
+        try:
+            earlier = self.history_source.fetch(job_id)
+        except Exception as e:
+            print(f"[{self.name}][{job_id}] Error fetching earlier history: {e}")
+            return
+        for msg in earlier:
+            # 受信時と同じく自分の発言は含めない。きっかけのメッセージは呼び出し元で追加する
+            if msg.from_agent == self.name or msg.message_id == trigger_msg.message_id:
+                continue
+            self.context.append(job_id, msg)
+        if earlier:
+            print(f"[{self.name}][{job_id}] Loaded {len(earlier)} earlier messages from history")
+
+    def _dispatch(self, msg, job_id, is_observer=False):
+        """
+        思考処理をワーカーに渡し、完了を表す Future を返す。ワーカーがない場合はその場で実行し、None を返す。
+        """
+        if self.dispatcher is None:
+            self._record_and_think(msg, job_id, is_observer=is_observer)
+            return None
+        return self.dispatcher.submit_tracked(job_id, self._record_and_think, msg, job_id, is_observer=is_observer)
+
     def think_and_respond(self, trigger_msg, job_id, is_observer=False):
         llm_session_id = self.job_sessions.get(job_id)
         
@@ -114,9 +314,17 @@ Example:
             self.job_sessions[job_id] = llm_session_id
             print(f"[{self.name}][{job_id}] New session created: {llm_session_id}")
 
-        prompt = self._build_prompt(trigger_msg, job_id, is_observer=is_observer)
-        llm_response_json = self._invoke_llm(prompt, llm_session_id)
-        
+        prompt, is_delta = self._compose_prompt(trigger_msg, job_id, is_observer=is_observer, llm_session_id=llm_session_id)
+        llm_response_json = self._invoke_llm(
+            prompt, llm_session_id, job_id=job_id, use_cache=self._use_llm_cache(trigger_msg, job_id, is_delta)
+        )
+        if llm_response_json is None:
+            # セッションがプロンプトを受け取れたか分からないため、次回は全体を送る
+            self._forget_prompt_cursor(job_id)
+        self._handle_llm_response(llm_response_json, job_id)
+
+    def _handle_llm_response(self, llm_response_json, job_id):
+        """LLMの応答(JSON)を解釈して送信する"""
         if not llm_response_json:
             print(f"[{self.name}][{job_id}] Error: LLM did not return a response.")
             return
@@ -137,6 +345,17 @@ Example:
     def _create_llm_session(self, job_id):
         """新しいLLMセッションを作成し、そのIDを返す"""
         print(f"[{self.name}][{job_id}] Initializing LLM session with role: {self.role_prompt}")
+        if self._use_llm_pool():
+            try:
+                return self.llm_pool.create_session(self.role_prompt)
+            except LLMCommandError as e:
+                print(f"[{self.name}][{job_id}] Error executing LLM session creation command in worker: {e}")
+                return None
+            except LLMWorkerError as e:
+                print(f"[{self.name}][{job_id}] LLM worker error: {e}. Falling back to one-shot command.")
+        if self.llm_executor is not None:
+            stdout = self._execute_llm_command(self.llm_session_create_command, self.role_prompt, job_id)
+            return stdout.strip().split('\n')[-1] if stdout is not None else None
         try:
             # セッション作成コマンドにロールプロンプトを入力として渡す
             process = subprocess.run(
@@ -154,55 +373,236 @@ Example:
             print(f"[{self.name}][{job_id}] Error: LLM command not found: '{self.llm_session_create_command}'")
             return None
 
-    def _build_prompt(self, trigger_msg, job_id, is_observer=False):
-        history = "\n".join([f"- {msg.from_agent}: {msg.content}" for msg in self.context.get(job_id, [])])
-        
+    def _build_prompt(self, trigger_msg, job_id, is_observer=False, llm_session_id=None):
+        """
+        LLMに渡すプロンプトを作る。delta_prompts が有効で、llm_session_id のセッションに
+        以前プロンプトを送っている場合は、それ以降のメッセージだけを DELTA_PROMPT で送る。
+        セッションが新しい・変わった・前回の呼び出しが失敗した場合は履歴全体を送る。
+        """
+        return self._compose_prompt(trigger_msg, job_id, is_observer=is_observer, llm_session_id=llm_session_id)[0]
+
+    def _compose_prompt(self, trigger_msg, job_id, is_observer=False, llm_session_id=None):
+        """_build_prompt と同じプロンプトを作り、(プロンプト, 差分のプロンプトか) を返す"""
         observer_instructions = ""
         if is_observer:
             observer_instructions = OBSERVER_INSTRUCTION
-            
-        return PROMPT_TEMPLATE.format(
-            name=self.name, 
-            role_prompt=self.role_prompt,
+
+        template = self._prompt_template()
+        track = self.delta_prompts and llm_session_id is not None
+        if track:
+            history = self._delta_history(job_id, llm_session_id, template)
+            if history is not None:
+                prompt = self.DELTA_PROMPT.render(
+                    history=history,
+                    from_agent=trigger_msg.from_agent,
+                    content=trigger_msg.content,
+                    observer_instructions=observer_instructions
+                )
+                self._count_prompt("delta", prompt)
+                return prompt, True
+
+        if self.history_budget is None:
+            history, next_seq = self._rendered_history.render(job_id)
+        else:
+            history, next_seq = self._budgeted_history(job_id, trigger_msg)
+        prompt = template.render(
             history=history,
             from_agent=trigger_msg.from_agent, 
             content=trigger_msg.content,
             observer_instructions=observer_instructions
         )
+        if track:
+            with self._state_lock:
+                self._prompt_cursors[job_id] = (llm_session_id, next_seq, template)
+        self._count_prompt("full", prompt)
+        return prompt, False
 
-    def _invoke_llm(self, prompt, llm_session_id):
-        print(f"[{self.name}][{self.job_sessions.get(llm_session_id, 'N/A')}] 🧠 Thinking...")
+    def _delta_history(self, job_id, llm_session_id, template):
+        """セッションに送っていないメッセージを描画して返す。全体を送るべき場合は None"""
+        with self._state_lock:
+            cursor = self._prompt_cursors.get(job_id)
+        # ロールや名前が変わった場合も、新しいテンプレートで全体を送り直す
+        if cursor is None or cursor[0] != llm_session_id or cursor[2] is not template:
+            return None
+        result = self.context.since(job_id, cursor[1])
+        if result is None:
+            return None
+        start, messages = result
+        render_line = self._rendered_history.render_line
+        lines = [render_line(msg) for msg in messages]
+        if self.history_budget is not None:
+            count_tokens = self._rendered_history.count_tokens
+            if sum(count_tokens(line) for line in lines) > self.history_budget:
+                # 差分だけで予算を超える場合は、窓を掛けた全体のプロンプトにする
+                return None
+        with self._state_lock:
+            self._prompt_cursors[job_id] = (llm_session_id, start + len(messages), template)
+        return "\n".join(lines)
+
+    def _budgeted_history(self, job_id, trigger_msg):
+        """
+        history_budget に収まるように新しいメッセージから履歴を取り、省いた分の件数・トークン数と
+        (あれば) 古いメッセージの要約・関連する古いメッセージを添えて、
+        (履歴, 次に追加されるメッセージの seq) を返す。
+        """
+        rendered_history = self._rendered_history
+        summary = self._summaries.get(job_id)[0] if self._summaries else ""
+        budget = self.history_budget
+        if summary:
+            budget = max(0, budget - rendered_history.count_tokens(summary))
+        window = rendered_history.window(job_id, budget)
+        if not window.dropped_messages:
+            return window.text, window.next_seq
+
+        relevant, relevant_tokens = [], 0
+        if self._relevance:
+            relevant_budget = int(budget * self.relevant_history_share)
+            window = rendered_history.window(job_id, budget - relevant_budget)
+            relevant, relevant_tokens = self._relevant_history(job_id, trigger_msg, window.first_seq, relevant_budget)
+        if self._summaries:
+            # 要約はバックグラウンドで進め、ここでは待たない
+            self._summaries.request(job_id, window.first_seq)
+
+        kept_messages = window.kept_messages + len(relevant)
+        kept_tokens = window.kept_tokens + relevant_tokens
+        dropped_messages = window.dropped_messages - len(relevant)
+        dropped_tokens = window.dropped_tokens - relevant_tokens
+        with self._state_lock:
+            self.prompt_stats["windowed"] += 1
+            self.prompt_stats["dropped_tokens"] += dropped_tokens
+        print(f"[{self.name}][{job_id}] ✂️ History over budget: kept {kept_messages} messages (~{kept_tokens} tokens"
+              f"{f', {len(relevant)} by relevance' if relevant else ''}), dropped {dropped_messages} (~{dropped_tokens} tokens)")
+        note = HISTORY_OMITTED_NOTE.format(
+            kept_messages=kept_messages, kept_tokens=kept_tokens,
+            dropped_messages=dropped_messages, dropped_tokens=dropped_tokens,
+        )
+        sections = []
+        if summary:
+            sections.append(HISTORY_SECTION_TEMPLATE.format(title=HISTORY_SUMMARY_TITLE, body=summary))
+        if relevant:
+            sections.append(HISTORY_SECTION_TEMPLATE.format(title=HISTORY_RELEVANT_TITLE, body="\n".join(relevant)))
+        if not sections:
+            return f"{note}\n{window.text}", window.next_seq
+        sections.append(HISTORY_SECTION_TEMPLATE.format(title=HISTORY_LATEST_TITLE, body=window.text))
+        return note + "\n" + "\n\n".join(sections), window.next_seq
+
+    def _relevant_history(self, job_id, trigger_msg, before_seq, budget):
+        """before_seq より前のメッセージから、trigger_msg に関連するものを budget に収まるだけ古い順に描画する"""
+        render_line = self._rendered_history.render_line
+        count_tokens = self._rendered_history.count_tokens
+        chosen, used = [], 0
+        for seq, msg, _ in self._relevance.search(job_id, trigger_msg.content, before_seq=before_seq, limit=50):
+            line = render_line(msg)
+            tokens = count_tokens(line)
+            if used + tokens > budget:
+                continue
+            chosen.append((seq, line))
+            used += tokens
+        chosen.sort()
+        return [line for _, line in chosen], used
+
+    def _count_prompt(self, kind, prompt):
+        with self._state_lock:
+            self.prompt_stats[kind] += 1
+            self.prompt_stats["sent_chars"] += len(prompt)
+
+    def _forget_prompt_cursor(self, job_id):
+        with self._state_lock:
+            self._prompt_cursors.pop(job_id, None)
+
+    def _on_context_evicted(self, job_id, first_seq, reason):
+        if first_seq is None:
+            self._forget_prompt_cursor(job_id)
+            if reason in ("expired", "discarded"):
+                # 終わったジョブのためにLLMを待ち続けない。max_jobs / max_bytes で押し出されただけの
+                # ジョブは進行中のことがあるため取り消さない
+                self.cancel_job(job_id)
+
+    def cancel_job(self, job_id):
+        """job_id の実行待ち・実行中のLLM呼び出しを取り消す (llm_executor を使う場合のみ)"""
+        if self.llm_executor is not None:
+            self.llm_executor.cancel_job(job_id)
+
+    def _prompt_template(self):
+        """name と role_prompt を埋め込んだ PROMPT_TEMPLATE (どちらかが変わったら作り直す)"""
+        key = (self.name, self.role_prompt)
+        compiled = getattr(self, "_compiled_prompt", None)
+        if compiled is None or compiled[0] != key:
+            compiled = self._compiled_prompt = (key, CompiledPrompt(PROMPT_TEMPLATE, name=self.name, role_prompt=self.role_prompt))
+        return compiled[1]
+
+    def should_cache_llm_response(self, trigger_msg, job_id):
+        """
+        この呼び出しで llm_cache を使うかどうか。応答が毎回変わるべきエージェント
+        (乱数や現在時刻に依存するものなど) は、オーバーライドして False を返す。
+        """
+        return True
+
+    def _use_llm_cache(self, trigger_msg, job_id, is_delta):
+        # 差分のプロンプトの意味はセッションがそれまでに見た履歴によって変わり、別のジョブでも
+        # 同じ文字列になりうる (同じ送信者の短いメッセージなど) ため、キャッシュしない
+        return not is_delta and self.should_cache_llm_response(trigger_msg, job_id)
+
+    def _llm_cache_key(self, prompt):
+        return LLMResponseCache.fingerprint(self.role_prompt, prompt, self.llm_command)
+
+    def _cached_llm_response(self, prompt, job_id, use_cache):
+        """(キャッシュのキー, キャッシュされた応答) を返す。キャッシュを使わない場合は (None, None)"""
+        if self.llm_cache is None or not use_cache:
+            return None, None
+        key = self._llm_cache_key(prompt)
+        try:
+            response = self.llm_cache.get(key)
+        except sqlite3.Error as e:
+            print(f"[{self.name}][{job_id}] LLM cache error: {e}")
+            return None, None
+        if response is not None:
+            print(f"[{self.name}][{job_id}] 💾 LLM response cache hit.")
+            # セッションはこのプロンプトを受け取っていないため、次回は履歴全体を送る
+            self._forget_prompt_cursor(job_id)
+        return key, response
+
+    def _store_llm_response(self, key, response, job_id):
+        if key is None or response is None:
+            return
+        try:
+            self.llm_cache.put(key, response)
+        except sqlite3.Error as e:
+            print(f"[{self.name}][{job_id}] LLM cache error: {e}")
+
+    def _invoke_llm(self, prompt, llm_session_id, job_id=None, use_cache=True):
+        key, cached = self._cached_llm_response(prompt, job_id, use_cache)
+        if cached is not None:
+            return cached
+        response = self._call_llm(prompt, llm_session_id, job_id)
+        self._store_llm_response(key, response, job_id)
+        return response
+
+    def _call_llm(self, prompt, llm_session_id, job_id=None):
+        print(f"[{self.name}][{job_id if job_id is not None else 'N/A'}] 🧠 Thinking...")
         
+        if self._use_llm_pool():
+            try:
+                return self._parse_llm_output(self.llm_pool.call(prompt, llm_session_id))
+            except LLMCommandError as e:
+                print(f"[{self.name}] Error executing LLM command in worker: {e}")
+                return None
+            except LLMWorkerError as e:
+                print(f"[{self.name}] LLM worker error: {e}. Falling back to one-shot command.")
+
         # コマンドテンプレートのプレースホルダーを実際のセッションIDで置換
         command_to_run = self.llm_command.format(session_id=llm_session_id)
 
+        if self.llm_executor is not None:
+            stdout = self._execute_llm_command(command_to_run, prompt, job_id)
+            return self._parse_llm_output(stdout) if stdout is not None else None
+
         try:
             process = subprocess.run(
                 command_to_run,
                 input=prompt, capture_output=True, text=True, shell=True, check=True
             )
-            raw_stdout = process.stdout
-            
-            # Gemini CLIの出力形式に対応する処理
-            try:
-                # まず、外側のJSONをパース
-                outer_response = json.loads(raw_stdout)
-                if "response" in outer_response:
-                    # 'response'キーの値（Markdownコードブロックの可能性あり）を抽出
-                    content_str = outer_response["response"]
-                    # MarkdownコードブロックからJSON文字列を抽出
-                    if content_str.strip().startswith("```json"):
-                        json_start = content_str.find("{")
-                        json_end = content_str.rfind("}") + 1
-                        if json_start != -1 and json_end != -1:
-                            inner_json_str = content_str[json_start:json_end]
-                            # 内部のJSON文字列をパースして返す
-                            return json.dumps(json.loads(inner_json_str))
-                # 'response'キーがないか、またはJSONとして処理できなかった場合、元のstdoutを返す
-                return raw_stdout
-            except json.JSONDecodeError:
-                # 外側のJSONパースに失敗した場合、そのまま返す (既存の挙動)
-                return raw_stdout
+            return self._parse_llm_output(process.stdout)
         except subprocess.CalledProcessError as e:
             print(f"[{self.name}] Error executing LLM command: {e}\nStderr: {e.stderr}")
             return None
@@ -210,12 +610,65 @@ Example:
             print(f"[{self.name}] Error: LLM command not found: '{command_to_run}'")
             return None
 
+    def _execute_llm_command(self, command, input_text, job_id):
+        """llm_executor でコマンドを実行し、標準出力を返す。失敗・期限切れ・取り消しの場合は None"""
+        try:
+            result = self.llm_executor.run(shlex.split(command), input_text, job_id=job_id)
+        except (LLMExecutionError, ValueError) as e:
+            self._report_llm_error(e, job_id)
+            return None
+        return self._llm_result_output(result, job_id)
+
+    def _report_llm_error(self, error, job_id):
+        if isinstance(error, LLMTimeoutError):
+            print(f"[{self.name}][{job_id}] LLM command timed out: {error}")
+        elif isinstance(error, LLMCancelledError):
+            print(f"[{self.name}][{job_id}] LLM command cancelled.")
+        else:
+            print(f"[{self.name}][{job_id}] Error executing LLM command: {error}")
+
+    def _llm_result_output(self, result, job_id):
+        """LLMExecutor の実行結果 (LLMResult) から標準出力を返す。失敗していれば None"""
+        print(f"[{self.name}][{job_id}] LLM command finished (queue wait {result.queue_wait:.2f}s, exec {result.exec_time:.2f}s)")
+        if result.returncode != 0:
+            print(f"[{self.name}][{job_id}] Error executing LLM command: exit code {result.returncode}\nStderr: {result.stderr}")
+            return None
+        return result.stdout
+
+    def _use_llm_pool(self):
+        return self.llm_pool is not None and not self.llm_pool.disabled
+
+    def _parse_llm_output(self, raw_stdout):
+        """LLMコマンドの標準出力から、応答のJSON文字列を取り出す"""
+        # Gemini CLIの出力形式に対応する処理
+        try:
+            # まず、外側のJSONをパース
+            outer_response = json.loads(raw_stdout)
+            if "response" in outer_response:
+                # 'response'キーの値（Markdownコードブロックの可能性あり）を抽出
+                content_str = outer_response["response"]
+                # MarkdownコードブロックからJSON文字列を抽出
+                if content_str.strip().startswith("```json"):
+                    json_start = content_str.find("{")
+                    json_end = content_str.rfind("}") + 1
+                    if json_start != -1 and json_end != -1:
+                        inner_json_str = content_str[json_start:json_end]
+                        # 内部のJSON文字列をパースして返す
+                        return json.dumps(json.loads(inner_json_str))
+            # 'response'キーがないか、またはJSONとして処理できなかった場合、元のstdoutを返す
+            return raw_stdout
+        except json.JSONDecodeError:
+            # 外側のJSONパースに失敗した場合、そのまま返す (既存の挙動)
+            return raw_stdout
+
     def broadcast(self, target, content, cc=None, job_id="default"):
         if not target or not content:
             print(f"[{self.name}][{job_id}] ⚠️ Missing target or content. Aborting broadcast.")
             return
         msg = Message(self.name, target, content, cc_agents=cc, job_id=job_id)
-        self.broker.publish(msg.to_json())
+        # 同一プロセス内のブローカーには Message をそのまま渡し、シリアライズを省く
+        payload = msg if self.broker.passes_messages else msg.to_json()
+        self.broker.publish(payload, recipients=[target, *msg.cc_agents])
         print(f"[{self.name}][{job_id}] 🚀 Sent to {target}: {content}")
 
 if __name__ == "__main__":
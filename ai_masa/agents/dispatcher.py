@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class TaskDropped(Exception):
+    """submit_tracked() のタスクが実行されずに破棄された"""
+    pass
+
+
+class MessageDispatcher:
+    """
+    メッセージ受信とLLM実行を切り離すための、上限付きキューとワーカープール。
+
+    受信スレッドは submit() でタスクを積むだけで戻り、重い処理 (think_and_respond) は
+    ワーカースレッドで実行される。
+
+    submit_keyed() で同じキー (job_id) を指定したタスクは投入順に1つずつ実行され、
+    異なるキーのタスクは別々のワーカーで並列に実行される。キーごとに待ち行列を持ち、
+    空いたワーカーは「実行中でないキー」の先頭タスクを取るため、特定のジョブが
+    長引いても他のジョブは待たされない。
+
+    未処理タスクの総数が max_pending に達したときの挙動は overflow で指定する。
+      - "block":       空きが出るまで呼び出し元を待たせる (バックプレッシャー)。
+                       block_timeout 秒を超えた場合はそのタスクを破棄する。呼び出し元は Redis の
+                       受信スレッドなので、None (無期限) にするとワーカーが詰まったときに受信が止まる。
+      - "drop_newest": 新しく届いたタスクを破棄する。
+      - "drop_oldest": 最も古い未処理タスクを破棄して、新しいタスクを積む。
+
+    submit_tracked() はタスクの完了を表す Future を返す (破棄された場合は TaskDropped で終わる)。
+    RedisStreamBroker はこれを使い、思考処理が終わってからメッセージを ACK する。
+    """
+    OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+    def __init__(self, name, workers=1, max_pending=100, overflow="block", block_timeout=30.0):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow!r} (expected one of {self.OVERFLOW_POLICIES})")
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self._queues = {}       # { key: deque([task, ...]) } 未処理タスクがあるキーのみ
+        self._ready = deque()   # 実行待ちで、かつ実行中でないキー
+        self._active = set()    # ワーカーが実行中のキー
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = []
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0, "max_pending": 0}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def pending(self):
+        with self._cond:
+            return self._pending
+
+    def has_pending(self, key):
+        """キーのタスクが待機中または実行中かどうか"""
+        with self._cond:
+            return key in self._queues or key in self._active
+
+    def submit(self, fn, *args, **kwargs):
+        """順序の制約がないタスクを積む。破棄された場合は False を返す。"""
+        return self.submit_keyed(object(), fn, *args, **kwargs)
+
+    def submit_keyed(self, key, fn, *args, **kwargs):
+        """キーごとに順序を保って実行するタスクを積む。破棄された場合は False を返す。"""
+        return self._submit(key, (fn, args, kwargs, None))
+
+    def submit_tracked(self, key, fn, *args, **kwargs):
+        """
+        submit_keyed() と同じくタスクを積み、タスクの完了 (fn の戻り値または例外) を表す Future を返す。
+        実行されずに破棄された場合、Future は TaskDropped で終わる。
+        """
+        future = Future()
+        self._submit(key, (fn, args, kwargs, future))
+        return future
+
+    def _submit(self, key, task):
+        future = task[3]
+        dropped = []
+        with self._cond:
+            if self._stopped:
+                dropped.append(future)
+                accepted = False
+            elif self._pending >= self.max_pending and not self._make_room(dropped):
+                self.stats["dropped"] += 1
+                waited = f" after waiting {self.block_timeout}s" if self.overflow == "block" and not self._stopped else ""
+                print(f"[{self.name}] ⚠️ Inbound queue full ({self.max_pending}). Dropped new task{waited}.")
+                dropped.append(future)
+                accepted = False
+            else:
+                self._enqueue(key, task)
+                accepted = True
+        # Future のコールバック (ACKなど) はロックを持たずに呼ぶ
+        self._resolve_dropped(dropped)
+        return accepted
+
+    @staticmethod
+    def _resolve_dropped(futures):
+        for future in futures:
+            if future is not None:
+                future.set_exception(TaskDropped("task was dropped before it ran"))
+
+    def _enqueue(self, key, task):
+        """ロック保持中に呼ぶ"""
+        if key not in self._queues:
+            self._queues[key] = deque()
+            if key not in self._active:
+                self._ready.append(key)
+        self._queues[key].append(task)
+        self._pending += 1
+        self.stats["submitted"] += 1
+        self.stats["max_pending"] = max(self.stats["max_pending"], self._pending)
+        self._cond.notify_all()
+
+    def _make_room(self, dropped):
+        """
+        キューに空きを作る。作れなかった場合は False を返す (ロック保持中に呼ぶ)。
+        破棄したタスクの Future は dropped に加える。
+        """
+        if self.overflow == "drop_oldest":
+            # 最も長く待っているキーの先頭タスクを捨てる
+            if self._ready:
+                key = self._ready[0]
+                dropped.append(self._pop_task(key)[3])
+                if key not in self._queues:
+                    self._ready.popleft()
+            else:
+                # 待ちタスクは全て実行中のキーのもの
+                dropped.append(self._pop_task(next(iter(self._queues)))[3])
+            self.stats["dropped"] += 1
+            print(f"[{self.name}] ⚠️ Inbound queue full ({self.max_pending}). Dropped oldest task.")
+            return True
+        if self.overflow == "block":
+            deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+            while self._pending >= self.max_pending and not self._stopped:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return not self._stopped
+        return False
+
+    def _pop_task(self, key):
+        """キーの先頭タスクを取り出す (ロック保持中に呼ぶ)"""
+        queue = self._queues[key]
+        task = queue.popleft()
+        if not queue:
+            del self._queues[key]
+        self._pending -= 1
+        return task
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                key = self._ready.popleft()
+                self._active.add(key)
+                fn, args, kwargs, future = self._pop_task(key)
+                # block中の submit() に空きができたことを知らせる
+                self._cond.notify_all()
+            try:
+                value = fn(*args, **kwargs)
+                result = "completed"
+            except Exception as e:
+                result = "failed"
+                print(f"[{self.name}] Error in worker: {e}")
+                if future is not None:
+                    future.set_exception(e)
+            else:
+                if future is not None:
+                    future.set_result(value)
+            with self._cond:
+                self.stats[result] += 1
+                self._active.discard(key)
+                # 同じキーの後続タスクがあれば、再び実行待ちに戻す
+                if key in self._queues:
+                    self._ready.append(key)
+                    self._cond.notify_all()
+
+    def stop(self, timeout=None):
+        """未処理のタスクを破棄してワーカーを停止する"""
+        with self._cond:
+            self._stopped = True
+            dropped = [task[3] for queue in self._queues.values() for task in queue]
+            self._queues.clear()
+            self._ready.clear()
+            self._pending = 0
+            self._cond.notify_all()
+        self._resolve_dropped(dropped)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        self._threads = []
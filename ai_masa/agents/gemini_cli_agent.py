@@ -1,17 +1,55 @@
+import os
+import re
 import sys
 import subprocess
 import shlex
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from .base_agent import BaseAgent
+from ..llm.session_pool import SessionPool
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス内のロックだけにする
+    fcntl = None
 
 class GeminiCliAgent(BaseAgent):
     """
     外部のGemini CLIコマンドをLLMとして利用するエージェント。
+
+    セッションの作成 (gemini --list-sessions でインデックスを決め、ロールプロンプトで初期化する) は
+    最大60秒かかるため、次のオプションで軽くできる。
+      - session_pool_size:  この数のセッションをバックグラウンドで作成・初期化しておき、新しいジョブはそこから受け取る
+      - session_idle_ttl:   この秒数使われなかったジョブのセッションを gemini --delete-session で削除する。
+                            削除するとそれ以降のインデックスがずれるため、--list-sessions の出力から
+                            UUID が分かったセッション (UUIDで --resume する) だけを削除する
+      - session_lock_path:  インデックスの決定と初期化の間だけ取る排他ロックのファイル。
+                            同じホストの複数のエージェントが同じインデックスを選ばないようにする
     """
-    def __init__(self, name="GeminiCliAgent", redis_host='localhost', user_lang='Japanese'):
+    LIST_SESSIONS_COMMAND = ["gemini", "--list-sessions"]
+    DELETE_SESSION_COMMAND = ["gemini", "--delete-session"]
+    # --list-sessions の各行 ("  3. <タイトル> (2 hours ago) [<UUID>]")
+    _SESSION_LINE_RE = re.compile(r"^\s*(\d+)[.)]\s")
+    _SESSION_UUID_RE = re.compile(r"\b([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\b", re.IGNORECASE)
+
+    def __init__(self, name="GeminiCliAgent", redis_host='localhost', user_lang='Japanese',
+                 session_pool_size=0, session_idle_ttl=None, session_lock_path=None, **kwargs):
         # BaseAgentのinvoke_llmで{session_id}が置換される
         llm_command = "gemini --resume {session_id} --output-format json"
         # _create_llm_sessionをオーバーライドするため、親クラスのsession_create_commandは使わない
         llm_session_create_command = ""
+        # gemini の呼び出しは数秒かかるため、受信スレッドとは別のワーカーで実行する
+        kwargs.setdefault("llm_workers", 1)
+        # --resume したセッションは以前のプロンプトを覚えているため、前回以降の差分だけを送る
+        kwargs.setdefault("delta_prompts", True)
+
+        self.session_idle_ttl = session_idle_ttl
+        self.session_lock_path = session_lock_path or os.path.join(tempfile.gettempdir(), "ai_masa_gemini_sessions.lock")
+        self._session_last_used = {}  # { llm_session_id: 最後に使った時刻 (time.monotonic()) }
+        self._session_lock = threading.Lock()
+        self._index_lock = threading.Lock()
 
         super().__init__(
             name=name,
@@ -19,55 +57,165 @@ class GeminiCliAgent(BaseAgent):
             user_lang=user_lang,
             redis_host=redis_host,
             llm_command=llm_command,
-            llm_session_create_command=llm_session_create_command
+            llm_session_create_command=llm_session_create_command,
+            **kwargs
         )
 
+        # role_prompt が決まってから事前の作成を始める
+        self.session_pool = None
+        if session_pool_size > 0 or session_idle_ttl is not None:
+            self.session_pool = SessionPool(
+                lambda: self._prime_new_session("pool"), size=session_pool_size,
+                maintenance=self.collect_idle_sessions if session_idle_ttl is not None else None,
+                maintenance_interval=max(1.0, session_idle_ttl / 2) if session_idle_ttl is not None else 60.0,
+                name=f"{self.name}-sessions"
+            ).start()
+
+    def shutdown(self):
+        super().shutdown()
+        if self.session_pool:
+            # 使われなかったセッションは残しておいても再利用されないため消す
+            for session_id in self.session_pool.stop():
+                self._delete_session(session_id, "pool")
+
     def _create_llm_session(self, job_id):
         """
-        新しいGemini CLIセッションを作成し、そのセッションインデックスを返す。
+        新しいGemini CLIセッションを作成し、そのセッションID (UUIDまたはインデックス) を返す。
+        事前に作成したセッションがあればそれを使う。
         """
-        session_index = 0
+        session_id = self.session_pool.take() if self.session_pool else None
+        if session_id is not None:
+            print(f"[{self.name}][{job_id}] Using pre-warmed session: {session_id}")
+        else:
+            session_id = self._prime_new_session(job_id)
+        if session_id is not None:
+            with self._session_lock:
+                self._session_last_used[session_id] = time.monotonic()
+        return session_id
+
+    def _prime_new_session(self, job_id):
+        """インデックスを決めて、ロールプロンプトでセッションを初期化する"""
+        # 他のエージェントと同じインデックスを選ばないよう、初期化が終わるまでロックを持つ
+        with self._session_index_lock():
+            lines = self._list_sessions(job_id)
+            if lines is None:
+                return None
+            session_index = self._next_session_index(lines)
+
+            # 新しいセッションを開始するために、role_promptを使って簡単なコマンドを実行する
+            try:
+                # self.role_prompt を初回プロンプトとして渡し、セッションを初期化
+                # 新しいセッションインデックスを使って初期化
+                init_command = f"gemini --resume {session_index} {shlex.quote(self.role_prompt)}"
+                subprocess.run(
+                    init_command, shell=True, check=True,
+                    capture_output=True, text=True, timeout=60
+                )
+            except subprocess.CalledProcessError as e:
+                 # A one-shot command might return non-zero if it doesn't produce a "final answer"
+                 # in the expected format, but it still creates the session. So we log and continue.
+                print(f"[{self.name}][{job_id}] Info: Initial gemini command finished with code {e.returncode}. This might be expected for a one-shot prompt that is just a role description. Stderr: {e.stderr}")
+            except subprocess.TimeoutExpired:
+                print(f"[{self.name}][{job_id}] Warning: Initial gemini command timed out. A session may not have been created.")
+                return None
+            except FileNotFoundError:
+                print(f"[{self.name}][{job_id}] Error: 'gemini' command not found.")
+                return None
+
+            # インデックスは他のセッションが削除されるとずれるため、分かればUUIDを使う
+            session_id = self._session_uuid(self._list_sessions(job_id) or [], session_index) or str(session_index)
+        print(f"[{self.name}][{job_id}] New session will use: {session_id}")
+        return session_id
+
+    def _list_sessions(self, job_id):
+        """gemini --list-sessions の出力を行のリストで返す。gemini がなければ None"""
         try:
-            # 既存のセッション数を数える
-            result = subprocess.run(
-                "gemini --list-sessions",
-                shell=True, capture_output=True, text=True, check=False
-            )
-            stdout = result.stdout.strip()
-            # "No sessions found." が返ってくる場合も考慮
-            if stdout and "No sessions found" not in stdout:
-                session_index = len(stdout.split('\n')) + 1 # 1-based index
-            else:
-                session_index = 1 # 最初のセッションはインデックス1から始まる
+            result = subprocess.run(self.LIST_SESSIONS_COMMAND, capture_output=True, text=True, check=False)
         except FileNotFoundError:
             print(f"[{self.name}][{job_id}] Error: 'gemini' command not found.")
             return None
         except Exception as e:
             print(f"[{self.name}][{job_id}] Error counting sessions: {e}. Assuming 1 as starting index.")
-            session_index = 1
+            return []
+        stdout = result.stdout.strip()
+        # "No sessions found." が返ってくる場合も考慮
+        if not stdout or "No sessions found" in stdout:
+            return []
+        return stdout.split('\n')
 
-        # 新しいセッションを開始するために、role_promptを使って簡単なコマンドを実行する
-        try:
-            # self.role_prompt を初回プロンプトとして渡し、セッションを初期化
-            # 新しいセッションインデックスを使って初期化
-            init_command = f"gemini --resume {session_index} {shlex.quote(self.role_prompt)}"
-            subprocess.run(
-                init_command, shell=True, check=True,
-                capture_output=True, text=True, timeout=60
-            )
-        except subprocess.CalledProcessError as e:
-             # A one-shot command might return non-zero if it doesn't produce a "final answer"
-             # in the expected format, but it still creates the session. So we log and continue.
-            print(f"[{self.name}][{job_id}] Info: Initial gemini command finished with code {e.returncode}. This might be expected for a one-shot prompt that is just a role description. Stderr: {e.stderr}")
-        except subprocess.TimeoutExpired:
-            print(f"[{self.name}][{job_id}] Warning: Initial gemini command timed out. A session may not have been created.")
-            return None
-        except FileNotFoundError:
-            print(f"[{self.name}][{job_id}] Error: 'gemini' command not found.")
-            return None
+    def _next_session_index(self, lines):
+        numbers = [int(m.group(1)) for m in map(self._SESSION_LINE_RE.match, lines) if m]
+        if numbers:
+            return max(numbers) + 1
+        if lines:
+            return len(lines) + 1 # 1-based index
+        return 1 # 最初のセッションはインデックス1から始まる
+
+    def _session_uuid(self, lines, session_index):
+        for line in lines:
+            match = self._SESSION_LINE_RE.match(line)
+            if match and int(match.group(1)) == session_index:
+                uuid_match = self._SESSION_UUID_RE.search(line)
+                return uuid_match.group(1) if uuid_match else None
+        return None
+
+    @contextmanager
+    def _session_index_lock(self):
+        if fcntl is None:
+            with self._index_lock:
+                yield
+            return
+        with open(self.session_lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _call_llm(self, prompt, llm_session_id, job_id=None):
+        with self._session_lock:
+            self._session_last_used[llm_session_id] = time.monotonic()
+        return super()._call_llm(prompt, llm_session_id, job_id)
+
+    def collect_idle_sessions(self):
+        """session_idle_ttl 秒使われなかったジョブのセッションを削除し、削除した数を返す"""
+        if self.session_idle_ttl is None:
+            return 0
+        deadline = time.monotonic() - self.session_idle_ttl
+        with self._session_lock:
+            idle = {sid for sid, used in self._session_last_used.items() if used < deadline}
+        if not idle:
+            return 0
+        # レジストリはファイルや Redis を読み書きするため、_state_lock を持たずに触る
+        idle_jobs = [job_id for job_id in list(self.job_sessions) if self.job_sessions.get(job_id) in idle]
+        for job_id in idle_jobs:
+            self.job_sessions.pop(job_id, None)
+        deleted = 0
+        for session_id in idle:
+            with self._session_lock:
+                self._session_last_used.pop(session_id, None)
+            if self._delete_session(session_id, "gc"):
+                deleted += 1
+        if idle_jobs:
+            print(f"[{self.name}] Released {len(idle_jobs)} idle sessions ({deleted} deleted).")
+        return deleted
 
-        print(f"[{self.name}][{job_id}] New session will use index: {session_index}")
-        return str(session_index)
+    def _delete_session(self, session_id, label):
+        if not self._SESSION_UUID_RE.fullmatch(str(session_id)):
+            # インデックスで削除すると他のセッションのインデックスがずれるため、残しておく
+            return False
+        with self._session_index_lock():
+            try:
+                result = subprocess.run(
+                    self.DELETE_SESSION_COMMAND + [session_id], capture_output=True, text=True, check=False, timeout=30
+                )
+            except (FileNotFoundError, subprocess.TimeoutExpired) as e:
+                print(f"[{self.name}][{label}] Error deleting session {session_id}: {e}")
+                return False
+        if result.returncode != 0:
+            print(f"[{self.name}][{label}] Error deleting session {session_id}: {result.stderr.strip()}")
+            return False
+        return True
 
 
 if __name__ == "__main__":
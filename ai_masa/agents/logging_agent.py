@@ -4,15 +4,22 @@ import threading
 from datetime import datetime
 from ..models.message import Message
 from .base_agent import BaseAgent
+from ..context.archive import RedisHistoryArchive
 
 class LoggingAgent(BaseAgent):
-    def __init__(self, name="Logger", description="An agent that logs all messages.", **kwargs):
+    # 全ての通信を記録するため、firehoseを購読する
+    subscribe_firehose = True
+
+    def __init__(self, name="Logger", description="An agent that logs all messages.", archive=None, **kwargs):
+        # archive (RedisHistoryArchive など) を渡すと、ログに出したメッセージをジョブごとに保存する。
+        # record_policy='participating' のエージェントは、参加前の履歴をここから読み込める
+        self.archive = archive
         # LoggingAgentはハートビート不要のためFalseに設定
         super().__init__(name, description, start_heartbeat=False, **kwargs)
 
     def _on_message_received(self, message_json):
         try:
-            msg = Message.from_json(message_json)
+            msg = Message.from_payload(message_json)
             # 自分のメッセージは無視 (ハートビートなど)
             if msg.from_agent == self.name:
                 return
@@ -25,6 +32,8 @@ class LoggingAgent(BaseAgent):
                 return
                 
             print(f"[{timestamp}][{msg.job_id}] {msg.from_agent} -> {msg.to_agent}{cc_info}: {msg.content}")
+            if self.archive is not None:
+                self.archive.append(msg)
 
         except Exception as e:
             print(f"[{self.name}] Error in _on_message_received: {e}")
@@ -35,11 +44,13 @@ class LoggingAgent(BaseAgent):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python -m ai_masa.agents.logging_agent <AgentName>")
+        print("Usage: python -m ai_masa.agents.logging_agent <AgentName> [--archive]")
         sys.exit(1)
 
     agent_name = sys.argv[1]
-    agent = LoggingAgent(name=agent_name)
+    # --archive を付けると、ジョブごとの履歴を Redis に保存する
+    archive = RedisHistoryArchive() if "--archive" in sys.argv[2:] else None
+    agent = LoggingAgent(name=agent_name, archive=archive)
 
     def signal_handler(sig, frame):
         print(f"[{agent_name}] Shutdown signal received. Stopping...")
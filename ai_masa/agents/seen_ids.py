@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+# message_id を自動生成していなかった頃の既定値。全メッセージで同じ値なので重複判定に使わない
+LEGACY_MESSAGE_ID = "message_id_value"
+
+class SeenIdCache:
+    """
+    受信済みの message_id を覚えておき、再配送されたメッセージを見分けるためのキャッシュ。
+
+    保持する件数 (max_size) と期間 (ttl 秒) の両方で上限を設け、古いものから捨てる。
+    再接続や at-least-once のブローカー、リプレイで同じメッセージが再び届いても、
+    ttl 以内であれば二度目の LLM 呼び出しを行わずに済む。
+    """
+    def __init__(self, max_size=10000, ttl=600.0, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._seen = OrderedDict()  # { message_id: 最初に受信した時刻 } 古い順
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "duplicates": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self._seen)
+
+    def check(self, message_id):
+        """
+        message_id を記録し、既に受信済みであれば True を返す。
+        ID のないメッセージや従来の既定値の ID は常に False (重複とみなさない)。
+        """
+        if not message_id or message_id == LEGACY_MESSAGE_ID:
+            return False
+        now = self._clock()
+        with self._lock:
+            self.stats["checked"] += 1
+            self._expire(now)
+            if message_id in self._seen:
+                self.stats["duplicates"] += 1
+                return True
+            self._seen[message_id] = now
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+                self.stats["evicted"] += 1
+            return False
+
+    def forget(self, message_id):
+        """記録した message_id を消す (処理に失敗し、再配送されたときに処理し直すため)"""
+        with self._lock:
+            self._seen.pop(message_id, None)
+
+    def _expire(self, now):
+        if self.ttl is None:
+            return
+        deadline = now - self.ttl
+        seen = self._seen
+        while seen:
+            oldest = next(iter(seen.values()))
+            if oldest > deadline:
+                break
+            seen.popitem(last=False)
+            self.stats["evicted"] += 1
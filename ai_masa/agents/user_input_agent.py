@@ -9,7 +9,7 @@ class UserInputAgent(BaseAgent):
     ユーザーからのコンソール入力を受け付け、他のエージェントにメッセージを送信するエージェント。
     LLMは使用しない。
     """
-    def __init__(self, name="UserInputAgent", redis_host='localhost', default_target_agent="GeminiCliAgent"):
+    def __init__(self, name="UserInputAgent", redis_host='localhost', default_target_agent="GeminiCliAgent", **kwargs):
         # LLM関連のコマンドは不要なため、親クラスの初期化時にダミー値を渡す
         super().__init__(
             name=name,
@@ -17,7 +17,8 @@ class UserInputAgent(BaseAgent):
             redis_host=redis_host,
             llm_command="",
             llm_session_create_command="",
-            start_heartbeat=False
+            start_heartbeat=False,
+            **kwargs
         )
         self.default_target_agent = default_target_agent
         self.shutdown_event = threading.Event()
@@ -32,7 +33,7 @@ class UserInputAgent(BaseAgent):
     def _on_message_received(self, message_json):
         # 自分宛のメッセージやCCはコンソールに表示するだけ
         try:
-            msg = Message.from_json(message_json)
+            msg = Message.from_payload(message_json)
             if msg.from_agent == self.name:
                 return # 自分が送信したメッセージは無視
 
@@ -113,7 +114,7 @@ class UserInputAgent(BaseAgent):
         Redisからのメッセージを継続的に監視する。
         """
         print(f"[{self.name}] Listening for responses on Redis...")
-        self.broker.subscribe(self._on_message_received, self.shutdown_event)
+        self.broker.subscribe(self._on_message_received, self.shutdown_event, agent_name=self.name)
 
 
 if __name__ == "__main__":
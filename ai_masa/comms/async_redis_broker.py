@@ -0,0 +1,75 @@
+import inspect
+import redis
+import redis.asyncio as aioredis
+from .broker_base import AsyncMessageBroker, ChannelRouting
+from ..models.codec import decode_legacy_or_tagged
+
+class AsyncRedisBroker(ChannelRouting, AsyncMessageBroker):
+    """
+    redis.asyncio を利用した Redis Pub/Sub ブローカー。
+    チャネルの決め方 (routing) は RedisBroker と同じ。
+    送信は従来形式のJSONで、受信は codec=None の RedisBroker と同じく、コーデックで送られたタグ付きの
+    データも Message にしてコールバックに渡す。
+    """
+
+    def __init__(self, host='localhost', port=6379, channel='ai_masa_channel',
+                 block_timeout=0.1, routing="global"):
+        if routing not in self.ROUTING_MODES:
+            raise ValueError(f"Unknown routing: {routing!r} (expected one of {self.ROUTING_MODES})")
+        self.host = host
+        self.port = port
+        self.channel = channel
+        self.routing = routing
+        # shutdown_event の確認間隔
+        self.block_timeout = block_timeout
+        self.client = None
+        self.pubsub = None
+
+    async def connect(self):
+        # コーデックを使うエージェントのバイナリ形式も受け取れるよう bytes のまま受け取る
+        self.client = aioredis.Redis(host=self.host, port=self.port, decode_responses=False)
+        try:
+            await self.client.ping()
+            print(f"[AsyncRedisBroker] Connected to {self.host}:{self.port}")
+        except redis.ConnectionError:
+            print(f"[AsyncRedisBroker] 🔴 Connection Failed. Is Redis running?")
+            raise
+
+    async def publish(self, message_json: str, recipients=None):
+        if self.client:
+            for channel in self._publish_channels(message_json, recipients):
+                await self.client.publish(channel, message_json)
+
+    async def subscribe(self, callback, shutdown_event=None, agent_name=None, firehose=False):
+        if not self.client:
+            raise ConnectionError("Broker not connected")
+
+        channels = self._subscribe_channels(agent_name, firehose)
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(*channels)
+
+        print(f"[AsyncRedisBroker] Subscribed to channel: {', '.join(channels)}")
+
+        while not (shutdown_event and shutdown_event.is_set()):
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=self.block_timeout)
+            while message is not None:
+                if message['type'] == 'message':
+                    try:
+                        payload = decode_legacy_or_tagged(message['data'])
+                    except ValueError as e:
+                        print(f"[AsyncRedisBroker] Dropping undecodable message: {e}")
+                        payload = None
+                    if payload is not None:
+                        result = callback(payload)
+                        if inspect.isawaitable(result):
+                            await result
+                # 既に届いている分だけを取り出す
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=0.0)
+
+    async def disconnect(self):
+        if self.pubsub:
+            await self.pubsub.unsubscribe()
+            await self.pubsub.aclose()
+        if self.client:
+            await self.client.aclose()
+        print(f"[AsyncRedisBroker] Disconnected from {self.host}:{self.port}")
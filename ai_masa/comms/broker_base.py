@@ -1,12 +1,78 @@
+import json
 from abc import ABC, abstractmethod
 
 class MessageBroker(ABC):
+    # True のブローカーには BaseAgent が Message オブジェクトをそのまま publish し、
+    # subscribe のコールバックにも Message を渡す。False の場合は JSON 文字列でやり取りする
+    passes_messages = False
+
     @abstractmethod
     def connect(self):
         pass
     @abstractmethod
-    def publish(self, message_json: str):
+    def publish(self, message_json: str, recipients=None):
+        pass
+    @abstractmethod
+    def subscribe(self, callback, shutdown_event=None, agent_name=None, firehose=False):
+        pass
+    def publish_many(self, messages):
+        """
+        複数のメッセージをまとめて送信する。
+        messages は message_json の文字列、または (message_json, recipients) のリスト。
+        """
+        for message in messages:
+            message_json, recipients = message if isinstance(message, tuple) else (message, None)
+            self.publish(message_json, recipients=recipients)
+
+class AsyncMessageBroker(ABC):
+    """asyncio 用のブローカー。subscribe のコールバックは同期関数でもコルーチン関数でもよい。"""
+    @abstractmethod
+    async def connect(self):
+        pass
+    @abstractmethod
+    async def publish(self, message_json: str, recipients=None):
         pass
     @abstractmethod
-    def subscribe(self, callback):
+    async def subscribe(self, callback, shutdown_event=None, agent_name=None, firehose=False):
         pass
+    @abstractmethod
+    async def disconnect(self):
+        pass
+
+class ChannelRouting:
+    """
+    Pub/Sub 系ブローカー共通のチャネル決定ロジック。
+    self.channel (ベース名) と self.routing ("global" / "addressed") を使う。
+    """
+    ROUTING_MODES = ("global", "addressed")
+
+    def inbox_channel(self, agent_name):
+        return f"{self.channel}:inbox:{agent_name}"
+
+    @property
+    def firehose_channel(self):
+        return f"{self.channel}:firehose"
+
+    def _publish_channels(self, message_json, recipients):
+        """メッセージの配送先チャネルを決める"""
+        if self.routing == "global":
+            return [self.channel]
+        if recipients is None:
+            # 宛先が渡されなかった場合はメッセージ本体から読み取る
+            if isinstance(message_json, (str, bytes)):
+                data = json.loads(message_json)
+                recipients = [data.get("to_agent")] + list(data.get("cc_agents") or [])
+            else:
+                recipients = [message_json.to_agent, *(message_json.cc_agents or [])]
+        # 重複を除きつつ順序を保つ
+        channels = dict.fromkeys(self.inbox_channel(name) for name in recipients if name)
+        return [*channels, self.firehose_channel]
+
+    def _subscribe_channels(self, agent_name, firehose):
+        if self.routing == "global":
+            return [self.channel]
+        if firehose:
+            return [self.firehose_channel]
+        if not agent_name:
+            raise ValueError("agent_name is required to subscribe in 'addressed' routing mode")
+        return [self.inbox_channel(agent_name)]
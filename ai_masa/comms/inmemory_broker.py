@@ -0,0 +1,101 @@
+import queue
+import threading
+from .broker_base import MessageBroker, ChannelRouting
+
+class InMemoryHub:
+    """
+    同一プロセス内の InMemoryBroker 同士でチャネルを共有するためのハブ。
+    購読者ごとに queue.SimpleQueue (C実装でPython側のロックを持たない) を持ち、
+    publish はそのキューに参照を積むだけなので、シリアライズもネットワークも介さない。
+    """
+    def __init__(self):
+        self._subscribers = {}  # { channel: (queue, ...) }
+        self._lock = threading.Lock()  # 購読者の追加・削除のときだけ使う
+
+    def attach(self, channel, inbox):
+        with self._lock:
+            self._subscribers[channel] = self._subscribers.get(channel, ()) + (inbox,)
+
+    def detach(self, channel, inbox):
+        with self._lock:
+            remaining = tuple(q for q in self._subscribers.get(channel, ()) if q is not inbox)
+            if remaining:
+                self._subscribers[channel] = remaining
+            else:
+                self._subscribers.pop(channel, None)
+
+    def subscriber_count(self, channel):
+        return len(self._subscribers.get(channel, ()))
+
+    def deliver(self, channel, payload):
+        # 購読者リストは不変のタプルとして差し替えるため、読み取りにロックは不要
+        for inbox in self._subscribers.get(channel, ()):
+            inbox.put(payload)
+
+# hub を指定しない InMemoryBroker はこのハブを共有する
+DEFAULT_HUB = InMemoryHub()
+
+class InMemoryBroker(ChannelRouting, MessageBroker):
+    """
+    単一プロセス内でエージェント同士をつなぐブローカー。
+    RedisBroker と同じ Pub/Sub の意味論 (routing も含む) を持つ。
+
+    passes_messages = True のため、BaseAgent は Message オブジェクトをそのまま publish し、
+    受信側も同じオブジェクトを受け取る (受信側は Message を読み取り専用として扱うこと)。
+    """
+    passes_messages = True
+
+    def __init__(self, hub=None, channel='ai_masa_channel', routing="global", block_timeout=0.1):
+        if routing not in self.ROUTING_MODES:
+            raise ValueError(f"Unknown routing: {routing!r} (expected one of {self.ROUTING_MODES})")
+        self.hub = hub if hub is not None else DEFAULT_HUB
+        self.channel = channel
+        self.routing = routing
+        # shutdown_event の確認間隔
+        self.block_timeout = block_timeout
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+        print(f"[InMemoryBroker] Connected (in-process)")
+
+    def publish(self, message, recipients=None):
+        if not self.connected:
+            return
+        if not isinstance(message, str):
+            # 受信側で同じオブジェクトを共有するため、ID (遅延生成) を先に確定させておく
+            message.message_id
+        for channel in self._publish_channels(message, recipients):
+            self.hub.deliver(channel, message)
+
+    def subscribe(self, callback, shutdown_event=None, agent_name=None, firehose=False):
+        if not self.connected:
+            raise ConnectionError("Broker not connected")
+
+        channels = self._subscribe_channels(agent_name, firehose)
+        inbox = queue.SimpleQueue()
+        for channel in channels:
+            self.hub.attach(channel, inbox)
+        print(f"[InMemoryBroker] Subscribed to channel: {', '.join(channels)}")
+
+        try:
+            while not (shutdown_event and shutdown_event.is_set()):
+                try:
+                    payload = inbox.get(timeout=self.block_timeout)
+                except queue.Empty:
+                    continue
+                callback(payload)
+                # 溜まっている分は待たずに処理する
+                while not (shutdown_event and shutdown_event.is_set()):
+                    try:
+                        payload = inbox.get_nowait()
+                    except queue.Empty:
+                        break
+                    callback(payload)
+        finally:
+            for channel in channels:
+                self.hub.detach(channel, inbox)
+
+    def disconnect(self):
+        self.connected = False
+        print(f"[InMemoryBroker] Disconnected")
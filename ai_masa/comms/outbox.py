@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import deque
+
+class PublishOutbox:
+    """
+    publish をバックグラウンドでまとめて送信するための送信箱。
+
+    put() で積まれたメッセージは、max_batch 件たまるか、最も古いメッセージが
+    max_delay 秒待つかのどちらか早い方でまとめて flush_fn(items) に渡される。
+    flush_fn はブローカー側でパイプラインを使って1往復で送信する。
+
+    フラッシュごとに件数・最古メッセージの待ち時間・送信時間を stats に記録し、
+    on_flush(batch_size, waited, duration) が指定されていれば呼び出す。
+
+    flush_fn が失敗した場合、そのバッチは先頭に戻し、retry_interval 秒から
+    max_retry_interval 秒まで倍々に間隔を空けて送り直す。
+    未送信のメッセージ (送信中のバッチを含む) が max_pending 件に達したときの挙動は
+    MessageDispatcher と同じく overflow で指定する。
+      - "drop_oldest": 最も古い未送信メッセージを破棄して、新しいメッセージを積む (デフォルト)。
+      - "drop_newest": 新しいメッセージを破棄する。
+      - "block":       空きが出るまで put() を待たせ、block_timeout 秒を超えたら破棄する。
+    デフォルトが drop_oldest なのは、put() は思考処理や受信スレッドから呼ばれるため、
+    Redis が止まっている間に呼び出し元まで止めないようにするため。
+    """
+    OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+    def __init__(self, flush_fn, max_batch=100, max_delay=0.005, on_flush=None, name="Outbox",
+                 max_pending=10000, overflow="drop_oldest", block_timeout=30.0,
+                 retry_interval=0.1, max_retry_interval=5.0):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow!r} (expected one of {self.OVERFLOW_POLICIES})")
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.on_flush = on_flush
+        self.name = name
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+
+        self._items = deque()   # (enqueued_at, item)
+        self._in_flight = 0     # flush_fn に渡している件数 (失敗したら _items に戻る)
+        self._retry_at = 0.0    # 送信に失敗した後、次に送り直す時刻 (time.monotonic())
+        self._retry_delay = 0.0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+        self.stats = {
+            "flushes": 0, "messages": 0, "errors": 0, "retried": 0, "dropped": 0,
+            "last_wait": 0.0, "max_wait": 0.0, "total_wait": 0.0,
+            "last_flush_time": 0.0, "max_batch_seen": 0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-outbox", daemon=True)
+        self._thread.start()
+        return self
+
+    def pending(self):
+        with self._cond:
+            return len(self._items) + self._in_flight
+
+    def put(self, item):
+        """メッセージを積む。破棄された場合は False を返す"""
+        with self._cond:
+            if len(self._items) + self._in_flight >= self.max_pending and not self._make_room():
+                self.stats["dropped"] += 1
+                print(f"[{self.name}] ⚠️ Outbox full ({self.max_pending}). Dropped new message.")
+                return False
+            self._items.append((time.monotonic(), item))
+            # バッチが埋まったか、待機中の送信スレッドに締め切りを知らせる
+            if len(self._items) >= self.max_batch or len(self._items) == 1:
+                self._cond.notify_all()
+            return True
+
+    def _make_room(self):
+        """空きを作る。作れなかった場合は False を返す (ロック保持中に呼ぶ)"""
+        if self.overflow == "drop_oldest":
+            if not self._items:
+                # 未送信の分は全て送信中
+                return False
+            self._items.popleft()
+            self.stats["dropped"] += 1
+            print(f"[{self.name}] ⚠️ Outbox full ({self.max_pending}). Dropped oldest message.")
+            return True
+        if self.overflow == "block":
+            deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+            while len(self._items) + self._in_flight >= self.max_pending and not self._stopped:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return not self._stopped
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                # 送信に失敗した後は、送り直す時刻まで待つ
+                while time.monotonic() < self._retry_at and not self._stopped:
+                    self._cond.wait(self._retry_at - time.monotonic())
+                if self._stopped:
+                    return
+                # 最古のメッセージの締め切りまで、バッチが埋まるのを待つ
+                deadline = self._items[0][0] + self.max_delay
+                while len(self._items) < self.max_batch and not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self.flush()
+
+    def flush(self):
+        """たまっている分を今すぐ送信する。失敗した場合はバッチを先頭に戻して False を返す"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._items:
+                    return True
+                batch = [self._items.popleft() for _ in range(min(self.max_batch, len(self._items)))]
+                self._in_flight = len(batch)
+            started = time.monotonic()
+            waited = started - batch[0][0]
+            try:
+                self.flush_fn([item for _, item in batch])
+            except Exception as e:
+                with self._cond:
+                    # 順番を保つよう先頭に戻し、間隔を空けて送り直す
+                    self._items.extendleft(reversed(batch))
+                    self._in_flight = 0
+                    self._retry_delay = min(self.max_retry_interval, max(self.retry_interval, self._retry_delay * 2))
+                    self._retry_at = time.monotonic() + self._retry_delay
+                    self.stats["errors"] += 1
+                    self.stats["retried"] += len(batch)
+                print(f"[{self.name}] Error flushing {len(batch)} messages: {e}. Retrying in {self._retry_delay:.2f}s.")
+                return False
+            with self._cond:
+                self._in_flight = 0
+                self._retry_delay = 0.0
+                self._retry_at = 0.0
+                # block 中の put() に空きができたことを知らせる
+                self._cond.notify_all()
+            duration = time.monotonic() - started
+            self._record(len(batch), waited, duration)
+            return True
+
+    def _record(self, size, waited, duration):
+        stats = self.stats
+        stats["flushes"] += 1
+        stats["messages"] += size
+        stats["last_wait"] = waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+        stats["total_wait"] += waited
+        stats["last_flush_time"] = duration
+        stats["max_batch_seen"] = max(stats["max_batch_seen"], size)
+        if self.on_flush:
+            self.on_flush(size, waited, duration)
+
+    def stop(self):
+        """送信スレッドを止め、残りを全て送信する"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        while self._items:
+            if not self.flush():
+                print(f"[{self.name}] ⚠️ Discarding {len(self._items)} unsent messages on stop.")
+                break
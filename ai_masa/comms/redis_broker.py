@@ -1,38 +1,161 @@
 import redis
 import time
-from .broker_base import MessageBroker
+from .broker_base import MessageBroker, ChannelRouting
+from .outbox import PublishOutbox
+from ..models.codec import decode_legacy_or_tagged, get_codec
 
-class RedisBroker(MessageBroker):
-    def __init__(self, host='localhost', port=6379, channel='ai_masa_channel'):
+class RedisBroker(ChannelRouting, MessageBroker):
+    """
+    Redis Pub/Sub を利用したメッセージブローカー。
+
+    receive_mode:
+      - "event": ソケットが読み取り可能になるまでブロックし、起床ごとに
+                 受信済みのメッセージをすべて取り出す (デフォルト)。
+      - "poll":  従来のポーリングループ (get_message + sleep(0.01))。
+                 ベンチマークでの比較用に残している。
+
+    routing:
+      - "global":    全メッセージを単一の channel に流す (従来の挙動)。
+      - "addressed": to_agent / cc_agents ごとの受信箱チャネル
+                     (<channel>:inbox:<name>) に配送する。全トラフィックが必要な
+                     エージェントは firehose チャネル (<channel>:firehose) を購読する。
+
+    outbox=True の場合、publish() は送信箱に積むだけで戻り、バックグラウンドスレッドが
+    outbox_max_batch 件ごと、または outbox_max_delay 秒ごとにパイプラインでまとめて送信する。
+    フラッシュごとの待ち時間は outbox.stats / on_flush で確認できる。送信に失敗したバッチは送り直し、
+    未送信が outbox_max_pending 件に達したら outbox_overflow に従って破棄する (PublishOutbox を参照)。
+
+    codec ("json" / "fastjson" / "binary" / "envelope" または MessageCodec) を指定した場合、
+    Message をそのコーデックでバイト列にして送り、受信したデータは Message に戻して
+    コールバックに渡す (passes_messages = True)。送信データには形式を表すタグが付く。
+    codec=None (デフォルト) の場合は従来どおりJSON文字列を送り、受信した従来形式のJSONは
+    文字列のまま渡す。他のエージェントがコーデックで送ったタグ付きのデータも Message にして渡すため、
+    エージェントを1つずつコーデックに切り替えても、まだ切り替えていないエージェントは読み続けられる。
+    compress_threshold (バイト) を指定すると、それ以上の content を圧縮して送る (codec が必要)。
+    """
+    RECEIVE_MODES = ("event", "poll")
+
+    def __init__(self, host='localhost', port=6379, channel='ai_masa_channel',
+                 receive_mode="event", block_timeout=0.1, routing="global",
+                 outbox=False, outbox_max_batch=100, outbox_max_delay=0.005, on_flush=None,
+                 outbox_max_pending=10000, outbox_overflow="drop_oldest",
+                 codec=None, compress_threshold=None):
+        if receive_mode not in self.RECEIVE_MODES:
+            raise ValueError(f"Unknown receive_mode: {receive_mode!r} (expected one of {self.RECEIVE_MODES})")
+        if routing not in self.ROUTING_MODES:
+            raise ValueError(f"Unknown routing: {routing!r} (expected one of {self.ROUTING_MODES})")
         self.host = host
         self.port = port
         self.channel = channel
+        self.receive_mode = receive_mode
+        self.routing = routing
+        # shutdown_event の確認間隔を兼ねるため、短めの値にしておく
+        self.block_timeout = block_timeout
         self.client = None
         self.pubsub = None
+        if compress_threshold is not None and codec is None:
+            raise ValueError("compress_threshold requires a codec")
+        self.codec = get_codec(codec, compress_threshold=compress_threshold) if codec is not None else None
+        self.passes_messages = self.codec is not None
+        self.outbox = None
+        if outbox:
+            self.outbox = PublishOutbox(
+                self._send_batch, max_batch=outbox_max_batch, max_delay=outbox_max_delay,
+                on_flush=on_flush, name="RedisBroker", max_pending=outbox_max_pending, overflow=outbox_overflow
+            )
 
     def connect(self):
-        # decode_responses=True にすることで、bytesではなくstrで受け取る
-        self.client = redis.Redis(host=self.host, port=self.port, decode_responses=True)
+        # コーデックを使わない場合も、他のエージェントが送ったバイナリ形式を受け取れるよう bytes のまま受け取る
+        # (redis-py に UTF-8 として解釈させると、バイナリ形式のデータで受信ループが止まる)
+        self.client = redis.Redis(host=self.host, port=self.port, decode_responses=False)
         try:
             self.client.ping()
             print(f"[RedisBroker] Connected to {self.host}:{self.port}")
         except redis.ConnectionError:
             print(f"[RedisBroker] 🔴 Connection Failed. Is Redis running?")
             raise
+        if self.outbox:
+            self.outbox.start()
 
-    def publish(self, message_json: str):
-        if self.client:
-            self.client.publish(self.channel, message_json)
+    def publish(self, message_json: str, recipients=None):
+        if not self.client:
+            return
+        data, channels = self._prepare(message_json, recipients)
+        if self.outbox:
+            self.outbox.put((data, channels))
+            return
+        for channel in channels:
+            self.client.publish(channel, data)
 
-    def subscribe(self, callback, shutdown_event=None):
+    def publish_many(self, messages):
+        """
+        複数のメッセージを1回のパイプライン (1往復) で送信する。
+        messages は message_json の文字列、または (message_json, recipients) のリスト。
+        outbox を使う場合は publish() と同じく outbox に積み、送信順と再送・上限の扱いを揃える。
+        """
+        if not self.client:
+            return
+        items = [self._prepare(*(m if isinstance(m, tuple) else (m, None))) for m in messages]
+        if self.outbox:
+            for item in items:
+                self.outbox.put(item)
+            return
+        self._send_batch(items)
+
+    def _prepare(self, message, recipients):
+        """送信するデータと配送先チャネルを決める"""
+        channels = self._publish_channels(message, recipients)
+        if self.codec is not None:
+            message = self.codec.encode_payload(message)
+        return message, channels
+
+    def _send_batch(self, items):
+        pipe = self.client.pipeline(transaction=False)
+        for data, channels in items:
+            for channel in channels:
+                pipe.publish(channel, data)
+        pipe.execute()
+
+    def _deliver(self, callback, data):
+        try:
+            payload = decode_legacy_or_tagged(data) if self.codec is None else self.codec.decode(data)
+        except Exception as e:
+            print(f"[RedisBroker] Dropping undecodable message: {e}")
+            return
+        callback(payload)
+
+    def subscribe(self, callback, shutdown_event=None, agent_name=None, firehose=False):
         if not self.client:
             raise ConnectionError("Broker not connected")
-        
+
+        channels = self._subscribe_channels(agent_name, firehose)
         self.pubsub = self.client.pubsub()
-        self.pubsub.subscribe(self.channel)
-        
-        print(f"[RedisBroker] Subscribed to channel: {self.channel}")
-        
+        self.pubsub.subscribe(*channels)
+
+        print(f"[RedisBroker] Subscribed to channel: {', '.join(channels)} (mode: {self.receive_mode})")
+
+        if self.receive_mode == "poll":
+            self._poll_loop(callback, shutdown_event)
+        else:
+            self._event_loop(callback, shutdown_event)
+
+    def _event_loop(self, callback, shutdown_event):
+        """
+        メッセージが届くまでソケット上でブロックし、起床したら溜まっている分を
+        待ち時間なしですべて処理する。アイドル時も block_timeout ごとに
+        shutdown_event を確認する。
+        """
+        while not (shutdown_event and shutdown_event.is_set()):
+            message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=self.block_timeout)
+            while message is not None:
+                if message['type'] == 'message':
+                    self._deliver(callback, message['data'])
+                if shutdown_event and shutdown_event.is_set():
+                    return
+                # 既に届いている分だけを取り出す (timeout=0 はブロックしない)
+                message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=0.0)
+
+    def _poll_loop(self, callback, shutdown_event):
         while True:
             if shutdown_event and shutdown_event.is_set():
                 break
@@ -40,12 +163,15 @@ class RedisBroker(MessageBroker):
             # タイムアウト付きでメッセージを取得
             message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
             if message and message['type'] == 'message':
-                callback(message['data'])
-            
+                self._deliver(callback, message['data'])
+
             # CPUを過剰に消費しないように少し待機
             time.sleep(0.01)
 
     def disconnect(self):
+        if self.outbox:
+            # 送信箱に残っている分を送ってから切断する
+            self.outbox.stop()
         if self.pubsub:
             self.pubsub.unsubscribe()
             self.pubsub.close()
@@ -0,0 +1,183 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future
+import redis
+from .broker_base import MessageBroker, ChannelRouting
+
+class RedisStreamBroker(ChannelRouting, MessageBroker):
+    """
+    Redis Streams とコンシューマグループを利用したメッセージブローカー。
+
+    - エージェント名をコンシューマグループ名として使うため、同じ名前で起動した
+      複数のレプリカは1つの論理エージェントとして負荷を分担する。
+    - 処理が終わったメッセージだけを XACK する (at-least-once)。コールバックが
+      concurrent.futures.Future を返した場合 (BaseAgent が思考処理をワーカーに渡した場合) は、
+      その Future が正常に終わってから ACK する。例外で終わった・破棄された場合は ACK しない。
+      処理中のメッセージは claim_interval ごとに自分で XCLAIM し直して idle 時間を戻すため、
+      他のレプリカに横取りされない。処理中に落ちたレプリカの未ACKメッセージは、
+      claim_min_idle_ms 経過後に他のレプリカが XCLAIM して再処理する。
+    - XADD 時に MAXLEN ~ maxlen でストリームを切り詰め、Redisのメモリを一定に保つ。
+
+    routing は RedisBroker と同じく "global" (単一ストリーム) と
+    "addressed" (受信箱ストリーム + firehose ストリーム) を選べる。ストリーム名の決め方は
+    ChannelRouting を共有する (stream がチャネルのベース名にあたる)。
+    """
+
+    def __init__(self, host='localhost', port=6379, stream='ai_masa_stream', routing="global",
+                 consumer_name=None, maxlen=10000, block_ms=100, batch_size=32,
+                 claim_min_idle_ms=30000, claim_interval=5.0, max_deliveries=5):
+        if routing not in self.ROUTING_MODES:
+            raise ValueError(f"Unknown routing: {routing!r} (expected one of {self.ROUTING_MODES})")
+        self.host = host
+        self.port = port
+        self.channel = stream
+        self.routing = routing
+        self.consumer_name = consumer_name
+        self.maxlen = maxlen
+        # shutdown_event の確認間隔を兼ねる
+        self.block_ms = block_ms
+        self.batch_size = batch_size
+        self.claim_min_idle_ms = claim_min_idle_ms
+        self.claim_interval = claim_interval
+        # この回数を超えて配送されたメッセージは処理不能とみなして破棄する
+        self.max_deliveries = max_deliveries
+        self.client = None
+        self._inflight = {}  # { (stream, entry_id): (group, consumer) } 思考処理の完了待ちで未ACKのもの
+        self._inflight_lock = threading.Lock()
+        self._consumer = None
+
+    @property
+    def stream(self):
+        return self.channel
+
+    def connect(self):
+        self.client = redis.Redis(host=self.host, port=self.port, decode_responses=True)
+        try:
+            self.client.ping()
+            print(f"[RedisStreamBroker] Connected to {self.host}:{self.port}")
+        except redis.ConnectionError:
+            print(f"[RedisStreamBroker] 🔴 Connection Failed. Is Redis running?")
+            raise
+
+    def publish(self, message_json: str, recipients=None):
+        self.publish_many([(message_json, recipients)])
+
+    def publish_many(self, messages):
+        """複数のメッセージを1回のパイプラインで XADD する"""
+        if not self.client:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for message in messages:
+            message_json, recipients = message if isinstance(message, tuple) else (message, None)
+            for stream in self._publish_channels(message_json, recipients):
+                pipe.xadd(stream, {'data': message_json}, maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+    def subscribe(self, callback, shutdown_event=None, agent_name=None, firehose=False):
+        if not self.client:
+            raise ConnectionError("Broker not connected")
+        if not agent_name:
+            raise ValueError("agent_name is required: it is used as the consumer group name")
+
+        group = agent_name
+        consumer = self._consumer = self.consumer_name or f"{agent_name}-{socket.gethostname()}-{os.getpid()}"
+        streams = self._subscribe_channels(agent_name, firehose)
+        for stream in streams:
+            self._ensure_group(stream, group)
+
+        print(f"[RedisStreamBroker] Consuming {', '.join(streams)} as {group}/{consumer}")
+
+        next_claim = 0.0
+        while not (shutdown_event and shutdown_event.is_set()):
+            if time.monotonic() >= next_claim:
+                self._touch_inflight()
+                for stream in streams:
+                    self._reclaim_pending(callback, stream, group, consumer)
+                next_claim = time.monotonic() + self.claim_interval
+
+            response = self.client.xreadgroup(
+                group, consumer, {stream: '>' for stream in streams},
+                count=self.batch_size, block=self.block_ms
+            )
+            for stream, entries in response or []:
+                for entry_id, fields in entries:
+                    self._deliver(callback, stream, group, entry_id, fields)
+
+    def _ensure_group(self, stream, group):
+        try:
+            # 新しいグループは作成時点以降のメッセージから読む
+            self.client.xgroup_create(stream, group, id='$', mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _deliver(self, callback, stream, group, entry_id, fields):
+        if not fields:
+            # 切り詰めによって本体が消えたエントリ
+            self.client.xack(stream, group, entry_id)
+            return
+        try:
+            result = callback(fields['data'])
+        except Exception as e:
+            # ACKしないことで、後で再配送される
+            print(f"[RedisStreamBroker] Error handling {entry_id} from {stream}: {e}")
+            return
+        if isinstance(result, Future):
+            # 思考処理がワーカーで終わってから ACK する
+            with self._inflight_lock:
+                self._inflight[(stream, entry_id)] = group
+            result.add_done_callback(lambda future: self._finish(future, stream, group, entry_id))
+            return
+        self.client.xack(stream, group, entry_id)
+
+    def _finish(self, future, stream, group, entry_id):
+        with self._inflight_lock:
+            self._inflight.pop((stream, entry_id), None)
+        error = future.exception()
+        if error is not None:
+            print(f"[RedisStreamBroker] Not acknowledging {entry_id} from {stream}: {error!r}")
+            return
+        try:
+            self.client.xack(stream, group, entry_id)
+        except redis.RedisError as e:
+            # ACKできなかった分は後で再配送される (受信側の重複排除で二重の思考は防ぐ)
+            print(f"[RedisStreamBroker] Error acknowledging {entry_id} from {stream}: {e}")
+
+    def _touch_inflight(self):
+        """処理中のメッセージを自分で XCLAIM し直し、idle 時間を戻して他のレプリカに取られないようにする"""
+        with self._inflight_lock:
+            inflight = list(self._inflight.items())
+        by_stream = {}
+        for (stream, entry_id), group in inflight:
+            by_stream.setdefault((stream, group), []).append(entry_id)
+        for (stream, group), entry_ids in by_stream.items():
+            # JUSTID は配送回数を増やさない
+            self.client.xclaim(stream, group, self._consumer, 0, entry_ids, justid=True)
+
+    def _reclaim_pending(self, callback, stream, group, consumer):
+        """一定時間ACKされていないメッセージを引き取って再処理する"""
+        pending = self.client.xpending_range(
+            stream, group, min='-', max='+', count=self.batch_size, idle=self.claim_min_idle_ms
+        )
+        if not pending:
+            return
+
+        claim_ids = []
+        for entry in pending:
+            if entry['times_delivered'] >= self.max_deliveries:
+                print(f"[RedisStreamBroker] Dropping {entry['message_id']} from {stream} after {entry['times_delivered']} deliveries")
+                self.client.xack(stream, group, entry['message_id'])
+            else:
+                claim_ids.append(entry['message_id'])
+
+        if not claim_ids:
+            return
+        for entry_id, fields in self.client.xclaim(stream, group, consumer, self.claim_min_idle_ms, claim_ids):
+            self._deliver(callback, stream, group, entry_id, fields)
+
+    def disconnect(self):
+        if self.client:
+            self.client.close()
+        print(f"[RedisStreamBroker] Disconnected from {self.host}:{self.port}")
@@ -0,0 +1,52 @@
+import json
+from abc import ABC, abstractmethod
+import redis
+from ..models.message import Message
+
+class HistorySource(ABC):
+    """エージェントが参加する前の、ジョブの過去の履歴を取得するための読み出し元"""
+    @abstractmethod
+    def fetch(self, job_id):
+        """job_id の履歴を古い順の Message のリストで返す"""
+        pass
+
+class RedisHistoryArchive(HistorySource):
+    """
+    ジョブごとの履歴を Redis のリスト (<prefix>:<job_id>) に保存するアーカイブ。
+
+    全トラフィックを見ている LoggingAgent が append() で書き込み、
+    record_policy='participating' のエージェントが途中からジョブに参加したときに
+    fetch() でそれまでの履歴を読み込む。各リストは max_messages_per_job 件に切り詰め、
+    最後の書き込みから ttl 秒で消えるようにする。
+    """
+    def __init__(self, host='localhost', port=6379, prefix='ai_masa:history',
+                 max_messages_per_job=1000, ttl=7 * 24 * 3600):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.max_messages_per_job = max_messages_per_job
+        self.ttl = ttl
+        self.client = None
+
+    def connect(self):
+        self.client = redis.Redis(host=self.host, port=self.port, decode_responses=True)
+
+    def key(self, job_id):
+        return f"{self.prefix}:{job_id}"
+
+    def append(self, msg):
+        if self.client is None:
+            self.connect()
+        key = self.key(msg.job_id or "default")
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(key, json.dumps(msg.to_dict(), ensure_ascii=False))
+        if self.max_messages_per_job is not None:
+            pipe.ltrim(key, -self.max_messages_per_job, -1)
+        if self.ttl is not None:
+            pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def fetch(self, job_id):
+        if self.client is None:
+            self.connect()
+        return [Message.from_dict(json.loads(item)) for item in self.client.lrange(self.key(job_id), 0, -1)]
@@ -0,0 +1,234 @@
+import json
+import threading
+from collections import OrderedDict, deque
+
+import redis
+
+from ..models.message import Message
+from .store import ContextStore
+
+
+class _CachedJob:
+    """ローカルに持っている、ジョブの履歴の末尾部分。first_seq は messages[0] の通し番号。"""
+    __slots__ = ("messages", "first_seq")
+
+    def __init__(self, first_seq):
+        self.messages = deque()
+        self.first_seq = first_seq
+
+    @property
+    def next_seq(self):
+        return self.first_seq + len(self.messages)
+
+
+class RedisContextStore(ContextStore):
+    """
+    ジョブごとの履歴を Redis に1つだけ持ち、エージェント間で共有するコンテキストストア。
+    再起動したエージェントや後から増やしたレプリカも、それまでの履歴をそのまま読める。
+
+    Redis には次のキーを使う。
+      - <prefix>:log:<job_id>         to_dict() の JSON のリスト (max_messages_per_job 件に切り詰め、job_ttl で消える)
+      - <prefix>:seq:<job_id>         そのジョブに追加されたメッセージの総数 (通し番号)。
+                                      作り直したジョブで番号が重ならないよう、seq_ttl (job_ttl より長い) で消える
+      - <prefix>:id:<job_id>:<msg_id> 追加済みの message_id。同じメッセージを受け取った複数のエージェントのうち、
+                                      最初の1つだけが書き込む
+
+    読み出しは、ローカルの上限付きキャッシュ (max_cached_jobs ジョブ、最も長く使われていないものから捨てる)
+    を通す。読むたびに通し番号と長さだけを問い合わせ、キャッシュにない新しいメッセージだけを
+    リストの末尾から取得する。他のエージェントの書き込みや Redis 側での切り詰め・期限切れは
+    このときに検出し、eviction listener に知らせる。
+    """
+    def __init__(self, host='localhost', port=6379, prefix='ai_masa:context', max_messages_per_job=1000,
+                 job_ttl=24 * 3600, seq_ttl=30 * 24 * 3600, max_cached_jobs=100, client=None):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.max_messages_per_job = max_messages_per_job
+        self.job_ttl = job_ttl
+        self.seq_ttl = seq_ttl
+        self.max_cached_jobs = max_cached_jobs
+        self.client = client
+        self._cache = OrderedDict()  # { job_id: _CachedJob } 最後に使われた順 (古い順)
+        self._lock = threading.RLock()
+        self.stats = {
+            "appended": 0, "duplicates": 0, "cache_hits": 0, "cache_misses": 0, "fetched_messages": 0,
+        }
+
+    def connect(self):
+        self.client = redis.Redis(host=self.host, port=self.port, decode_responses=True)
+
+    def _client(self):
+        if self.client is None:
+            self.connect()
+        return self.client
+
+    def log_key(self, job_id):
+        return f"{self.prefix}:log:{job_id}"
+
+    def seq_key(self, job_id):
+        return f"{self.prefix}:seq:{job_id}"
+
+    def id_key(self, job_id, message_id):
+        return f"{self.prefix}:id:{job_id}:{message_id}"
+
+    def append(self, job_id, msg):
+        client = self._client()
+        if not client.set(self.id_key(job_id, msg.message_id), 1, nx=True, ex=self.job_ttl):
+            # 他のエージェントが既に書き込んだメッセージ
+            self.stats["duplicates"] += 1
+            return
+        log_key, seq_key = self.log_key(job_id), self.seq_key(job_id)
+        pipe = client.pipeline(transaction=True)
+        pipe.rpush(log_key, json.dumps(msg.to_dict(), ensure_ascii=False))
+        if self.max_messages_per_job is not None:
+            pipe.ltrim(log_key, -self.max_messages_per_job, -1)
+        pipe.incr(seq_key)
+        if self.job_ttl is not None:
+            pipe.expire(log_key, self.job_ttl)
+        if self.seq_ttl is not None:
+            pipe.expire(seq_key, self.seq_ttl)
+        results = pipe.execute()
+        total = results[2 if self.max_messages_per_job is not None else 1]
+        evicted = None
+        with self._lock:
+            self.stats["appended"] += 1
+            cached = self._cache.get(job_id)
+            if cached is not None and cached.next_seq == total - 1:
+                # キャッシュが最新なら、取得し直さずにそのまま足す
+                cached.messages.append(msg)
+                evicted = self._trim_cached(cached)
+        if evicted is not None:
+            self._notify_evicted(job_id, evicted, "trimmed")
+
+    def _trim_cached(self, cached):
+        """max_messages_per_job を超えた分をキャッシュから捨て、捨てた場合は新しい first_seq を返す"""
+        if self.max_messages_per_job is None or len(cached.messages) <= self.max_messages_per_job:
+            return None
+        while len(cached.messages) > self.max_messages_per_job:
+            cached.messages.popleft()
+            cached.first_seq += 1
+        return cached.first_seq
+
+    def _sync(self, job_id):
+        """
+        Redis の最新の状態をキャッシュに反映し、(_CachedJob または None, eviction listener に知らせる
+        (first_seq, reason) のリスト) を返す。ジョブがなければ _CachedJob の代わりに None。
+        Redis 側で消えた・作り直されたジョブは "expired" として知らせる。
+        """
+        client = self._client()
+        log_key, seq_key = self.log_key(job_id), self.seq_key(job_id)
+        pipe = client.pipeline(transaction=True)
+        pipe.get(seq_key)
+        pipe.llen(log_key)
+        total, length = pipe.execute()
+        total = int(total or 0)
+        notices = []
+        with self._lock:
+            cached = self._cache.get(job_id)
+            if not length:
+                if self._cache.pop(job_id, None) is not None:
+                    notices.append((None, "expired"))
+                return None, notices
+            first_seq = total - length
+            if cached is not None and not first_seq <= cached.next_seq <= total:
+                # 作り直された、またはキャッシュの続きが既に切り詰められている
+                del self._cache[job_id]
+                notices.append((None, "expired"))
+                cached = None
+            if cached is not None and cached.next_seq == total:
+                self.stats["cache_hits"] += 1
+            else:
+                self.stats["cache_misses"] += 1
+            if cached is None:
+                cached = self._cache[job_id] = _CachedJob(first_seq)
+            self._cache.move_to_end(job_id)
+            next_seq = cached.next_seq
+            while self.max_cached_jobs is not None and len(self._cache) > self.max_cached_jobs:
+                self._cache.popitem(last=False)
+
+        # キャッシュにない末尾の分だけを取得する
+        items = []
+        for _ in range(3):
+            need = total - next_seq
+            if need <= 0:
+                break
+            pipe = client.pipeline(transaction=True)
+            pipe.get(seq_key)
+            pipe.lrange(log_key, -need, -1)
+            latest, items = pipe.execute()
+            latest = int(latest or 0)
+            if latest == total:
+                break
+            # 取得する間に追加された場合は、末尾の位置がずれるので取り直す
+            items = []
+            if latest < total:
+                break
+            total = latest
+        messages = [Message.from_dict(json.loads(item)) for item in items]
+
+        with self._lock:
+            # 取得している間に append() でキャッシュが進んでいたら、次回に取得し直す
+            if messages and cached.next_seq == next_seq:
+                cached.messages.extend(messages)
+                self.stats["fetched_messages"] += len(messages)
+            trimmed = cached.first_seq < first_seq and cached.messages
+            while cached.first_seq < first_seq and cached.messages:
+                cached.messages.popleft()
+                cached.first_seq += 1
+            trimmed_by_limit = self._trim_cached(cached)
+            if trimmed or trimmed_by_limit is not None:
+                notices.append((cached.first_seq, "trimmed"))
+        return cached, notices
+
+    def _read(self, job_id):
+        cached, notices = self._sync(job_id)
+        for first_seq, reason in notices:
+            self._notify_evicted(job_id, first_seq, reason)
+        return cached
+
+    def get(self, job_id, default=None):
+        cached = self._read(job_id)
+        if cached is None:
+            return default
+        with self._lock:
+            return list(cached.messages)
+
+    def window(self, job_id):
+        cached = self._read(job_id)
+        if cached is None:
+            return 0, []
+        with self._lock:
+            return cached.first_seq, list(cached.messages)
+
+    def since(self, job_id, seq):
+        cached = self._read(job_id)
+        if cached is None:
+            return None
+        with self._lock:
+            start = max(seq, cached.first_seq)
+            messages = cached.messages
+            return start, [messages[i] for i in range(start - cached.first_seq, len(messages))]
+
+    def __contains__(self, job_id):
+        return bool(self._client().exists(self.log_key(job_id)))
+
+    def discard(self, job_id):
+        # 通し番号のキーは残し、同じ job_id で作り直されても番号が重ならないようにする
+        self._client().delete(self.log_key(job_id))
+        with self._lock:
+            cached = self._cache.pop(job_id, None)
+        if cached is not None:
+            self._notify_evicted(job_id, None, "discarded")
+
+    def job_ids(self):
+        start = len(self.log_key(""))
+        return [key[start:] for key in self._client().scan_iter(match=self.log_key("*"))]
+
+    def metrics(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "cached_jobs": len(self._cache),
+                "cached_messages": sum(len(c.messages) for c in self._cache.values()),
+            }
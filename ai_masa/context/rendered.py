@@ -0,0 +1,143 @@
+import threading
+from collections import deque, namedtuple
+
+
+def render_history_line(msg):
+    return f"- {msg.from_agent}: {msg.content}"
+
+
+def estimate_tokens(text):
+    """
+    text のおおよそのトークン数。ASCII は4文字で1トークン、それ以外 (日本語など) は
+    1文字1トークンと見積もる (str.isascii() は文字列の長さによらず一定時間で済む)。
+    """
+    if text.isascii():
+        return (len(text) + 3) // 4
+    return len(text)
+
+
+# RenderedHistory.window() の結果。dropped_* は予算に収まらず省いた古いメッセージ
+HistoryWindow = namedtuple("HistoryWindow", [
+    "text", "first_seq", "next_seq", "kept_messages", "kept_tokens", "dropped_messages", "dropped_tokens",
+])
+
+
+class _RenderedJob:
+    __slots__ = ("first_seq", "next_seq", "text", "line_lengths", "line_tokens", "tokens")
+
+    def __init__(self, first_seq):
+        self.first_seq = first_seq
+        self.next_seq = first_seq
+        self.text = ""
+        # 先頭の行を捨てるときに、text から何文字削ればよいかを知るため
+        self.line_lengths = deque()
+        self.line_tokens = deque()
+        self.tokens = 0
+
+
+class RenderedHistory:
+    """
+    ContextStore の各ジョブの履歴を、プロンプト用の文字列 ("- from: content" の行) として
+    描画済みで保持するバッファ。
+
+    text(job_id) はストアから前回以降に追加されたメッセージだけを受け取って描画し、
+    既存の文字列の末尾に足す。古いメッセージがストアから捨てられた場合は先頭の行を削り、
+    ジョブごと捨てられた場合はバッファも捨てる。
+
+    各行のトークン数 (count_tokens) も描画時に数えておき、window() で
+    新しい行から予算に収まるだけを取り出せるようにする。
+    """
+    def __init__(self, store, render_line=render_history_line, count_tokens=estimate_tokens):
+        self.store = store
+        self.render_line = render_line
+        self.count_tokens = count_tokens
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.stats = {"rendered": 0, "rebuilt": 0}
+        store.add_eviction_listener(self._on_evicted)
+
+    def text(self, job_id):
+        return self.render(job_id)[0]
+
+    def render(self, job_id):
+        """(描画済みの履歴, 次に追加されるメッセージの seq) を返す。ジョブがなければ ("", 0)"""
+        with self._lock:
+            rendered = self._sync(job_id)
+            if rendered is None:
+                return "", 0
+            return rendered.text, rendered.next_seq
+
+    def window(self, job_id, budget):
+        """
+        新しいメッセージから順に、合計 budget トークンに収まるだけの行を HistoryWindow で返す。
+        最新の1行だけで予算を超える場合も、その行は含める。
+        """
+        with self._lock:
+            rendered = self._sync(job_id)
+            if rendered is None:
+                return HistoryWindow("", 0, 0, 0, 0, 0, 0)
+            total = len(rendered.line_tokens)
+            kept = kept_tokens = offset = 0
+            # 新しい行から数える
+            for tokens, length in zip(reversed(rendered.line_tokens), reversed(rendered.line_lengths)):
+                if kept and kept_tokens + tokens > budget:
+                    break
+                kept += 1
+                kept_tokens += tokens
+                offset += length + 1
+            text = rendered.text
+            if kept < total:
+                text = text[len(text) - offset + 1:]
+            return HistoryWindow(
+                text, rendered.next_seq - kept, rendered.next_seq,
+                kept, kept_tokens, total - kept, rendered.tokens - kept_tokens,
+            )
+
+    def _sync(self, job_id):
+        """ストアに追加されたメッセージを描画に反映する (ロック保持中に呼ぶ)"""
+        rendered = self._jobs.get(job_id)
+        result = self.store.since(job_id, rendered.next_seq if rendered else 0)
+        if result is None:
+            self._jobs.pop(job_id, None)
+            return None
+        first_seq, new_messages = result
+        if rendered is None or first_seq > rendered.next_seq:
+            # 描画済みの続きが残っていない (ジョブが作り直された) ので最初から描画する
+            if rendered is not None:
+                self.stats["rebuilt"] += 1
+            rendered = self._jobs[job_id] = _RenderedJob(first_seq)
+        self._append(rendered, new_messages)
+        return rendered
+
+    def _append(self, rendered, messages):
+        if not messages:
+            return
+        lines = [self.render_line(msg) for msg in messages]
+        rendered.line_lengths.extend(map(len, lines))
+        tokens = [self.count_tokens(line) for line in lines]
+        rendered.line_tokens.extend(tokens)
+        rendered.tokens += sum(tokens)
+        added = "\n".join(lines)
+        rendered.text = f"{rendered.text}\n{added}" if rendered.text else added
+        rendered.next_seq += len(messages)
+        self.stats["rendered"] += len(messages)
+
+    def _on_evicted(self, job_id, first_seq, reason):
+        with self._lock:
+            rendered = self._jobs.get(job_id)
+            if rendered is None:
+                return
+            if first_seq is None or first_seq >= rendered.next_seq:
+                del self._jobs[job_id]
+                return
+            removed = 0
+            while rendered.first_seq < first_seq:
+                # 行の長さ + 区切りの改行
+                removed += rendered.line_lengths.popleft() + 1
+                rendered.tokens -= rendered.line_tokens.popleft()
+                rendered.first_seq += 1
+            rendered.text = rendered.text[removed:]
+
+    def discard(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
@@ -0,0 +1,287 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+
+# 1メッセージあたりの content 以外の大きさ (Message 本体・ID・タイムスタンプなど) の概算
+MESSAGE_OVERHEAD_BYTES = 256
+
+
+def message_size(msg):
+    """バイト数の上限 (max_bytes) の計算に使う、メッセージ1件のおおよその大きさ"""
+    return MESSAGE_OVERHEAD_BYTES + msg.content_size
+
+
+class ContextStore(ABC):
+    """
+    job_id ごとの会話履歴 (Message のリスト) を保持するストア。
+
+    BaseAgent.context として使われ、従来の dict と同じく
+    `job_id in store` / `store[job_id]` / `store.get(job_id)` で読める
+    (返るのはその時点のコピー)。
+
+    各ジョブのメッセージには受信順に通し番号 (seq) が振られ、古いメッセージが
+    捨てられても番号は変わらない。ジョブが捨てられた後に同じ job_id で作り直された場合は、
+    以前より大きな番号から振り直される。eviction listener は、ジョブの先頭から
+    メッセージが捨てられたとき listener(job_id, first_seq, "trimmed") で、
+    ジョブごと捨てられたとき listener(job_id, None, reason) で呼ばれる。reason は
+    "evicted" (max_jobs / max_bytes を超えたため古いジョブから捨てた)、"expired" (job_ttl を過ぎた)、
+    "discarded" (discard() で捨てた) のいずれか。
+    """
+    def __init__(self):
+        self._listeners = []
+
+    @abstractmethod
+    def append(self, job_id, msg):
+        pass
+
+    @abstractmethod
+    def get(self, job_id, default=None):
+        pass
+
+    @abstractmethod
+    def discard(self, job_id):
+        pass
+
+    @abstractmethod
+    def job_ids(self):
+        pass
+
+    def window(self, job_id):
+        """(先頭メッセージの seq, メッセージのリスト) を返す。ジョブがなければ (0, [])"""
+        messages = self.get(job_id, [])
+        return 0, messages
+
+    def since(self, job_id, seq):
+        """
+        seq 以降のメッセージを (先頭の seq, メッセージのリスト) で返す。ジョブがなければ None。
+        seq より前のメッセージが既に捨てられていた場合は、残っている先頭から返す。
+        """
+        if job_id not in self:
+            return None
+        first_seq, messages = self.window(job_id)
+        start = max(seq, first_seq)
+        return start, messages[start - first_seq:]
+
+    def metrics(self):
+        return {}
+
+    def add_eviction_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify_evicted(self, job_id, first_seq, reason):
+        for listener in self._listeners:
+            try:
+                listener(job_id, first_seq, reason)
+            except Exception as e:
+                print(f"[{type(self).__name__}] Error in eviction listener for {job_id}: {e}")
+
+    def __contains__(self, job_id):
+        return self.get(job_id) is not None
+
+    def __getitem__(self, job_id):
+        messages = self.get(job_id)
+        if messages is None:
+            raise KeyError(job_id)
+        return messages
+
+    def __iter__(self):
+        return iter(self.job_ids())
+
+    def __len__(self):
+        return len(self.job_ids())
+
+
+class JobHistory:
+    """1つのジョブの履歴。first_seq は messages[0] の通し番号。"""
+    __slots__ = ("messages", "sizes", "nbytes", "first_seq", "last_active")
+
+    def __init__(self, now, first_seq=0):
+        self.messages = deque()
+        # content は後から展開されて大きさが変わるため、追加した時点の大きさを覚えておく
+        self.sizes = deque()
+        self.nbytes = 0
+        self.first_seq = first_seq
+        self.last_active = now
+
+    @property
+    def next_seq(self):
+        return self.first_seq + len(self.messages)
+
+    def append(self, msg, now):
+        size = message_size(msg)
+        self.messages.append(msg)
+        self.sizes.append(size)
+        self.nbytes += size
+        self.last_active = now
+
+    def trim(self, count):
+        for _ in range(count):
+            self.messages.popleft()
+            self.nbytes -= self.sizes.popleft()
+        self.first_seq += count
+
+
+class InMemoryContextStore(ContextStore):
+    """
+    プロセス内に履歴を持つ、上限付きのコンテキストストア。
+
+      - max_messages_per_job: 1ジョブあたりのメッセージ数の上限 (超えたら古いものから捨てる)
+      - job_ttl:              この秒数メッセージが追加も参照もされなかったジョブを捨てる
+      - max_jobs:             保持するジョブ数の上限 (最も長く使われていないジョブから捨てる)
+      - max_bytes:            全ジョブ合計の大きさ (message_size の合計) の上限
+
+    None を指定した上限は無効。捨てた件数と現在の保持量は metrics() で確認できる。
+    """
+    def __init__(self, max_messages_per_job=1000, job_ttl=24 * 3600, max_jobs=1000,
+                 max_bytes=64 * 1024 * 1024, clock=time.monotonic):
+        super().__init__()
+        self.max_messages_per_job = max_messages_per_job
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._jobs = OrderedDict()  # { job_id: JobHistory } 最後に使われた順 (古い順)
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self.stats = {
+            "appended": 0, "evicted_messages": 0, "evicted_jobs": 0, "expired_jobs": 0,
+        }
+
+    def append(self, job_id, msg):
+        evicted = []
+        with self._lock:
+            now = self._clock()
+            history = self._jobs.get(job_id)
+            if history is None:
+                # 通し番号は、これまでに追加された総数から始める (作り直したジョブと番号が重ならない)
+                history = self._jobs[job_id] = JobHistory(now, first_seq=self.stats["appended"])
+            else:
+                self._jobs.move_to_end(job_id)
+            before = history.nbytes
+            history.append(msg, now)
+            self._nbytes += history.nbytes - before
+            self.stats["appended"] += 1
+
+            if self.max_messages_per_job is not None and len(history.messages) > self.max_messages_per_job:
+                self._trim(job_id, history, len(history.messages) - self.max_messages_per_job, evicted)
+            self._expire(now, evicted)
+            while self.max_jobs is not None and len(self._jobs) > self.max_jobs:
+                self._drop_oldest(evicted)
+            while self.max_bytes is not None and self._nbytes > self.max_bytes:
+                if len(self._jobs) > 1:
+                    self._drop_oldest(evicted)
+                elif len(history.messages) > 1:
+                    # 残っているのが今のジョブだけなら、そのジョブの古いメッセージを捨てる
+                    self._trim(job_id, history, 1, evicted)
+                else:
+                    break
+        # listener はロックの外で呼ぶ
+        for job_id, first_seq, reason in evicted:
+            self._notify_evicted(job_id, first_seq, reason)
+
+    def _trim(self, job_id, history, count, evicted):
+        before = history.nbytes
+        history.trim(count)
+        self._nbytes -= before - history.nbytes
+        self.stats["evicted_messages"] += count
+        evicted.append((job_id, history.first_seq, "trimmed"))
+
+    def _drop(self, job_id, evicted, reason):
+        """ジョブごと捨て、捨てたメッセージ数を返す"""
+        history = self._jobs.pop(job_id)
+        self._nbytes -= history.nbytes
+        evicted.append((job_id, None, reason))
+        return len(history.messages)
+
+    def _drop_oldest(self, evicted):
+        self.stats["evicted_messages"] += self._drop(next(iter(self._jobs)), evicted, "evicted")
+        self.stats["evicted_jobs"] += 1
+
+    def _expire(self, now, evicted):
+        if self.job_ttl is None:
+            return
+        while self._jobs:
+            job_id, history = next(iter(self._jobs.items()))
+            if now - history.last_active < self.job_ttl:
+                break
+            self.stats["evicted_messages"] += self._drop(job_id, evicted, "expired")
+            self.stats["expired_jobs"] += 1
+
+    def get(self, job_id, default=None):
+        with self._lock:
+            history = self._jobs.get(job_id)
+            if history is None:
+                return default
+            history.last_active = self._clock()
+            self._jobs.move_to_end(job_id)
+            return list(history.messages)
+
+    def window(self, job_id):
+        with self._lock:
+            history = self._jobs.get(job_id)
+            if history is None:
+                return 0, []
+            history.last_active = self._clock()
+            self._jobs.move_to_end(job_id)
+            return history.first_seq, list(history.messages)
+
+    def since(self, job_id, seq):
+        with self._lock:
+            history = self._jobs.get(job_id)
+            if history is None:
+                return None
+            history.last_active = self._clock()
+            self._jobs.move_to_end(job_id)
+            start = max(seq, history.first_seq)
+            messages = history.messages
+            # 新しい分だけを末尾から取り出す (deque の末尾付近の参照は速い)
+            return start, [messages[i] for i in range(start - history.first_seq, len(messages))]
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    def discard(self, job_id):
+        evicted = []
+        with self._lock:
+            if job_id in self._jobs:
+                self._drop(job_id, evicted, "discarded")
+        for job_id, first_seq, reason in evicted:
+            self._notify_evicted(job_id, first_seq, reason)
+
+    def job_ids(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def expire(self):
+        """アイドル時間が job_ttl を超えたジョブを今すぐ捨てる"""
+        evicted = []
+        with self._lock:
+            self._expire(self._clock(), evicted)
+        for job_id, first_seq, reason in evicted:
+            self._notify_evicted(job_id, first_seq, reason)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "jobs": len(self._jobs),
+                "resident_messages": sum(len(h.messages) for h in self._jobs.values()),
+                "resident_bytes": self._nbytes,
+            }
+
+
+def get_context_store(store, **options):
+    """
+    名前 ("memory" / "redis") からコンテキストストアを作る。ContextStore を渡した場合はそのまま返す。
+    options はストアのコンストラクタに渡す (redis の場合は host など)。
+    """
+    if isinstance(store, ContextStore):
+        return store
+    if store == "memory":
+        return InMemoryContextStore(**options)
+    if store == "redis":
+        # redis を使わない構成でも読み込めるよう、必要になったときに import する
+        from .redis_store import RedisContextStore
+        return RedisContextStore(**options)
+    raise ValueError(f"Unknown context store: {store!r} (expected 'memory', 'redis' or a ContextStore)")
@@ -0,0 +1,107 @@
+import threading
+from ..agents.dispatcher import MessageDispatcher
+
+
+def extractive_summary(previous, messages, max_chars=2000, line_chars=120):
+    """
+    LLMを使わない簡易な要約。各メッセージの先頭 line_chars 文字を1行にして前回の要約の後ろに足し、
+    全体が max_chars 文字を超えたら古い行から捨てる。
+    """
+    lines = previous.split("\n") if previous else []
+    for msg in messages:
+        content = " ".join(str(msg.content).split())
+        if len(content) > line_chars:
+            content = content[:line_chars] + "..."
+        lines.append(f"- {msg.from_agent}: {content}")
+    total = sum(len(line) + 1 for line in lines) - 1
+    start = 0
+    while total > max_chars and start < len(lines) - 1:
+        total -= len(lines[start]) + 1
+        start += 1
+    return "\n".join(lines[start:])
+
+
+class RollingSummary:
+    """
+    ジョブごとに、プロンプトの予算に収まらなかった古いメッセージの要約を保持する。
+
+    get() は手元にある要約をすぐに返し、request(job_id, upto_seq) は upto_seq より前の
+    メッセージまで要約を進める処理をバックグラウンドのワーカーに積む (1ジョブにつき同時に1つ)。
+    要約は summarize(前回の要約, 新たに省かれたメッセージのリスト) で前回の要約に積み増していく。
+    そのため、プロンプトを作る側が要約を待つことはなく、要約が追いつくまでは
+    少し古い要約が使われる。background=False の場合は request() の中で要約する。
+    """
+    def __init__(self, store, summarize=extractive_summary, background=True, max_pending=1000):
+        self.store = store
+        self.summarize = summarize
+        self.background = background
+        self.max_pending = max_pending
+        self._summaries = {}     # { job_id: (要約, 要約に含まれていない最初の seq) }
+        self._scheduled = set()  # 要約を更新中・更新待ちのジョブ
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self.stats = {"requested": 0, "summarized": 0, "failed": 0}
+        store.add_eviction_listener(self._on_evicted)
+
+    def get(self, job_id):
+        """(要約, 要約に含まれていない最初の seq) を返す。要約がなければ ("", 0)"""
+        with self._lock:
+            return self._summaries.get(job_id, ("", 0))
+
+    def request(self, job_id, upto_seq):
+        """upto_seq より前のメッセージまで要約するよう依頼する"""
+        with self._lock:
+            if self._summaries.get(job_id, ("", 0))[1] >= upto_seq or job_id in self._scheduled:
+                return
+            self._scheduled.add(job_id)
+            self.stats["requested"] += 1
+        if not self.background:
+            self._update(job_id, upto_seq)
+            return
+        if self._dispatcher is None:
+            # 要約が必要になるまでスレッドは作らない
+            with self._lock:
+                if self._dispatcher is None:
+                    self._dispatcher = MessageDispatcher(
+                        name="RollingSummary", workers=1, max_pending=self.max_pending, overflow="drop_newest"
+                    ).start()
+        if not self._dispatcher.submit_keyed(job_id, self._update, job_id, upto_seq):
+            with self._lock:
+                self._scheduled.discard(job_id)
+
+    def _update(self, job_id, upto_seq):
+        try:
+            summary, covered_seq = self.get(job_id)
+            result = self.store.since(job_id, covered_seq)
+            if result is None:
+                return
+            start, messages = result
+            messages = messages[:max(0, upto_seq - start)]
+            if not messages:
+                return
+            summary = self.summarize(summary, messages)
+            with self._lock:
+                # 要約している間にジョブが捨てられていたら保存しない
+                if job_id in self.store:
+                    self._summaries[job_id] = (summary, start + len(messages))
+                    self.stats["summarized"] += 1
+        except Exception as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            print(f"[RollingSummary][{job_id}] Error summarizing history: {e}")
+        finally:
+            with self._lock:
+                self._scheduled.discard(job_id)
+
+    def _on_evicted(self, job_id, first_seq, reason):
+        if first_seq is None:
+            with self._lock:
+                self._summaries.pop(job_id, None)
+
+    def discard(self, job_id):
+        with self._lock:
+            self._summaries.pop(job_id, None)
+
+    def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.stop(timeout=1)
@@ -0,0 +1,200 @@
+import asyncio
+import shlex
+import threading
+import time
+from collections import namedtuple
+
+# 1回の実行結果。queue_wait は同時実行数の枠が空くまで待った秒数、exec_time はプロセスの実行にかかった秒数
+LLMResult = namedtuple("LLMResult", ["stdout", "stderr", "returncode", "queue_wait", "exec_time"])
+
+
+class LLMExecutionError(Exception):
+    """LLMコマンドを実行できなかった・失敗した場合のエラー"""
+    pass
+
+
+class LLMTimeoutError(LLMExecutionError):
+    pass
+
+
+class LLMCancelledError(LLMExecutionError):
+    pass
+
+
+class LLMExecutor:
+    """
+    LLMコマンドを (シェルを介さずに) asyncio のサブプロセスとして実行する実行層。
+
+    専用のイベントループをバックグラウンドスレッドで動かし、同期コードからは run()、
+    他のイベントループからは submit() が返す Future (asyncio.wrap_future で待てる) で使う。
+      - max_concurrency: 同時に実行するコマンド数の上限。超えた分は枠が空くまで待つ
+      - timeout:         1回の実行の期限 (秒)。超えたらプロセスを kill して LLMTimeoutError にする
+      - cancel_job(job_id): そのジョブの待機中・実行中の呼び出しを取り消す (実行中のプロセスは kill する)
+    待ち時間 (queue_wait) と実行時間 (exec_time) は呼び出しごとに LLMResult で返し、
+    合計を stats に記録する。
+    """
+    def __init__(self, max_concurrency=4, timeout=None, name="LLMExecutor"):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be >= 1")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._slots = None
+        self._tasks = set()  # 待機中・実行中のタスク (イベントループのスレッドからのみ触る)
+        self._jobs = {}      # { job_id: そのジョブのタスクの集合 }
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0, "completed": 0, "failed": 0, "timeouts": 0, "cancelled": 0,
+            "queue_wait": 0.0, "exec_time": 0.0, "max_queue_wait": 0.0, "running": 0, "waiting": 0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return self
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name=self.name, daemon=True)
+            self._thread.start()
+        ready.wait()
+        return self
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    def submit(self, argv, input_text="", timeout=None, job_id=None):
+        """コマンドの実行を予約し、LLMResult を返す concurrent.futures.Future を返す"""
+        if self._thread is None:
+            self.start()
+        if isinstance(argv, str):
+            argv = shlex.split(argv)
+        with self._lock:
+            self.stats["calls"] += 1
+        return asyncio.run_coroutine_threadsafe(
+            self._track(self._execute(argv, input_text, timeout if timeout is not None else self.timeout), job_id),
+            self._loop
+        )
+
+    def run(self, argv, input_text="", timeout=None, job_id=None):
+        """コマンドを実行して LLMResult を返す (終わるまで待つ)"""
+        return self.submit(argv, input_text, timeout=timeout, job_id=job_id).result()
+
+    async def _track(self, coro, job_id):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        if job_id is not None:
+            self._jobs.setdefault(job_id, set()).add(task)
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            self._count("cancelled")
+            raise LLMCancelledError(f"LLM call for job {job_id!r} was cancelled") from None
+        finally:
+            self._tasks.discard(task)
+            if job_id is not None:
+                tasks = self._jobs.get(job_id)
+                if tasks is not None:
+                    tasks.discard(task)
+                    if not tasks:
+                        del self._jobs[job_id]
+
+    async def _execute(self, argv, input_text, timeout):
+        queued_at = time.monotonic()
+        self._count("waiting", 1)
+        try:
+            await self._slots.acquire()
+        finally:
+            self._count("waiting", -1)
+        try:
+            started_at = time.monotonic()
+            queue_wait = started_at - queued_at
+            with self._lock:
+                self.stats["queue_wait"] += queue_wait
+                self.stats["max_queue_wait"] = max(self.stats["max_queue_wait"], queue_wait)
+                self.stats["running"] += 1
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *argv,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+            except (OSError, ValueError) as e:
+                self._count("failed")
+                raise LLMExecutionError(f"failed to start {argv!r}: {e}") from e
+            try:
+                # 期限 (timeout) は枠を得てからの実行時間に掛ける
+                stdout, stderr = await asyncio.wait_for(process.communicate(input_text.encode()), timeout)
+            except asyncio.TimeoutError:
+                await self._kill(process)
+                self._count("timeouts")
+                raise LLMTimeoutError(f"{argv[0]} did not finish within {timeout}s") from None
+            except asyncio.CancelledError:
+                await self._kill(process)
+                raise
+            exec_time = time.monotonic() - started_at
+            with self._lock:
+                self.stats["exec_time"] += exec_time
+                self.stats["completed" if process.returncode == 0 else "failed"] += 1
+            return LLMResult(stdout.decode(), stderr.decode(errors="replace"), process.returncode, queue_wait, exec_time)
+        finally:
+            self._count("running", -1)
+            self._slots.release()
+
+    @staticmethod
+    async def _kill(process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def cancel_job(self, job_id):
+        """job_id の待機中・実行中の呼び出しを取り消す"""
+        loop = self._loop
+        if loop is None:
+            return
+
+        def cancel():
+            for task in list(self._jobs.get(job_id, ())):
+                task.cancel()
+        loop.call_soon_threadsafe(cancel)
+
+    def active_jobs(self):
+        return list(self._jobs)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        finished = stats["completed"] + stats["failed"] + stats["timeouts"]
+        stats["avg_queue_wait"] = stats["queue_wait"] / finished if finished else 0.0
+        stats["avg_exec_time"] = stats["exec_time"] / stats["completed"] if stats["completed"] else 0.0
+        return stats
+
+    def stop(self, timeout=1.0):
+        """実行中の呼び出しを取り消して、イベントループを止める"""
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            tasks = list(self._tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop.stop()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._loop.close()
+        self._thread = None
+        self._loop = None
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class LLMResponseCache:
+    """
+    LLMの応答をディスク (SQLite) に保存するキャッシュ。
+
+    キーは (ロールプロンプト, プロンプト, コマンドのテンプレート) のハッシュ (fingerprint)。
+    同じプロンプトを何度も送る再実行やリプレイ、回帰テストで、LLMを呼ばずに前回の応答を返す。
+    SQLite の WAL モードを使うため、同じホストの複数のプロセスから同じファイルを共有できる。
+      - max_entries: 保存する応答の上限。超えたら最も長く使われていないものから消す
+      - ttl:         応答を保存してからの有効期限 (秒)。None で期限なし
+    """
+    def __init__(self, path, max_entries=10000, ttl=None, busy_timeout=5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()  # sqlite3 の接続はスレッドごとに持つ
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "expired": 0}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @staticmethod
+    def fingerprint(role_prompt, prompt, command):
+        digest = hashlib.sha256()
+        for part in (role_prompt, prompt, command):
+            data = str(part).encode("utf-8")
+            # 区切りで曖昧にならないよう、各部分の長さも含める
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def get(self, key):
+        """キャッシュされた応答を返す。ない・期限切れの場合は None"""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._count("expired")
+            row = None
+        if row is None:
+            self._count("misses")
+            return None
+        conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return row[0]
+
+    def put(self, key, response):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            expired = 0
+            if self.ttl is not None:
+                expired = conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+            evicted = 0
+            if self.max_entries is not None:
+                excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    evicted = conn.execute(
+                        "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    ).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.stats["stored"] += 1
+            self.stats["expired"] += expired
+            self.stats["evicted"] += evicted
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        self._connect().execute("DELETE FROM responses")
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import deque
+
+
+class SessionPool:
+    """
+    事前に作成・初期化したLLMセッションのプール。
+
+    バックグラウンドのスレッドが create_session() で size 個のセッションを作っておき、
+    新しいジョブは take() で待たずに1つ受け取る。受け取られた分はすぐに作り足す。
+    プールが空の場合 take() は None を返し、呼び出し側がその場で作る。
+      - retry_interval:       create_session() が失敗 (None または例外) したら、この秒数待ってから作り直す
+      - maintenance:          maintenance_interval 秒ごとに同じスレッドで呼ぶ関数 (使われなくなったセッションの削除など)
+    """
+    def __init__(self, create_session, size=1, retry_interval=30.0, maintenance=None, maintenance_interval=60.0,
+                 name="SessionPool"):
+        self.create_session = create_session
+        self.size = size
+        self.retry_interval = retry_interval
+        self.maintenance = maintenance
+        self.maintenance_interval = maintenance_interval
+        self.name = name
+        self._ready = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self.stats = {"created": 0, "taken": 0, "misses": 0, "failed": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def take(self):
+        """作成済みのセッションを1つ返す。なければ None"""
+        with self._cond:
+            if not self._ready:
+                self.stats["misses"] += 1
+                return None
+            session_id = self._ready.popleft()
+            self.stats["taken"] += 1
+            # 作り足すよう知らせる
+            self._cond.notify_all()
+            return session_id
+
+    def ready(self):
+        with self._cond:
+            return len(self._ready)
+
+    def _run(self):
+        retry_at = 0.0
+        next_maintenance = time.monotonic() + self.maintenance_interval
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    if now >= next_maintenance and self.maintenance is not None:
+                        break
+                    if len(self._ready) < self.size and now >= retry_at:
+                        break
+                    deadline = next_maintenance if self.maintenance is not None else None
+                    if len(self._ready) < self.size:
+                        deadline = retry_at if deadline is None else min(deadline, retry_at)
+                    self._cond.wait(None if deadline is None else max(0.0, deadline - now))
+                if self._stopped:
+                    return
+                refill = len(self._ready) < self.size
+
+            if self.maintenance is not None and time.monotonic() >= next_maintenance:
+                next_maintenance = time.monotonic() + self.maintenance_interval
+                try:
+                    self.maintenance()
+                except Exception as e:
+                    print(f"[{self.name}] Error during maintenance: {e}")
+            if not refill or time.monotonic() < retry_at:
+                continue
+
+            # セッションの作成は時間がかかるため、ロックを持たずに行う
+            try:
+                session_id = self.create_session()
+            except Exception as e:
+                print(f"[{self.name}] Error creating session: {e}")
+                session_id = None
+            with self._cond:
+                if session_id is None:
+                    self.stats["failed"] += 1
+                    retry_at = time.monotonic() + self.retry_interval
+                    continue
+                self.stats["created"] += 1
+                self._ready.append(session_id)
+
+    def stop(self, timeout=1.0):
+        """スレッドを止め、使われなかったセッションのリストを返す"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._cond:
+            leftover = list(self._ready)
+            self._ready.clear()
+        return leftover
@@ -0,0 +1,281 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+class SessionRegistry(MutableMapping):
+    """
+    job_id と LLMセッションIDの対応 (BaseAgent.job_sessions) を保持するレジストリ。
+
+    従来の dict と同じく `registry[job_id]` / `registry.get(job_id)` / `job_id in registry` /
+    `registry[job_id] = session_id` / `del registry[job_id]` で使える。
+    ttl (秒) を指定した場合、その間読み書きされなかった対応は消える。読むたびに期限を延ばすが、
+    書き込みを減らすため、残りが ttl の半分を切った場合だけ延ばす。
+    """
+    def __init__(self, ttl=None, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.RLock()
+
+    def _expires_at(self):
+        return None if self.ttl is None else self.clock() + self.ttl
+
+    def _needs_refresh(self, expires_at):
+        return expires_at is not None and expires_at - self.clock() < self.ttl / 2
+
+    def metrics(self):
+        return {}
+
+
+class InMemorySessionRegistry(SessionRegistry):
+    """プロセス内だけに持つレジストリ (再起動すると消える)"""
+    def __init__(self, ttl=None, clock=time.time):
+        super().__init__(ttl=ttl, clock=clock)
+        self._entries = {}  # { job_id: (session_id, 期限 (clock の値) または None) }
+
+    def __getitem__(self, job_id):
+        with self._lock:
+            session_id, expires_at = self._entries[job_id]
+            if expires_at is not None and expires_at <= self.clock():
+                del self._entries[job_id]
+                raise KeyError(job_id)
+            if self._needs_refresh(expires_at):
+                self._entries[job_id] = (session_id, self._expires_at())
+            return session_id
+
+    def __setitem__(self, job_id, session_id):
+        with self._lock:
+            self._entries[job_id] = (session_id, self._expires_at())
+
+    def __delitem__(self, job_id):
+        with self._lock:
+            del self._entries[job_id]
+
+    def _live_ids(self):
+        with self._lock:
+            now = self.clock()
+            return [job_id for job_id, (_, expires_at) in self._entries.items()
+                    if expires_at is None or expires_at > now]
+
+    def __iter__(self):
+        return iter(self._live_ids())
+
+    def __len__(self):
+        return len(self._live_ids())
+
+
+class FileSessionRegistry(InMemorySessionRegistry):
+    """
+    ローカルのJSONファイルに保存するレジストリ。再起動したエージェントは、既存のセッションを
+    作り直さずに使い続けられる。
+
+    ファイルは最初に使われたときに読み込み、変更のたびに一時ファイルへ書いてから置き換える
+    (書き込みの途中で終了しても壊れない)。同じファイルを複数のプロセスで共有しないこと
+    (エージェントごとに namespace で分ける)。
+    """
+    DEFAULT_DIR = os.path.join("~", ".ai_masa", "sessions")
+
+    def __init__(self, path=None, namespace="default", ttl=7 * 24 * 3600, clock=time.time):
+        super().__init__(ttl=ttl, clock=clock)
+        self.path = os.path.expanduser(path or os.path.join(self.DEFAULT_DIR, f"{namespace}.json"))
+        self._loaded = False
+        self.stats = {"loaded": 0, "saved": 0}
+
+    def _load(self):
+        """ロック保持中に呼ぶ"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[FileSessionRegistry] Could not read {self.path}: {e}. Starting empty.")
+            return
+        now = self.clock()
+        for job_id, (session_id, expires_at) in data.items():
+            if expires_at is None or expires_at > now:
+                self._entries[job_id] = (session_id, expires_at)
+        self.stats["loaded"] = len(self._entries)
+
+    def _save(self):
+        """ロック保持中に呼ぶ"""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sessions-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({job_id: list(entry) for job_id, entry in self._entries.items()}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.stats["saved"] += 1
+
+    def __getitem__(self, job_id):
+        with self._lock:
+            self._load()
+            before = self._entries.get(job_id)
+            try:
+                return super().__getitem__(job_id)
+            finally:
+                # 期限切れで消えた・期限を延ばした場合は保存する
+                if before is not None and self._entries.get(job_id) != before:
+                    self._save()
+
+    def __setitem__(self, job_id, session_id):
+        with self._lock:
+            self._load()
+            super().__setitem__(job_id, session_id)
+            self._save()
+
+    def __delitem__(self, job_id):
+        with self._lock:
+            self._load()
+            super().__delitem__(job_id)
+            self._save()
+
+    def _live_ids(self):
+        with self._lock:
+            self._load()
+            return super()._live_ids()
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, "sessions": len(self._entries)}
+
+
+class RedisSessionRegistry(SessionRegistry):
+    """
+    Redis に保存するレジストリ。キーは <prefix>:<namespace>:<job_id> で、期限 (ttl) は Redis が管理する。
+    読んだ対応はプロセス内にも最大 max_cached_jobs 件 (LRU) 持ち、同じジョブを再び読むときは問い合わせない。
+    接続と読み込みは最初に使われたときに行う。
+
+    同じ namespace を複数のレプリカで共有する場合、他のレプリカが対応を消した・付け替えた
+    (GeminiCliAgent の collect_idle_sessions など) ことは、プロセス内の対応が cache_ttl 秒経って
+    Redis を読み直すまで反映されない。cache_ttl=0 で毎回 Redis を読み、None で読み直さない。
+    """
+    def __init__(self, host='localhost', port=6379, namespace="default", prefix="ai_masa:sessions",
+                 ttl=7 * 24 * 3600, client=None, clock=time.time, max_cached_jobs=10000, cache_ttl=60.0):
+        super().__init__(ttl=ttl, clock=clock)
+        self.host = host
+        self.port = port
+        self.namespace = namespace
+        self.prefix = prefix
+        self.client = client
+        self.max_cached_jobs = max_cached_jobs
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()  # { job_id: (session_id, 期限 または None, Redis を読み直す時刻) } (古い順)
+        self.stats = {"hits": 0, "misses": 0, "refreshed": 0, "evicted": 0}
+
+    def _client(self):
+        if self.client is None:
+            # redis を使わない構成でも読み込めるよう、必要になったときに import する
+            import redis
+            self.client = redis.Redis(host=self.host, port=self.port, decode_responses=True)
+        return self.client
+
+    def key(self, job_id):
+        return f"{self.prefix}:{self.namespace}:{job_id}"
+
+    def _remember(self, job_id, session_id):
+        """ロック保持中に呼ぶ"""
+        if not self.max_cached_jobs or self.cache_ttl == 0:
+            return
+        now = self.clock()
+        revalidate_at = None if self.cache_ttl is None else now + self.cache_ttl
+        self._cache[job_id] = (session_id, self._expires_at(), revalidate_at)
+        self._cache.move_to_end(job_id)
+        while len(self._cache) > self.max_cached_jobs:
+            self._cache.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def _cached(self, job_id):
+        """プロセス内の対応を (session_id, 期限を延ばすか) で返す。ない・古い場合は (None, False)"""
+        with self._lock:
+            cached = self._cache.get(job_id)
+            now = self.clock()
+            if cached is None or (cached[1] is not None and cached[1] <= now) or \
+                    (cached[2] is not None and cached[2] <= now):
+                self._cache.pop(job_id, None)
+                self.stats["misses"] += 1
+                return None, False
+            self._cache.move_to_end(job_id)
+            self.stats["hits"] += 1
+            refresh = self._needs_refresh(cached[1])
+            if refresh:
+                self._cache[job_id] = (cached[0], self._expires_at(), cached[2])
+                self.stats["refreshed"] += 1
+            return cached[0], refresh
+
+    def __getitem__(self, job_id):
+        session_id, refresh = self._cached(job_id)
+        # Redis への問い合わせはロックを持たずに行う
+        if session_id is not None:
+            if refresh:
+                self._client().expire(self.key(job_id), self.ttl)
+            return session_id
+        client = self._client()
+        if self.ttl is not None:
+            pipe = client.pipeline(transaction=True)
+            pipe.get(self.key(job_id))
+            pipe.expire(self.key(job_id), self.ttl)
+            session_id = pipe.execute()[0]
+        else:
+            session_id = client.get(self.key(job_id))
+        if session_id is None:
+            raise KeyError(job_id)
+        with self._lock:
+            self._remember(job_id, session_id)
+        return session_id
+
+    def __setitem__(self, job_id, session_id):
+        self._client().set(self.key(job_id), session_id, ex=self.ttl)
+        with self._lock:
+            self._remember(job_id, session_id)
+
+    def __delitem__(self, job_id):
+        with self._lock:
+            self._cache.pop(job_id, None)
+        if not self._client().delete(self.key(job_id)):
+            raise KeyError(job_id)
+
+    def __contains__(self, job_id):
+        try:
+            self[job_id]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        start = len(self.key(""))
+        return iter([key[start:] for key in self._client().scan_iter(match=self.key("*"))])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, "cached_sessions": len(self._cache)}
+
+
+def get_session_registry(registry, **options):
+    """
+    名前 ("memory" / "file" / "redis") からセッションレジストリを作る。SessionRegistry を渡した場合はそのまま返す。
+    options はレジストリのコンストラクタに渡す (file の場合は path、redis の場合は host など)。
+    """
+    if isinstance(registry, SessionRegistry):
+        return registry
+    if registry == "memory":
+        return InMemorySessionRegistry(**options)
+    if registry == "file":
+        return FileSessionRegistry(**options)
+    if registry == "redis":
+        return RedisSessionRegistry(**options)
+    raise ValueError(f"Unknown session registry: {registry!r} (expected 'memory', 'file', 'redis' or a SessionRegistry)")
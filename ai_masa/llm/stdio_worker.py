@@ -0,0 +1,63 @@
+"""
+LLMWorkerPool のプロトコル (1行1つのJSON) を話せない CLI を、プールから使えるようにするワーカー。
+
+要求ごとに、指定したコマンドを (シェルを介さずに) 実行してその標準出力を返す。
+CLI 自体の起動は毎回行われるが、/bin/sh の起動とコマンド文字列の解釈は省ける。
+常駐モードを持つ CLI の場合は、こちらを使わずにその CLI を直接プールに指定する。
+
+    python -m ai_masa.llm.stdio_worker --command "gemini --resume {session_id} --output-format json" \
+        [--session-command "<ロールプロンプトを標準入力で受け取り、セッションIDを出力するコマンド>"]
+"""
+import argparse
+import json
+import shlex
+import subprocess
+import sys
+
+
+def run_command(template, prompt, session_id=None):
+    argv = [arg.format(session_id=session_id) for arg in shlex.split(template)]
+    process = subprocess.run(argv, input=prompt, capture_output=True, text=True, check=True)
+    return process.stdout
+
+
+def handle(request, command, session_command):
+    op = request.get("op", "prompt")
+    if op == "ping":
+        return "pong"
+    if op == "prompt":
+        return run_command(command, request.get("prompt", ""), request.get("session_id"))
+    if op == "create_session":
+        if not session_command:
+            raise ValueError("create_session is not configured (--session-command)")
+        return run_command(session_command, request.get("prompt", "")).strip().split("\n")[-1]
+    raise ValueError(f"Unknown op: {op!r}")
+
+
+def serve(command, session_command=None, stdin=sys.stdin, stdout=sys.stdout):
+    for line in stdin:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            response = {"id": request_id, "output": handle(request, command, session_command)}
+        except subprocess.CalledProcessError as e:
+            response = {"id": request_id, "error": f"command exited with {e.returncode}: {e.stderr}"}
+        except Exception as e:
+            response = {"id": request_id, "error": str(e)}
+        stdout.write(json.dumps(response, ensure_ascii=False) + "\n")
+        stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--command", required=True, help="{session_id} を含められるLLMコマンド (プロンプトは標準入力)")
+    parser.add_argument("--session-command", default=None)
+    args = parser.parse_args()
+    serve(args.command, args.session_command)
+
+
+if __name__ == "__main__":
+    main()
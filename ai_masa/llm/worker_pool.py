@@ -0,0 +1,217 @@
+import json
+import queue
+import shlex
+import subprocess
+import threading
+import time
+
+
+class LLMWorkerError(Exception):
+    """ワーカーが応答しない・異常終了した・プロトコルに従わない場合のエラー"""
+    pass
+
+
+class LLMCommandError(Exception):
+    """ワーカーは正常に応答したが、LLMコマンドが失敗した場合のエラー ({"error": ...} の応答)"""
+    pass
+
+
+class LLMWorker:
+    """
+    常駐するLLMワーカープロセス1つ。標準入出力で1行1つのJSONをやり取りする。
+
+      要求: {"id": 1, "op": "prompt", "session_id": "...", "prompt": "..."}
+            {"id": 2, "op": "create_session", "prompt": "<ロールプロンプト>"}
+            {"id": 3, "op": "ping"}
+      応答: {"id": 1, "output": "<LLMコマンドの標準出力に相当する文字列>"}
+            {"id": 3, "output": "pong"}
+            失敗した場合は {"id": 1, "error": "..."}
+
+    標準出力はリーダースレッドが読み、呼び出し側はタイムアウト付きで応答を待つ。
+    """
+    def __init__(self, argv):
+        self.argv = argv
+        self.process = subprocess.Popen(
+            argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", bufsize=1
+        )
+        self.requests = 0
+        self.last_used = time.monotonic()
+        self._next_id = 0
+        self._lines = queue.Queue()
+        self._reader = threading.Thread(target=self._read_loop, name="LLMWorker-reader", daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        try:
+            for line in self.process.stdout:
+                self._lines.put(line)
+        except (OSError, ValueError):
+            pass
+        # 終了 (EOF) を知らせる
+        self._lines.put(None)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def request(self, op, timeout, **fields):
+        self._next_id += 1
+        request_id = self._next_id
+        try:
+            self.process.stdin.write(json.dumps({"id": request_id, "op": op, **fields}, ensure_ascii=False) + "\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise LLMWorkerError(f"failed to send request: {e}") from e
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            raise LLMWorkerError(f"no response within {timeout}s") from None
+        if line is None:
+            raise LLMWorkerError(f"worker exited (code {self.process.poll()})")
+        self.requests += 1
+        self.last_used = time.monotonic()
+        try:
+            response = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise LLMWorkerError(f"invalid response: {line[:200]!r}") from e
+        if response.get("id") != request_id:
+            raise LLMWorkerError(f"response id {response.get('id')!r} does not match request {request_id}")
+        if response.get("error") is not None:
+            raise LLMCommandError(str(response["error"]))
+        return response.get("output", "")
+
+    def close(self, timeout=1.0):
+        try:
+            self.process.stdin.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class LLMWorkerPool:
+    """
+    常駐するLLMワーカープロセス (LLMWorker) のプール。
+
+    呼び出しのたびに /bin/sh と LLM の CLI を起動し直す代わりに、起動済みのプロセスへ
+    要求を送る。プロセスは最初に必要になったときに起動し、空いているものを使い回す。
+      - max_requests:    この回数の要求を処理したワーカーは終了させ、次に起動し直す (メモリの増加などへの対策)
+      - health_interval: この秒数使われていなかったワーカーは、使う前に ping で応答を確かめる
+      - timeout:         応答を待つ秒数。超えたワーカーは終了させる
+
+    ワーカーの起動や要求が続けて max_failures 回失敗した場合は disabled になり、
+    呼び出し側は従来の1回ごとに起動する方法に戻る (BaseAgent は自動的にそうする)。
+    LLMコマンド自体の失敗 (LLMCommandError) はワーカーの故障ではないため、ワーカーは使い続け、
+    失敗の回数にも数えずに呼び出し側へそのまま返す。
+    """
+    def __init__(self, command, size=2, max_requests=500, timeout=300.0, health_interval=60.0,
+                 ping_timeout=5.0, max_failures=3):
+        self.argv = shlex.split(command) if isinstance(command, str) else list(command)
+        self.size = size
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.max_failures = max_failures
+        self.disabled = False
+        self._idle = queue.LifoQueue()  # 直前に使ったワーカーから使う (温まっている可能性が高い)
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._failures = 0
+        self.stats = {"calls": 0, "spawned": 0, "recycled": 0, "failed": 0, "command_errors": 0, "health_checks": 0}
+
+    def call(self, prompt, session_id=None, timeout=None):
+        """session_id のセッションに prompt を送り、LLMの出力を返す"""
+        return self._request("prompt", timeout, prompt=prompt, session_id=session_id)
+
+    def create_session(self, role_prompt, timeout=None):
+        """新しいセッションを作り、そのIDを返す"""
+        return self._request("create_session", timeout, prompt=role_prompt).strip()
+
+    def _request(self, op, timeout, **fields):
+        if self.disabled:
+            raise LLMWorkerError("worker pool is disabled")
+        with self._slots:
+            worker = self._checkout()
+            try:
+                output = worker.request(op, timeout or self.timeout, **fields)
+            except LLMWorkerError:
+                self._discard(worker)
+                self._record_failure()
+                raise
+            except LLMCommandError:
+                # ワーカーは正常に応答している
+                with self._lock:
+                    self.stats["command_errors"] += 1
+                    self._failures = 0
+                self._checkin(worker)
+                raise
+            with self._lock:
+                self.stats["calls"] += 1
+                self._failures = 0
+            self._checkin(worker)
+            return output
+
+    def _checkout(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._spawn()
+            if not worker.alive():
+                self._discard(worker)
+                continue
+            if time.monotonic() - worker.last_used >= self.health_interval:
+                with self._lock:
+                    self.stats["health_checks"] += 1
+                try:
+                    worker.request("ping", self.ping_timeout)
+                except (LLMWorkerError, LLMCommandError):
+                    self._discard(worker)
+                    continue
+            return worker
+
+    def _spawn(self):
+        try:
+            worker = LLMWorker(self.argv)
+        except OSError as e:
+            self._record_failure()
+            raise LLMWorkerError(f"failed to start worker {self.argv!r}: {e}") from e
+        with self._lock:
+            self._workers.add(worker)
+            self.stats["spawned"] += 1
+        return worker
+
+    def _checkin(self, worker):
+        if self.max_requests is not None and worker.requests >= self.max_requests:
+            with self._lock:
+                self.stats["recycled"] += 1
+            self._discard(worker, failed=False)
+            return
+        self._idle.put(worker)
+
+    def _discard(self, worker, failed=True):
+        with self._lock:
+            self._workers.discard(worker)
+            if failed:
+                self.stats["failed"] += 1
+        # 応答しないワーカーは待たずに終了させる
+        worker.close(timeout=0 if failed else 1.0)
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.max_failures and not self.disabled:
+                self.disabled = True
+                print(f"[LLMWorkerPool] ⚠️ {self._failures} consecutive failures. Falling back to one-shot commands.")
+
+    def close(self):
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
@@ -0,0 +1,408 @@
+import base64
+import json
+import struct
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from .message import Message
+
+try:
+    import orjson
+except ImportError:  # orjson はオプション
+    orjson = None
+
+# 送信データの先頭1バイトで形式を表す。
+# 従来の (タグなしの) JSON は必ず '{' で始まるため、タグと衝突しない。
+TAG_JSON = 0x01
+TAG_BINARY = 0x02
+TAG_ENVELOPE = 0x03
+_LEGACY_JSON_FIRST_BYTE = ord("{")
+# タグの次の1バイトは送信形式のバージョン。形式を変えるときに上げ、読めないバージョンは CodecError にする
+WIRE_VERSION = 1
+
+_NONE = 0xFFFFFFFF  # 文字列長としてこの値が入っている場合は None
+
+# バイナリ形式で送るフィールドの順番 (cc_agents は末尾に別途入れる)
+_BINARY_FIELDS = ("message_id", "timestamp", "from_agent", "to_agent", "job_id", "content")
+_HEADER = struct.Struct(f"!B{len(_BINARY_FIELDS)}IH")
+_FLAG_CONTENT_ZLIB = 0x01
+
+# JSON形式で content を圧縮した場合は、base64 にした圧縮データを content に入れ、このキーで示す
+CONTENT_ENCODING_KEY = "content_encoding"
+CONTENT_ENCODING_ZLIB = "zlib"
+# envelope 形式で content が文字列でない (None など) 場合は、本体を JSON で送る
+CONTENT_ENCODING_JSON = "json"
+
+_ENVELOPE_HEADER_FIELDS = ("message_id", "timestamp", "from_agent", "to_agent", "cc_agents", "job_id")
+_U32 = struct.Struct("!I")
+
+
+class CodecError(ValueError):
+    pass
+
+
+class MessageCodec(ABC):
+    """
+    Message と送信用のバイト列を相互に変換する。
+
+    encode() は先頭に形式を表すタグ (1バイト) と送信形式のバージョン (1バイト) を付けて送信する。
+    decode() はどのコーデックでも、受け取ったデータのタグを見て形式を判別するため、
+    コーデックの異なるエージェントが混在していても (移行中でも) 相互に読める。
+
+    compress_threshold (バイト) を指定すると、それ以上の大きさの content を zlib で圧縮し、
+    圧縮したことをエンベロープに記録する。受信側は content を圧縮されたまま保持し、
+    実際に参照されたときに展開する (自分宛でないメッセージは展開されない)。
+    圧縮率と圧縮・展開にかかったCPU時間は stats / compression_report() で確認できる。
+    """
+    name = None
+    tag = None
+
+    def __init__(self, compress_threshold=None, compress_level=6):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "compressed": 0, "skipped": 0, "raw_bytes": 0, "compressed_bytes": 0,
+            "compress_cpu": 0.0, "decompressed": 0, "decompress_cpu": 0.0,
+        }
+
+    def encode(self, msg):
+        return bytes((self.tag, WIRE_VERSION)) + self._encode_body(msg)
+
+    @abstractmethod
+    def _encode_body(self, msg):
+        """Message をタグの後ろに続く本体のバイト列にする"""
+        pass
+
+    def encode_payload(self, payload):
+        """publish に渡されたもの (Message / JSON文字列 / bytes) を送信用のバイト列にする"""
+        if isinstance(payload, Message):
+            return self.encode(payload)
+        if isinstance(payload, str):
+            # 従来形式のJSONはそのまま送る (受信側はタグなしJSONとして読める)
+            return payload.encode("utf-8")
+        return payload
+
+    def decode(self, data):
+        """
+        受信したデータを Message にする。
+        タグ付きのバイト列、タグなしの (従来形式の) JSON のどちらも受け付ける。
+        """
+        if isinstance(data, str):
+            return self._from_json_data(json.loads(data))
+        if not data:
+            raise CodecError("Empty payload")
+        tag = data[0]
+        if tag == _LEGACY_JSON_FIRST_BYTE:
+            return self._from_json_data(_loads_json(data))
+        if tag not in (TAG_JSON, TAG_BINARY, TAG_ENVELOPE):
+            raise CodecError(f"Unknown codec tag: 0x{tag:02x}")
+        _check_version(data)
+        body = memoryview(data)[2:]
+        if tag == TAG_JSON:
+            return self._from_json_data(_loads_json(body))
+        if tag == TAG_BINARY:
+            return self._from_binary(body)
+        return self._from_envelope(body)
+
+    def _pack_content(self, content):
+        """閾値以上の content を圧縮して (データ, 圧縮したか) を返す"""
+        raw = content.encode("utf-8")
+        if self.compress_threshold is None or len(raw) < self.compress_threshold:
+            return raw, False
+        started = time.thread_time()
+        packed = zlib.compress(raw, self.compress_level)
+        elapsed = time.thread_time() - started
+        with self._stats_lock:
+            self.stats["compress_cpu"] += elapsed
+            if len(packed) >= len(raw):
+                # 圧縮しても小さくならないデータはそのまま送る
+                self.stats["skipped"] += 1
+                return raw, False
+            self.stats["compressed"] += 1
+            self.stats["raw_bytes"] += len(raw)
+            self.stats["compressed_bytes"] += len(packed)
+        return packed, True
+
+    def _unpack_content(self, packed):
+        started = time.thread_time()
+        content = zlib.decompress(packed).decode("utf-8")
+        elapsed = time.thread_time() - started
+        with self._stats_lock:
+            self.stats["decompressed"] += 1
+            self.stats["decompress_cpu"] += elapsed
+        return content
+
+    def _unpack_base64_content(self, packed):
+        return self._unpack_content(base64.b64decode(packed))
+
+    def _to_json_data(self, msg):
+        data = msg.to_dict()
+        content = data["content"]
+        if self.compress_threshold is not None and isinstance(content, str):
+            packed, compressed = self._pack_content(content)
+            if compressed:
+                data["content"] = base64.b64encode(packed).decode("ascii")
+                data[CONTENT_ENCODING_KEY] = CONTENT_ENCODING_ZLIB
+        return data
+
+    def _from_json_data(self, data):
+        encoding = data.get(CONTENT_ENCODING_KEY)
+        if encoding is None:
+            return Message.from_dict(data)
+        if encoding != CONTENT_ENCODING_ZLIB:
+            raise CodecError(f"Unknown content encoding: {encoding!r}")
+        packed = data.get("content")
+        msg = Message.from_dict(data)
+        msg.set_packed_content(packed, self._unpack_base64_content)
+        return msg
+
+    def _from_binary(self, body):
+        data, flags = BinaryCodec.decode_body(body)
+        msg = Message.from_dict(data)
+        if flags & _FLAG_CONTENT_ZLIB:
+            msg.set_packed_content(data["content"], self._unpack_content)
+        return msg
+
+    def _from_envelope(self, body):
+        header, content = EnvelopeCodec.split(body)
+        msg = Message.from_dict(header)
+        encoding = header.get(CONTENT_ENCODING_KEY)
+        if encoding is None:
+            unpack = _decode_utf8
+        elif encoding == CONTENT_ENCODING_ZLIB:
+            unpack = self._unpack_content
+        elif encoding == CONTENT_ENCODING_JSON:
+            unpack = _loads_json
+        else:
+            raise CodecError(f"Unknown content encoding: {encoding!r}")
+        # content は参照されるまでデコードしない (受信データをコピーせずに保持する)
+        msg.set_packed_content(content, unpack)
+        return msg
+
+    @property
+    def compression_ratio(self):
+        """圧縮したメッセージの 圧縮後 / 圧縮前 のバイト数の比 (圧縮していなければ None)"""
+        raw_bytes = self.stats["raw_bytes"]
+        return self.stats["compressed_bytes"] / raw_bytes if raw_bytes else None
+
+    def compression_report(self):
+        stats = self.stats
+        ratio = self.compression_ratio
+        return (f"compressed {stats['compressed']} (skipped {stats['skipped']}), "
+                f"ratio {'-' if ratio is None else f'{ratio:.2f}'}, "
+                f"{stats['raw_bytes']} -> {stats['compressed_bytes']} bytes, "
+                f"compress cpu {stats['compress_cpu'] * 1000:.1f}ms, "
+                f"decompressed {stats['decompressed']} (cpu {stats['decompress_cpu'] * 1000:.1f}ms)")
+
+
+class JsonCodec(MessageCodec):
+    """標準ライブラリの json を使う (デフォルト)"""
+    name = "json"
+    tag = TAG_JSON
+
+    def _encode_body(self, msg):
+        return json.dumps(self._to_json_data(msg), ensure_ascii=False).encode("utf-8")
+
+
+class FastJsonCodec(JsonCodec):
+    """
+    orjson があればそれを使う JSON コーデック。送信データは JsonCodec と同じ形式
+    (同じタグ) なので、orjson のないエージェントもそのまま読める。
+    """
+    name = "fastjson"
+
+    def _encode_body(self, msg):
+        if orjson is None:
+            return super()._encode_body(msg)
+        return orjson.dumps(self._to_json_data(msg))
+
+
+class BinaryCodec(MessageCodec):
+    """
+    キー名を送らない、長さの一覧 + 文字列の連結だけのコンパクトな形式。
+
+        tag(1) | version(1) | flags(1) | 各フィールドの長さ(u32) x 6 | cc数(u16) | ccの長さ(u16) x cc数 | データの連結
+
+    長さが 0xFFFFFFFF の場合は None を表す。各フィールドは文字列であること。
+    flags の 0x01 は content が zlib で圧縮されていることを表す。
+    content が文字列でも None でもない (dict など) メッセージは、この形式では送れないため
+    JSON 形式 (TAG_JSON) で送る。どのコーデックも JSON 形式を読めるため、受信側はそのまま読める。
+    """
+    name = "binary"
+    tag = TAG_BINARY
+
+    def encode(self, msg):
+        if not isinstance(msg.content, (str, type(None))):
+            return bytes((TAG_JSON, WIRE_VERSION)) + _dumps_json(self._to_json_data(msg))
+        return super().encode(msg)
+
+    def _encode_body(self, msg):
+        values = [getattr(msg, field) for field in _BINARY_FIELDS]
+        encoded = [b"" if value is None else value.encode("utf-8") for value in values[:-1]]
+        flags = 0
+        content = values[-1]
+        if content is None:
+            encoded.append(b"")
+        else:
+            packed, compressed = self._pack_content(content)
+            encoded.append(packed)
+            if compressed:
+                flags |= _FLAG_CONTENT_ZLIB
+        lengths = [_NONE if value is None else len(data) for value, data in zip(values, encoded)]
+        cc_agents = [name.encode("utf-8") for name in (msg.cc_agents or [])]
+        return b"".join((
+            _HEADER.pack(flags, *lengths, len(cc_agents)),
+            struct.pack(f"!{len(cc_agents)}H", *map(len, cc_agents)),
+            *encoded,
+            *cc_agents,
+        ))
+
+    @staticmethod
+    def decode_body(body):
+        """
+        本体を (フィールドの辞書, flags) にする。
+        content が圧縮されている場合、辞書の content は圧縮されたままの bytes。
+        """
+        try:
+            flags, *lengths, count = _HEADER.unpack_from(body, 0)
+            offset = _HEADER.size
+            cc_lengths = struct.unpack_from(f"!{count}H", body, offset)
+            offset += 2 * count
+        except struct.error as e:
+            raise CodecError(f"Truncated binary message: {e}") from e
+        body = bytes(body)
+        data = {}
+        packed_content = flags & _FLAG_CONTENT_ZLIB
+        for field, length in zip(_BINARY_FIELDS, lengths):
+            if length == _NONE:
+                data[field] = None
+                continue
+            value = body[offset:offset + length]
+            offset += length
+            data[field] = value if packed_content and field == "content" else value.decode("utf-8")
+        cc_agents = []
+        for length in cc_lengths:
+            cc_agents.append(body[offset:offset + length].decode("utf-8"))
+            offset += length
+        if offset != len(body):
+            raise CodecError(f"Binary message length mismatch: expected {offset} bytes, got {len(body)}")
+        data["cc_agents"] = cc_agents
+        return data, flags
+
+
+class EnvelopeCodec(MessageCodec):
+    """
+    ルーティング情報のヘッダーと content の本体を分けた形式。
+
+        tag(1) | version(1) | ヘッダー長(u32) | ヘッダー (JSON) | 本体 (content)
+
+    ヘッダーには from_agent / to_agent / cc_agents / job_id などが入り、本体には
+    content を UTF-8 のまま (圧縮時は zlib、文字列以外は JSON で) 入れる。
+    受信側はヘッダーだけをパースし、content は実際に参照されたときに初めてデコードするため、
+    自分宛でないメッセージはほとんどコストがかからない。
+    """
+    name = "envelope"
+    tag = TAG_ENVELOPE
+
+    def _encode_body(self, msg):
+        header = {field: getattr(msg, field) for field in _ENVELOPE_HEADER_FIELDS}
+        content = msg.content
+        if isinstance(content, str):
+            body, compressed = self._pack_content(content)
+            if compressed:
+                header[CONTENT_ENCODING_KEY] = CONTENT_ENCODING_ZLIB
+        else:
+            body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+            header[CONTENT_ENCODING_KEY] = CONTENT_ENCODING_JSON
+        header_bytes = _dumps_json(header)
+        return b"".join((_U32.pack(len(header_bytes)), header_bytes, body))
+
+    @staticmethod
+    def split(body):
+        """本体 (タグとバージョンの後ろ) を (ヘッダーの辞書, content の memoryview) に分ける"""
+        body = memoryview(body)
+        try:
+            (length,) = _U32.unpack_from(body, 0)
+        except struct.error as e:
+            raise CodecError(f"Truncated envelope: {e}") from e
+        end = _U32.size + length
+        if end > len(body):
+            raise CodecError(f"Truncated envelope header: expected {length} bytes")
+        return _loads_json(body[_U32.size:end]), body[end:]
+
+    @staticmethod
+    def read_header(data):
+        """
+        envelope 形式の受信データからヘッダー (ルーティング情報) だけを読む。
+        content には触れないため、宛先によって読み飛ばすかどうかを決めるのに使える。
+        """
+        if not data or data[0] != TAG_ENVELOPE:
+            raise CodecError("Not an envelope payload")
+        _check_version(data)
+        return EnvelopeCodec.split(memoryview(data)[2:])[0]
+
+
+def _check_version(data):
+    if len(data) < 2:
+        raise CodecError("Truncated payload: missing wire format version")
+    if data[1] != WIRE_VERSION:
+        raise CodecError(f"Unsupported wire format version: {data[1]} (expected {WIRE_VERSION})")
+
+
+def _decode_utf8(data):
+    return str(data, "utf-8")
+
+
+def _dumps_json(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def _loads_json(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(bytes(body))
+
+
+def decode_message(data):
+    """受信したデータを Message にする (形式はデータから判別する)"""
+    return _DEFAULT_CODEC.decode(data)
+
+
+def decode_legacy_or_tagged(data):
+    """
+    コーデックを指定していないブローカーの受信用。従来形式 (タグなし) の JSON はこれまでどおり
+    文字列で返し、他のエージェントがコーデックで送ったタグ付きのデータは Message にして返す。
+    読めないデータは CodecError (ValueError) になる。
+    """
+    if isinstance(data, str):
+        return data
+    if data[:1] == b"{":
+        try:
+            return bytes(data).decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise CodecError(f"Invalid UTF-8 in JSON payload: {e}") from e
+    return decode_message(data)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, FastJsonCodec, BinaryCodec, EnvelopeCodec)}
+
+
+def get_codec(codec, **options):
+    """
+    コーデック名 ("json" / "fastjson" / "binary" / "envelope") またはインスタンスから MessageCodec を返す。
+    options (compress_threshold など) は名前で指定した場合のみ使われる。
+    """
+    if isinstance(codec, MessageCodec):
+        return codec
+    try:
+        return CODECS[codec](**options)
+    except KeyError:
+        raise ValueError(f"Unknown codec: {codec!r} (expected one of {tuple(CODECS)})") from None
+
+
+# decode_message() 用。圧縮された content の展開もこのコーデックの stats に記録される
+_DEFAULT_CODEC = JsonCodec()
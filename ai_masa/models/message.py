@@ -1,28 +1,144 @@
+import sys
+import time
 import uuid
 import json
 import datetime
 
+_intern = sys.intern
+
+
+def _intern_name(name):
+    # エージェント名や job_id は多数のメッセージで繰り返し使われるため、同じ文字列を共有する
+    return _intern(name) if type(name) is str else name
+
+
 class Message:
-    def __init__(self, from_agent="your_name", to_agent="agent_name or user", content="message", job_id="job_id_value", cc_agents=None, msg_id="message_id_value"):
-        self.message_id = msg_id or str(uuid.uuid4())
-        self.timestamp = datetime.datetime.now().isoformat()
-        self.from_agent = from_agent
-        self.to_agent = to_agent
-        self.cc_agents = cc_agents if cc_agents is not None else []
-        self.content = content
-        self.job_id = job_id
+    """
+    エージェント間で交換されるメッセージ。
+
+    多数のメッセージを保持しても軽くなるよう __slots__ を使い、
+    タイムスタンプは数値 (time.time()) で持つ。ISO形式の文字列 (timestamp) は
+    参照されたときに作る。受信したメッセージの timestamp は文字列のまま保持する。
+    message_id を指定しなかった場合は、最初に参照されたときに UUID を生成する。
+    JSON の形式 (to_dict / to_json) は従来どおり。
+    """
+    __slots__ = (
+        "_message_id", "_timestamp", "from_agent", "to_agent", "cc_agents", "job_id",
+        "_content", "_packed_content", "_unpack_content",
+    )
+
+    def __init__(self, from_agent="your_name", to_agent="agent_name or user", content="message", job_id="job_id_value", cc_agents=None, msg_id=None, timestamp=None):
+        self._message_id = msg_id or None
+        self._timestamp = timestamp or time.time()
+        self.from_agent = _intern_name(from_agent)
+        self.to_agent = _intern_name(to_agent)
+        self.cc_agents = [_intern_name(name) for name in cc_agents] if cc_agents else []
+        self.job_id = _intern_name(job_id)
+        self._content = content
+        self._packed_content = None
+        self._unpack_content = None
+
+    @property
+    def message_id(self):
+        if self._message_id is None:
+            self._message_id = str(uuid.uuid4())
+        return self._message_id
+
+    @message_id.setter
+    def message_id(self, value):
+        self._message_id = value or None
+
+    @property
+    def timestamp(self):
+        """ISO形式のタイムスタンプ文字列"""
+        timestamp = self._timestamp
+        if type(timestamp) is str:
+            return timestamp
+        return datetime.datetime.fromtimestamp(timestamp).isoformat()
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self._timestamp = value
+
+    @property
+    def created_at(self):
+        """作成時刻 (エポック秒)"""
+        timestamp = self._timestamp
+        if type(timestamp) is str:
+            return datetime.datetime.fromisoformat(timestamp).timestamp()
+        return timestamp
+
+    @property
+    def content(self):
+        # 圧縮されたまま受信した content は、最初に参照されたときに展開する。
+        # 同じメッセージを複数のスレッドが同時に読むことがあるため、属性は一度だけ読んでから使う
+        # (同時に読んだ場合は両方が展開するが、結果は同じ)。_content を入れてから _packed_content を消す
+        packed, unpack = self._packed_content, self._unpack_content
+        if packed is not None and unpack is not None:
+            content = unpack(packed)
+            if self._packed_content is packed:
+                self._content = content
+                self._packed_content = None
+            return content
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._packed_content = None
+        self._unpack_content = None
+
+    @property
+    def content_is_packed(self):
+        """content がまだ展開されていない (圧縮されたまま) かどうか"""
+        return self._packed_content is not None
+
+    @property
+    def content_size(self):
+        """content のおおよその大きさ (圧縮されたままなら展開せずに圧縮後の大きさを返す)"""
+        content = self._packed_content if self._packed_content is not None else self._content
+        return len(content) if isinstance(content, (str, bytes, memoryview)) else 0
+
+    def set_packed_content(self, packed, unpack):
+        """content を packed のまま保持し、参照されたときに unpack(packed) で展開する"""
+        self._content = None
+        self._unpack_content = unpack
+        self._packed_content = packed
+
+    def to_dict(self):
+        return {
+            "message_id": self.message_id,
+            "timestamp": self.timestamp,
+            "from_agent": self.from_agent,
+            "to_agent": self.to_agent,
+            "cc_agents": self.cc_agents,
+            "content": self.content,
+            "job_id": self.job_id,
+        }
 
     def to_json(self):
-        return json.dumps(self.__dict__, ensure_ascii=False)
+        return json.dumps(self.to_dict(), ensure_ascii=False)
 
     @staticmethod
-    def from_json(json_str):
-        data = json.loads(json_str)
+    def from_payload(payload):
+        """ブローカーから受け取ったデータ (JSON文字列 または Message) を Message にする"""
+        if isinstance(payload, Message):
+            return payload
+        return Message.from_json(payload)
+
+    @staticmethod
+    def from_dict(data):
+        """to_dict() の結果から Message を復元する (送信時のタイムスタンプも引き継ぐ)"""
         return Message(
             from_agent=data.get("from_agent"),
             to_agent=data.get("to_agent"),
             content=data.get("content"),
             job_id=data.get("job_id"),
             cc_agents=data.get("cc_agents"),
-            msg_id=data.get("message_id")
+            msg_id=data.get("message_id"),
+            timestamp=data.get("timestamp")
         )
+
+    @staticmethod
+    def from_json(json_str):
+        return Message.from_dict(json.loads(json_str))
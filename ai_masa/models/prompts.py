@@ -1,4 +1,5 @@
 # ai_masa/models/prompts.py
+from string import Formatter
 
 JSON_FORMAT_EXAMPLE = """
 {
@@ -37,4 +38,71 @@ From: {from_agent}
 Content: {content}
 
 [Your Response (JSON format)]
-"""
\ No newline at end of file
+"""
+
+# 会話を続けている (以前のプロンプトを覚えている) LLMセッションに送る、前回以降の差分だけのプロンプト
+DELTA_PROMPT_TEMPLATE = """
+[New Messages Since Your Last Response]
+{history}
+
+{observer_instructions}
+
+[Last Message]
+From: {from_agent}
+Content: {content}
+
+Decide the next action in the same way as before and respond in the same JSON format.
+
+[Your Response (JSON format)]
+"""
+
+# 履歴が予算 (history_budget) に収まらなかった場合に、{history} に入れる内容
+HISTORY_OMITTED_NOTE = (
+    "(Older messages were omitted to fit the context budget: kept the latest {kept_messages} messages "
+    "(~{kept_tokens} tokens), omitted {dropped_messages} earlier messages (~{dropped_tokens} tokens).)"
+)
+
+# 省いた古いメッセージの要約・関連する古いメッセージを添える場合の、履歴の各部分の見出し
+HISTORY_SECTION_TEMPLATE = "[{title}]\n{body}"
+HISTORY_SUMMARY_TITLE = "Summary of Earlier Messages"
+HISTORY_RELEVANT_TITLE = "Relevant Earlier Messages"
+HISTORY_LATEST_TITLE = "Latest Messages"
+
+class CompiledPrompt:
+    """
+    プロンプトのテンプレートを一度だけ解析しておき、固定の値 (名前やロールなど) を埋め込んだ
+    断片のリストにする。render() は残りの値を断片の間に入れて連結するだけなので、
+    呼び出しのたびに str.format でテンプレート全体を解析し直さずに済む。
+    str.format と同じ結果になる。
+    """
+    def __init__(self, template, **fixed):
+        parts = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if literal:
+                parts.append(literal)
+            if field is None:
+                continue
+            if field in fixed:
+                parts.append(Formatter().format_field(Formatter().convert_field(fixed[field], conversion), spec))
+            elif spec or conversion:
+                raise ValueError(f"Format spec is not supported for dynamic field {field!r}")
+            else:
+                parts.append(_Field(field))
+        # 隣り合う固定の文字列はまとめておく
+        self._parts = []
+        for part in parts:
+            if self._parts and type(part) is str and type(self._parts[-1]) is str:
+                self._parts[-1] += part
+            else:
+                self._parts.append(part)
+        self.fields = {part.name for part in self._parts if type(part) is _Field}
+
+    def render(self, **values):
+        return "".join([part if type(part) is str else str(values[part.name]) for part in self._parts])
+
+
+class _Field:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
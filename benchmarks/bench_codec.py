@@ -0,0 +1,69 @@
+"""
+Message のコーデック (従来の to_json / json / fastjson / binary) ごとの
+エンコード・デコード時間と送信バイト数を比較するベンチマーク。Redisは不要です。
+"+zlib" は compress_threshold を指定して content を圧縮した場合。
+"route" は宛先 (to_agent) を読むまで、"decode" は content を参照するまでの時間
+(自分宛でないメッセージのコストは "route" に相当する)。
+
+    python -m benchmarks.bench_codec [--iterations 20000] [--compress-threshold 1024]
+"""
+import argparse
+import time
+
+from ai_masa.models.codec import CODECS, get_codec, orjson
+from ai_masa.models.message import Message
+
+# ハートビート / 通常の会話 / LLMの長い応答 を想定したサイズ
+SIZES = {"heartbeat": 9, "chat": 400, "llm_response": 8000}
+
+
+def _sample(content_len):
+    content = ("エージェント間のメッセージ。" * (content_len // 14 + 1))[:content_len]
+    return Message("GeminiCliAgent", "User", content, job_id="job-7f3a9c", cc_agents=["LoggingAgent"],
+                   msg_id="0b9e7a3c-4d1f-4c1e-9a57-6a3e5d2c8f10")
+
+
+def _time(fn, arg, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_legacy(msg, iterations):
+    payload = msg.to_json()
+    decode_us = _time(Message.from_json, payload, iterations)
+    return _time(lambda m: m.to_json(), msg, iterations), decode_us, decode_us, len(payload.encode("utf-8"))
+
+
+def bench_codec(codec, msg, iterations):
+    payload = codec.encode(msg)
+    route = lambda data: codec.decode(data).to_agent
+    decode = lambda data: codec.decode(data).content
+    return (_time(codec.encode, msg, iterations), _time(route, payload, iterations),
+            _time(decode, payload, iterations), len(payload))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--compress-threshold", type=int, default=1024)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed: 'fastjson' falls back to the json module.")
+
+    print(f"{'size':<14} {'codec':<14} {'encode':>12} {'route':>12} {'decode':>12} {'bytes':>8}")
+    for label, content_len in SIZES.items():
+        msg = _sample(content_len)
+        results = [("to_json", *bench_legacy(msg, args.iterations))]
+        results += [(name, *bench_codec(get_codec(name), msg, args.iterations)) for name in CODECS]
+        if len(msg.content.encode("utf-8")) >= args.compress_threshold:
+            results += [(f"{name}+zlib", *bench_codec(get_codec(name, compress_threshold=args.compress_threshold),
+                                                     msg, args.iterations)) for name in CODECS]
+        for name, encode_us, route_us, decode_us, size in results:
+            print(f"{label:<14} {name:<14} {encode_us:>9.2f} us {route_us:>9.2f} us {decode_us:>9.2f} us {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
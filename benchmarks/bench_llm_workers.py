@@ -0,0 +1,65 @@
+"""
+LLMの呼び出しを、1回ごとにシェル経由でCLIを起動する方法 (従来の subprocess.run(shell=True)) と、
+常駐するワーカープロセス (LLMWorkerPool) に送る方法で比較するベンチマーク。Redisは不要です。
+
+CLI には benchmarks/fake_llm_cli.py を使い、起動時間 (--startup) と1回の応答時間 (--latency) を指定できる。
+
+    python -m benchmarks.bench_llm_workers [--calls 20] [--startup 0.3] [--latency 0]
+"""
+import argparse
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+from ai_masa.llm.worker_pool import LLMWorkerPool
+
+FAKE_CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_llm_cli.py")
+PROMPT = "You are a member of a multi-agent system.\n" * 50
+
+
+def bench_spawn(calls, options):
+    command = f"{shlex.quote(sys.executable)} {shlex.quote(FAKE_CLI)} {options}"
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        subprocess.run(command, input=PROMPT, capture_output=True, text=True, shell=True, check=True)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_pool(calls, options):
+    pool = LLMWorkerPool([sys.executable, FAKE_CLI, "--serve", *shlex.split(options)], size=1)
+    latencies = []
+    try:
+        for _ in range(calls):
+            start = time.perf_counter()
+            pool.call(PROMPT, "session")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        pool.close()
+    return latencies
+
+
+def _report(name, latencies):
+    # 1回目はプールのワーカー起動を含むため別に表示する
+    warm = sorted(latencies[1:]) or latencies
+    print(f"{name:<8} first {latencies[0] * 1000:8.1f} ms   warm p50 {warm[len(warm) // 2] * 1000:8.1f} ms   "
+          f"total {sum(latencies):6.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--startup", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    options = f"--startup {args.startup} --latency {args.latency}"
+
+    _report("spawn", bench_spawn(args.calls, options))
+    _report("pool", bench_pool(args.calls, options))
+
+
+if __name__ == "__main__":
+    main()
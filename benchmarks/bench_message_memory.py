@@ -0,0 +1,90 @@
+"""
+保持している Message 1件あたりのメモリ量と生成時間を、従来の (__dict__ を持ち、生成時に UUID と
+ISO形式のタイムスタンプを作る) 実装と比較するベンチマーク。Redisは不要です。
+
+  - created:  エージェントが作成したメッセージ (ID とタイムスタンプは Message が作る)
+  - received: 受信したメッセージ (ID とタイムスタンプの文字列を持っている)
+
+エージェント名・job_id・ID は受信時と同じく毎回別の文字列オブジェクトとして渡す。
+content は全件で同じオブジェクトを使うため、content 自体の大きさは含まれない。
+
+    python -m benchmarks.bench_message_memory [--count 1000000]
+"""
+import argparse
+import datetime
+import gc
+import time
+import tracemalloc
+import uuid
+
+from ai_masa.models.message import Message
+
+AGENTS = ["Chief", "Calculator", "Reviewer", "LoggingAgent", "User"]
+CONTENT = "shared content"
+TIMESTAMP = "2025-01-01T12:00:00.123456"
+
+
+class LegacyMessage:
+    """比較用: 変更前の Message と同じ持ち方"""
+    def __init__(self, from_agent, to_agent, content, job_id, cc_agents=None, msg_id=None, timestamp=None):
+        self.message_id = msg_id or str(uuid.uuid4())
+        # 変更前は受信したメッセージでも、復元時に現在時刻を入れ直していた
+        self.timestamp = datetime.datetime.now().isoformat()
+        self.from_agent = from_agent
+        self.to_agent = to_agent
+        self.cc_agents = cc_agents if cc_agents is not None else []
+        self.content = content
+        self.job_id = job_id
+
+
+def _fresh(text):
+    # デコード直後の文字列と同じく、毎回新しい str オブジェクトを作る
+    return "".join(list(text))
+
+
+def _build(cls, count, received):
+    retained = []
+    for i in range(count):
+        retained.append(cls(
+            _fresh(AGENTS[i % 5]), _fresh(AGENTS[(i + 1) % 5]), CONTENT,
+            job_id=_fresh(f"job-{i % 100}"), cc_agents=[_fresh(AGENTS[3])],
+            msg_id=f"{i:08x}-0000-4000-8000-000000000000" if received else None,
+            timestamp=_fresh(TIMESTAMP) if received else None
+        ))
+    return retained
+
+
+def measure(cls, count, received):
+    gc.collect()
+    start = time.perf_counter()
+    retained = _build(cls, count, received)
+    elapsed = time.perf_counter() - start
+    del retained
+    gc.collect()
+
+    tracemalloc.start()
+    retained = _build(cls, count, received)
+    # 保持しているメッセージ以外 (作業用の一時オブジェクト) が解放された後の量を測る
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # リスト自体 (1件8バイトのポインタ) は除く
+    per_message = (current - 8 * len(retained)) / count
+    del retained
+    return per_message, elapsed / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<10} {'implementation':<16} {'bytes/message':>14} {'construct':>12}")
+    for scenario in ("created", "received"):
+        for name, cls in (("legacy", LegacyMessage), ("Message", Message)):
+            per_message, construct_us = measure(cls, args.count, received=scenario == "received")
+            print(f"{scenario:<10} {name:<16} {per_message:>14.1f} {construct_us:>9.2f} us")
+
+
+if __name__ == "__main__":
+    main()
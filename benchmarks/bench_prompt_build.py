@@ -0,0 +1,76 @@
+"""
+会話が長くなったときの、1ターンあたりのプロンプト組み立て時間を比較するベンチマーク。Redisは不要です。
+
+  - full:        毎ターン履歴全体を描画し直し、PROMPT_TEMPLATE.format で組み立てる (変更前の実装)
+  - incremental: RenderedHistory で新しいメッセージの分だけ描画を足し、CompiledPrompt で組み立てる
+
+履歴が --turns 件になるまでメッセージを1件ずつ追加し、そのたびにプロンプトを作る。
+表示するのは、最後の --sample ターンの平均時間。
+
+    python -m benchmarks.bench_prompt_build [--turns 100 1000 5000] [--content-size 200]
+"""
+import argparse
+import time
+
+from ai_masa.context.rendered import RenderedHistory
+from ai_masa.context.store import InMemoryContextStore
+from ai_masa.models.message import Message
+from ai_masa.models.prompts import PROMPT_TEMPLATE, CompiledPrompt
+
+NAME = "Agent"
+ROLE_PROMPT = "あなたは優秀なアシスタントです。" * 20
+
+
+def _messages(turns, content_size):
+    return [Message(f"Agent{i % 3}", NAME, f"{i}:" + "x" * content_size, job_id="job") for i in range(turns)]
+
+
+def full(store, msg):
+    messages = store.get("job", [])
+    history = "\n".join([f"- {m.from_agent}: {m.content}" for m in messages])
+    return PROMPT_TEMPLATE.format(
+        name=NAME, role_prompt=ROLE_PROMPT, history=history,
+        from_agent=msg.from_agent, content=msg.content, observer_instructions=""
+    )
+
+
+def make_incremental(store):
+    rendered = RenderedHistory(store)
+    compiled = CompiledPrompt(PROMPT_TEMPLATE, name=NAME, role_prompt=ROLE_PROMPT)
+
+    def incremental(store, msg):
+        return compiled.render(
+            history=rendered.text("job"), from_agent=msg.from_agent, content=msg.content, observer_instructions=""
+        )
+    return incremental
+
+
+def measure(turns, content_size, sample, incremental):
+    store = InMemoryContextStore(max_messages_per_job=None)
+    build = make_incremental(store) if incremental else full
+    elapsed = 0.0
+    for i, msg in enumerate(_messages(turns, content_size)):
+        store.append("job", msg)
+        start = time.perf_counter()
+        build(store, msg)
+        if i >= turns - sample:
+            elapsed += time.perf_counter() - start
+    return elapsed / min(sample, turns) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--content-size", type=int, default=200)
+    parser.add_argument("--sample", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'turns':>6} {'full':>12} {'incremental':>14}")
+    for turns in args.turns:
+        full_us = measure(turns, args.content_size, args.sample, incremental=False)
+        incremental_us = measure(turns, args.content_size, args.sample, incremental=True)
+        print(f"{turns:>6} {full_us:>9.1f} us {incremental_us:>11.1f} us")
+
+
+if __name__ == "__main__":
+    main()
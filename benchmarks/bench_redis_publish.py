@@ -0,0 +1,82 @@
+"""
+RedisBroker の送信方法 (publish / publish_many / outbox) ごとのスループットと、
+outbox のフラッシュ待ち時間を比較するベンチマーク。
+※ Redisサーバーが localhost:6379 で動いている必要があります
+
+    python -m benchmarks.bench_redis_publish [--messages 20000] [--batch 100] [--delay 0.005]
+"""
+import argparse
+import json
+import time
+import uuid
+
+from ai_masa.comms.redis_broker import RedisBroker
+
+
+def _payloads(count):
+    return [json.dumps({"from_agent": "Bench", "to_agent": "Sink", "content": f"message {i}", "cc_agents": []})
+            for i in range(count)]
+
+
+def bench_publish(host, payloads):
+    broker = RedisBroker(host=host, channel=f"ai_masa_bench_{uuid.uuid4().hex[:8]}")
+    broker.connect()
+    start = time.perf_counter()
+    for payload in payloads:
+        broker.publish(payload)
+    elapsed = time.perf_counter() - start
+    broker.disconnect()
+    return elapsed, None
+
+
+def bench_publish_many(host, payloads, batch):
+    broker = RedisBroker(host=host, channel=f"ai_masa_bench_{uuid.uuid4().hex[:8]}")
+    broker.connect()
+    start = time.perf_counter()
+    for i in range(0, len(payloads), batch):
+        broker.publish_many(payloads[i:i + batch])
+    elapsed = time.perf_counter() - start
+    broker.disconnect()
+    return elapsed, None
+
+
+def bench_outbox(host, payloads, batch, delay):
+    broker = RedisBroker(host=host, channel=f"ai_masa_bench_{uuid.uuid4().hex[:8]}",
+                         outbox=True, outbox_max_batch=batch, outbox_max_delay=delay)
+    broker.connect()
+    start = time.perf_counter()
+    for payload in payloads:
+        broker.publish(payload)
+    # 切断時に残りが送信されるため、ここまでを計測する
+    broker.disconnect()
+    elapsed = time.perf_counter() - start
+    return elapsed, broker.outbox.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    payloads = _payloads(args.messages)
+    results = [
+        ("publish", *bench_publish(args.host, payloads)),
+        (f"publish_many({args.batch})", *bench_publish_many(args.host, payloads, args.batch)),
+        (f"outbox({args.batch}, {args.delay * 1000:.1f}ms)", *bench_outbox(args.host, payloads, args.batch, args.delay)),
+    ]
+
+    print(f"\n{'method':<28} {'throughput':>16}")
+    for name, elapsed, _ in results:
+        print(f"{name:<28} {len(payloads) / elapsed:>12.0f} msg/s")
+
+    stats = results[-1][2]
+    if stats and stats["flushes"]:
+        print(f"\noutbox: {stats['flushes']} flushes, avg batch {stats['messages'] / stats['flushes']:.1f}, "
+              f"avg wait {stats['total_wait'] / stats['flushes'] * 1000:.3f}ms, max wait {stats['max_wait'] * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+RedisBroker の受信ループ (poll / event) のレイテンシとスループットを比較するベンチマーク。
+※ Redisサーバーが localhost:6379 で動いている必要があります
+
+    python -m benchmarks.bench_redis_subscribe [--messages 5000] [--pings 200]
+"""
+import argparse
+import statistics
+import threading
+import time
+import uuid
+
+from ai_masa.comms.redis_broker import RedisBroker
+
+
+class _Subscriber:
+    def __init__(self, mode, channel, host):
+        self.broker = RedisBroker(host=host, channel=channel, receive_mode=mode)
+        self.broker.connect()
+        self.shutdown_event = threading.Event()
+        self.received = 0
+        self.latencies = []
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.broker.subscribe, args=(self._on_message, self.shutdown_event), daemon=True)
+
+    def _on_message(self, data):
+        sent_at = float(data)
+        now = time.perf_counter()
+        with self.cond:
+            self.received += 1
+            self.latencies.append(now - sent_at)
+            self.cond.notify_all()
+
+    def wait_for(self, count, timeout=30.0):
+        deadline = time.perf_counter() + timeout
+        with self.cond:
+            while self.received < count:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def start(self):
+        self.thread.start()
+        time.sleep(0.3)  # サブスクライブ完了待ち
+
+    def stop(self):
+        self.shutdown_event.set()
+        self.thread.join(timeout=3)
+        self.broker.disconnect()
+
+
+def run_mode(mode, host, messages, pings):
+    channel = f"ai_masa_bench_{uuid.uuid4().hex[:8]}"
+    publisher = RedisBroker(host=host, channel=channel)
+    publisher.connect()
+    sub = _Subscriber(mode, channel, host)
+    sub.start()
+    try:
+        # 1. レイテンシ: 1件送って受信を待つ、を繰り返す
+        for i in range(pings):
+            publisher.publish(repr(time.perf_counter()))
+            sub.wait_for(i + 1)
+        ping_latencies = list(sub.latencies)
+
+        # 2. スループット: 連続送信して全件受信までの時間を測る
+        base = sub.received
+        start = time.perf_counter()
+        for _ in range(messages):
+            publisher.publish(repr(time.perf_counter()))
+        completed = sub.wait_for(base + messages, timeout=messages * 0.02 + 10)
+        elapsed = time.perf_counter() - start
+        received = sub.received - base
+    finally:
+        sub.stop()
+        publisher.disconnect()
+
+    ping_latencies.sort()
+    return {
+        "mode": mode,
+        "p50_ms": statistics.median(ping_latencies) * 1000,
+        "p99_ms": ping_latencies[int(len(ping_latencies) * 0.99) - 1] * 1000,
+        "throughput": received / elapsed,
+        "completed": completed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--pings", type=int, default=200)
+    args = parser.parse_args()
+
+    results = [run_mode(mode, args.host, args.messages, args.pings) for mode in ("poll", "event")]
+
+    print(f"\n{'mode':<6} {'p50 latency':>12} {'p99 latency':>12} {'throughput':>16}")
+    for r in results:
+        note = "" if r["completed"] else "  (timed out)"
+        print(f"{r['mode']:<6} {r['p50_ms']:>10.3f}ms {r['p99_ms']:>10.3f}ms {r['throughput']:>12.0f} msg/s{note}")
+
+
+if __name__ == "__main__":
+    main()
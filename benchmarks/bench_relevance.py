@@ -0,0 +1,59 @@
+"""
+RelevanceIndex (ジョブごとの BM25 転置インデックス) の検索時間を計測するベンチマーク。Redisは不要です。
+
+語の出現頻度が Zipf 分布に従うメッセージを --messages 件持つジョブを作り、
+同じ分布から作った問い合わせで、直近 --tail 件より前のメッセージを検索する。
+インデックスの作成 (初回の検索時にまとめて取り込む) と、その後の1件追加+検索の時間も表示する。
+
+    python -m benchmarks.bench_relevance [--messages 50000] [--queries 200]
+"""
+import argparse
+import random
+import time
+
+from ai_masa.context.relevance import RelevanceIndex
+from ai_masa.context.store import InMemoryContextStore
+from ai_masa.models.message import Message
+
+VOCABULARY = [f"w{i}" for i in range(20000)]
+WEIGHTS = [1 / (i + 1) for i in range(len(VOCABULARY))]
+COMMON = "the a is of and to in that it for".split()
+
+
+def _text(rng, words=30):
+    return " ".join(rng.choices(VOCABULARY, WEIGHTS, k=words) + rng.choices(COMMON, k=10))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--tail", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    store = InMemoryContextStore(max_messages_per_job=None, max_bytes=None)
+    for _ in range(args.messages):
+        store.append("job", Message("A", "B", _text(rng), job_id="job"))
+    index = RelevanceIndex(store)
+
+    start = time.perf_counter()
+    index.search("job", "warmup")
+    print(f"index build:        {time.perf_counter() - start:.2f} s ({args.messages} messages)")
+
+    queries = [_text(rng) for _ in range(args.queries)]
+    before_seq = args.messages - args.tail
+    start = time.perf_counter()
+    for query in queries:
+        index.search("job", query, before_seq=before_seq)
+    print(f"search:             {(time.perf_counter() - start) / args.queries * 1e6:.1f} us/query")
+
+    start = time.perf_counter()
+    for query in queries:
+        store.append("job", Message("A", "B", query, job_id="job"))
+        index.search("job", query, before_seq=before_seq)
+    print(f"append + search:    {(time.perf_counter() - start) / args.queries * 1e6:.1f} us/query")
+
+
+if __name__ == "__main__":
+    main()
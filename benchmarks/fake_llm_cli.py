@@ -0,0 +1,44 @@
+"""
+ベンチマーク用の偽の LLM CLI。起動時に --startup 秒待ち (Node 製 CLI などの起動時間の代わり)、
+1回の呼び出しに --latency 秒かかったことにして、固定の JSON 応答を返す。
+
+    python benchmarks/fake_llm_cli.py [--startup 0.3] [--latency 0]            # 1回ごとに起動する使い方
+    python benchmarks/fake_llm_cli.py --serve [--startup 0.3] [--latency 0]    # LLMWorkerPool のワーカーとして常駐する
+"""
+import argparse
+import json
+import sys
+import time
+
+RESPONSE = json.dumps({"to_agent": "User", "content": "fake response"})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--startup", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    time.sleep(args.startup)
+
+    if not args.serve:
+        sys.stdin.read()
+        time.sleep(args.latency)
+        print(RESPONSE)
+        return
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request.get("op") == "ping":
+            output = "pong"
+        elif request.get("op") == "create_session":
+            output = "fake-session"
+        else:
+            time.sleep(args.latency)
+            output = RESPONSE
+        sys.stdout.write(json.dumps({"id": request["id"], "output": output}) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
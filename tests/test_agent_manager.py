@@ -36,6 +36,8 @@ class TestAgentManagerAndHeartbeat(unittest.TestCase):
     def test_base_agent_heartbeat(self, MockTimer, MockRedisBroker):
         """BaseAgentが定期的にハートビートを送信するかテスト"""
         mock_broker_instance = MockRedisBroker.return_value
+        # MagicMock の属性は真になるため、RedisBroker と同じく JSON でやり取りする設定を明示する
+        mock_broker_instance.passes_messages = False
         
         self.agent = BaseAgent(name="TestAgent", description="A test agent")
         
@@ -99,6 +101,7 @@ class TestAgentManagerAndHeartbeat(unittest.TestCase):
     def test_agent_manager_status_query(self, MockRedisBroker):
         """AgentManagerがステータス問い合わせに応答するかテスト"""
         mock_broker_instance = MockRedisBroker.return_value
+        mock_broker_instance.passes_messages = False
         self.manager = AgentManager()
         self.manager.active_agents["AgentOne"] = time.time() - 10
         self.manager.active_agents["AgentTwo"] = time.time() - 20
@@ -0,0 +1,170 @@
+import unittest
+import asyncio
+import json
+import threading
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from ai_masa.agents.async_base_agent import AsyncBaseAgent
+from ai_masa.comms.broker_base import AsyncMessageBroker
+from ai_masa.models.message import Message
+
+
+class FakeAsyncBroker(AsyncMessageBroker):
+    """テスト用: 事前に積んだメッセージを配送し、publishされた内容を記録する"""
+    def __init__(self, incoming):
+        self.incoming = list(incoming)
+        self.published = []
+        self.connected = False
+
+    async def connect(self):
+        self.connected = True
+
+    async def publish(self, message_json, recipients=None):
+        self.published.append(json.loads(message_json))
+
+    async def subscribe(self, callback, shutdown_event=None, agent_name=None, firehose=False):
+        for payload in self.incoming:
+            callback(payload)
+        while not shutdown_event.is_set():
+            await asyncio.sleep(0.001)
+
+    async def disconnect(self):
+        self.connected = False
+
+
+def _fake_process(stdout, returncode=0, gate=None, log=None, name=None):
+    """create_subprocess_exec が返すプロセスの代わり"""
+    process = MagicMock()
+    process.returncode = returncode
+
+    async def communicate(input_bytes):
+        if log is not None:
+            log.append(("start", name))
+        if gate is not None:
+            await gate.wait()
+        if log is not None:
+            log.append(("end", name))
+        return stdout.encode(), b""
+    process.communicate = communicate
+    return process
+
+
+class TestAsyncBaseAgent(unittest.IsolatedAsyncioTestCase):
+
+    async def _run_until(self, agent, predicate, timeout=2):
+        runner = asyncio.create_task(agent.run())
+        try:
+            deadline = asyncio.get_running_loop().time() + timeout
+            while not predicate() and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(0.005)
+        finally:
+            agent.shutdown()
+            await runner
+
+    @patch('builtins.print')
+    async def test_message_creates_session_invokes_llm_and_replies(self, mock_print):
+        trigger = Message("User", "AsyncAgent", "こんにちは", job_id="job-1").to_json()
+        broker = FakeAsyncBroker([trigger])
+        agent = AsyncBaseAgent("AsyncAgent", "Test Role", llm_command="llm --resume {session_id}",
+                               llm_session_create_command="llm --new", start_heartbeat=False, broker=broker)
+
+        reply = json.dumps({"to_agent": "User", "content": "やあ"})
+        spawn = AsyncMock(side_effect=[_fake_process("session-9\n"), _fake_process(reply)])
+        with patch('asyncio.create_subprocess_exec', spawn):
+            await self._run_until(agent, lambda: broker.published)
+
+        self.assertEqual(spawn.call_args_list[0].args, ("llm", "--new"))
+        self.assertEqual(spawn.call_args_list[1].args, ("llm", "--resume", "session-9"))
+        self.assertEqual(agent.job_sessions["job-1"], "session-9")
+        self.assertEqual(broker.published[0]["content"], "やあ")
+        self.assertEqual(broker.published[0]["to_agent"], "User")
+        self.assertFalse(broker.connected)
+
+    @patch('builtins.print')
+    async def test_same_job_is_sequential_and_jobs_run_concurrently(self, mock_print):
+        incoming = [
+            Message("User", "AsyncAgent", "a1", job_id="job-a").to_json(),
+            Message("User", "AsyncAgent", "a2", job_id="job-a").to_json(),
+            Message("User", "AsyncAgent", "b1", job_id="job-b").to_json(),
+        ]
+        broker = FakeAsyncBroker(incoming)
+        agent = AsyncBaseAgent("AsyncAgent", "Test Role", llm_command="llm {session_id}",
+                               start_heartbeat=False, broker=broker)
+        agent.job_sessions.update({"job-a": "s-a", "job-b": "s-b"})
+
+        gate = asyncio.Event()
+        log = []
+        reply = json.dumps({"to_agent": "User", "content": "ok"})
+        names = iter(["a1", "b1", "a2"])
+
+        async def spawn(*args, **kwargs):
+            return _fake_process(reply, gate=gate, log=log, name=next(names))
+
+        with patch('asyncio.create_subprocess_exec', side_effect=spawn):
+            async def release_later():
+                # job-a の1通目と job-b が同時に走っていることを確認してから解放する
+                while len(log) < 2:
+                    await asyncio.sleep(0.001)
+                self.assertEqual(sorted(log), [("start", "a1"), ("start", "b1")])
+                gate.set()
+            releaser = asyncio.create_task(release_later())
+            await self._run_until(agent, lambda: len(broker.published) == 3)
+            await releaser
+
+        # job-a の2通目は1通目が終わってから始まる
+        self.assertLess(log.index(("end", "a1")), log.index(("start", "a2")))
+        self.assertEqual(agent._job_locks, {})
+
+    @patch('builtins.print')
+    async def test_sync_think_and_respond_override_still_works(self, mock_print):
+        class SyncOverrideAgent(AsyncBaseAgent):
+            def think_and_respond(self, trigger_msg, job_id, is_observer=False):
+                self.thread = threading.current_thread()
+                self.broadcast(trigger_msg.from_agent, f"echo: {trigger_msg.content}", job_id=job_id)
+
+        broker = FakeAsyncBroker([Message("User", "SyncAgent", "ping", job_id="job-s").to_json()])
+        agent = SyncOverrideAgent("SyncAgent", "Test Role", start_heartbeat=False, broker=broker)
+
+        await self._run_until(agent, lambda: broker.published)
+
+        self.assertIsNot(agent.thread, threading.main_thread())
+        self.assertEqual(broker.published[0]["content"], "echo: ping")
+
+    @patch('builtins.print')
+    async def test_blocking_io_runs_off_the_event_loop(self, mock_print):
+        broker = FakeAsyncBroker([Message("User", "AsyncAgent", "hi", job_id="job-1").to_json()])
+        agent = AsyncBaseAgent("AsyncAgent", "Test Role", llm_command="llm {session_id}",
+                               start_heartbeat=False, broker=broker)
+        agent.job_sessions["job-1"] = "s-1"
+        threads = {}
+
+        def record(name, fn):
+            def wrapper(*args, **kwargs):
+                threads[name] = threading.current_thread()
+                return fn(*args, **kwargs)
+            return wrapper
+
+        agent._compose_prompt = record("build_prompt", agent._compose_prompt)
+        agent._cached_llm_response = record("cache", agent._cached_llm_response)
+        agent.context.append = record("context", agent.context.append)
+        agent.job_sessions.__class__ = type("RecordingRegistry", (type(agent.job_sessions),), {
+            "__getitem__": record("registry", type(agent.job_sessions).__getitem__),
+        })
+
+        reply = json.dumps({"to_agent": "User", "content": "ok"})
+        with patch('asyncio.create_subprocess_exec', AsyncMock(return_value=_fake_process(reply))):
+            await self._run_until(agent, lambda: broker.published)
+
+        self.assertEqual(set(threads), {"build_prompt", "cache", "registry", "context"})
+        for thread in threads.values():
+            self.assertIsNot(thread, threading.main_thread())
+
+    def test_llm_workers_does_not_start_a_dispatcher(self):
+        agent = AsyncBaseAgent("AsyncAgent", "Test Role", start_heartbeat=False,
+                               broker=FakeAsyncBroker([]), llm_workers=4, llm_timeout=5)
+        self.assertIsNone(agent.dispatcher)
+        self.assertEqual(agent.llm_executor.max_concurrency, 4)
+        agent.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
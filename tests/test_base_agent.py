@@ -5,7 +5,7 @@ import subprocess
 
 from ai_masa.agents.base_agent import BaseAgent
 from ai_masa.models.message import Message
-from ai_masa.models.prompts import OBSERVER_INSTRUCTION
+from ai_masa.models.prompts import OBSERVER_INSTRUCTION, PROMPT_TEMPLATE
 
 class TestBaseAgentWithSession(unittest.TestCase):
 
@@ -14,6 +14,8 @@ class TestBaseAgentWithSession(unittest.TestCase):
         self.mock_datetime_patcher = patch('datetime.datetime')
         mock_dt = self.mock_datetime_patcher.start()
         mock_dt.now.return_value.isoformat.return_value = "2025-12-04T00:00:00.000000"
+        # Message はタイムスタンプを数値で持ち、参照されたときに fromtimestamp() で文字列にする
+        mock_dt.fromtimestamp.return_value.isoformat.return_value = "2025-12-04T00:00:00.000000"
 
     def tearDown(self):
         self.mock_datetime_patcher.stop()
@@ -22,6 +24,8 @@ class TestBaseAgentWithSession(unittest.TestCase):
     @patch('ai_masa.agents.base_agent.RedisBroker')
     def test_new_job_creates_session_and_responds(self, MockRedisBroker, mock_subprocess_run):
         mock_broker_instance = MockRedisBroker.return_value
+        # MagicMock の属性は真になるため、RedisBroker と同じく JSON でやり取りする設定を明示する
+        mock_broker_instance.passes_messages = False
         llm_response_json = json.dumps({"to_agent": "User", "content": "初めまして、TestAgentです。"})
         mock_subprocess_run.side_effect = [
             subprocess.CompletedProcess(args='create_session_cmd', returncode=0, stdout='session-12345', stderr=''),
@@ -43,6 +47,7 @@ class TestBaseAgentWithSession(unittest.TestCase):
     @patch('ai_masa.agents.base_agent.RedisBroker')
     def test_existing_job_uses_same_session(self, MockRedisBroker, mock_subprocess_run):
         mock_broker_instance = MockRedisBroker.return_value
+        mock_broker_instance.passes_messages = False
         llm_response_json = json.dumps({"to_agent": "User", "content": "はい、同じセッションで応答しています。"})
         mock_subprocess_run.return_value = subprocess.CompletedProcess(args='gemini -r session-existing', returncode=0, stdout=llm_response_json, stderr='')
         agent = BaseAgent("TestAgent", "あなたはテストエージェントです。", user_lang='Japanese', llm_command="gemini -r {session_id}", start_heartbeat=False)
@@ -94,6 +99,7 @@ class TestBaseAgentWithSession(unittest.TestCase):
     def test_multi_agent_conversation_with_cc_context(self, MockRedisBroker, mock_subprocess_run):
         job_id = "job-nabla-chan"
         mock_broker_instance = MockRedisBroker.return_value
+        mock_broker_instance.passes_messages = False
 
         def mock_llm_logic(args, input, **kwargs):
             prompt = input
@@ -235,5 +241,194 @@ class TestBaseAgentWithSession(unittest.TestCase):
             mock_subprocess_run.assert_not_called()
             mock_broker_instance.publish.assert_not_called()
 
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_broadcast_passes_recipients_to_broker(self, MockRedisBroker):
+        mock_broker_instance = MockRedisBroker.return_value
+        mock_broker_instance.passes_messages = False
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, routing='addressed')
+        MockRedisBroker.assert_called_once_with(host='localhost', routing='addressed')
+
+        agent.broadcast(target="User", content="hello", cc=["Observer"], job_id="job-route")
+
+        self.assertEqual(mock_broker_instance.publish.call_args.kwargs['recipients'], ["User", "Observer"])
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_redelivered_message_is_processed_once(self, MockRedisBroker, mock_subprocess_run):
+        mock_broker_instance = MockRedisBroker.return_value
+        llm_response_json = json.dumps({"to_agent": "User", "content": "一度だけ応答します。"})
+        mock_subprocess_run.return_value = subprocess.CompletedProcess(args='gemini', returncode=0, stdout=llm_response_json, stderr='')
+        agent = BaseAgent("TestAgent", "Test Role", llm_command="gemini -r {session_id}", start_heartbeat=False)
+        agent.job_sessions['job-dup'] = 'session-dup'
+
+        payload = Message("User", "TestAgent", "こんにちは", job_id="job-dup").to_json()
+        agent._on_message_received(payload)
+        agent._on_message_received(payload)
+
+        mock_subprocess_run.assert_called_once()
+        mock_broker_instance.publish.assert_called_once()
+        self.assertEqual(len(agent.context['job-dup']), 1)
+        self.assertEqual(agent.seen_ids.stats["duplicates"], 1)
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_legacy_placeholder_ids_are_not_deduplicated(self, MockRedisBroker, mock_subprocess_run):
+        mock_subprocess_run.return_value = subprocess.CompletedProcess(args='gemini', returncode=0, stdout='{}', stderr='')
+        agent = BaseAgent("TestAgent", "Test Role", llm_command="gemini -r {session_id}", start_heartbeat=False)
+        agent.job_sessions['job-legacy'] = 'session-legacy'
+
+        for content in ("1", "2"):
+            agent._on_message_received(Message("User", "TestAgent", content, job_id="job-legacy", msg_id="message_id_value").to_json())
+
+        self.assertEqual(mock_subprocess_run.call_count, 2)
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_participating_policy_records_only_joined_jobs(self, MockRedisBroker, mock_subprocess_run):
+        mock_subprocess_run.return_value = subprocess.CompletedProcess(args='gemini', returncode=0, stdout='{}', stderr='')
+        agent = BaseAgent("TestAgent", "Test Role", llm_command="gemini -r {session_id}", start_heartbeat=False,
+                          record_policy='participating')
+        agent.job_sessions['job-p'] = 'session-p'
+
+        agent._on_message_received(Message("A", "B", "関係ない会話", job_id="job-other").to_json())
+        agent._on_message_received(Message("A", "B", "参加前", job_id="job-p").to_json())
+        self.assertNotIn("job-other", agent.context)
+        self.assertNotIn("job-p", agent.context)
+
+        agent._on_message_received(Message("A", "TestAgent", "お願いします", job_id="job-p").to_json())
+        agent._on_message_received(Message("B", "A", "参加後", job_id="job-p").to_json())
+        self.assertEqual([m.content for m in agent.context["job-p"]], ["お願いします", "参加後"])
+        mock_subprocess_run.assert_called_once()
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_participating_policy_backfills_from_history_source(self, MockRedisBroker, mock_subprocess_run):
+        mock_subprocess_run.return_value = subprocess.CompletedProcess(args='gemini', returncode=0, stdout='{}', stderr='')
+        trigger = Message("A", "TestAgent", "お願いします", job_id="job-h")
+        history_source = MagicMock()
+        history_source.fetch.return_value = [
+            Message("A", "B", "参加前の会話", job_id="job-h"),
+            Message("TestAgent", "A", "自分の過去の発言", job_id="job-h"),
+            Message.from_dict(trigger.to_dict()),
+        ]
+        agent = BaseAgent("TestAgent", "Test Role", llm_command="gemini -r {session_id}", start_heartbeat=False,
+                          record_policy='participating', history_source=history_source)
+        agent.job_sessions['job-h'] = 'session-h'
+
+        agent._on_message_received(trigger.to_json())
+
+        history_source.fetch.assert_called_once_with("job-h")
+        self.assertEqual([m.content for m in agent.context["job-h"]], ["参加前の会話", "お願いします"])
+        self.assertIn("参加前の会話", mock_subprocess_run.call_args.kwargs['input'])
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_unknown_record_policy_is_rejected(self, MockRedisBroker):
+        with self.assertRaises(ValueError):
+            BaseAgent("TestAgent", "Test Role", start_heartbeat=False, record_policy='some')
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_incremental_prompt_matches_full_rebuild(self, MockRedisBroker):
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False)
+        for i in range(3):
+            msg = Message("User", "TestAgent", f"メッセージ {i}", job_id="job-p")
+            agent.context.append("job-p", msg)
+            for is_observer in (False, True):
+                expected = PROMPT_TEMPLATE.format(
+                    name=agent.name, role_prompt=agent.role_prompt,
+                    history="\n".join([f"- {m.from_agent}: {m.content}" for m in agent.context["job-p"]]),
+                    from_agent=msg.from_agent, content=msg.content,
+                    observer_instructions=OBSERVER_INSTRUCTION if is_observer else "",
+                )
+                self.assertEqual(agent._build_prompt(msg, "job-p", is_observer=is_observer), expected)
+        # role_prompt が変わったらテンプレートも作り直される
+        agent.role_prompt = "New Role"
+        self.assertIn("New Role", agent._build_prompt(msg, "job-p"))
+
+    def _delta_agent(self):
+        agent = BaseAgent("TestAgent", "Test Role", llm_command="llm --resume {session_id}", start_heartbeat=False, delta_prompts=True)
+        agent.job_sessions["job-d"] = "session-1"
+        return agent
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_delta_prompts_send_only_new_messages(self, MockRedisBroker, mock_subprocess_run):
+        mock_subprocess_run.return_value = subprocess.CompletedProcess(args='', returncode=0, stdout='{"to_agent": ""}', stderr='')
+        agent = self._delta_agent()
+        agent._on_message_received(Message("Other", "Someone", "最初の話題", job_id="job-d").to_json())
+        agent._on_message_received(Message("User", "TestAgent", "一つ目の質問", job_id="job-d").to_json())
+        first_prompt = mock_subprocess_run.call_args.kwargs['input']
+        self.assertIn("Test Role", first_prompt)
+        self.assertIn("最初の話題", first_prompt)
+
+        agent._on_message_received(Message("User", "TestAgent", "二つ目の質問", job_id="job-d").to_json())
+        second_prompt = mock_subprocess_run.call_args.kwargs['input']
+        self.assertNotIn("Test Role", second_prompt)
+        self.assertNotIn("最初の話題", second_prompt)
+        self.assertNotIn("一つ目の質問", second_prompt)
+        self.assertIn("- User: 二つ目の質問", second_prompt)
+        self.assertEqual((agent.prompt_stats["full"], agent.prompt_stats["delta"]), (1, 1))
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_delta_prompts_fall_back_to_full_prompt(self, MockRedisBroker, mock_subprocess_run):
+        mock_subprocess_run.return_value = subprocess.CompletedProcess(args='', returncode=0, stdout='{"to_agent": ""}', stderr='')
+        agent = self._delta_agent()
+        agent._on_message_received(Message("User", "TestAgent", "一つ目", job_id="job-d").to_json())
+
+        # セッションが変わった場合
+        agent.job_sessions["job-d"] = "session-2"
+        agent._on_message_received(Message("User", "TestAgent", "二つ目", job_id="job-d").to_json())
+        self.assertIn("一つ目", mock_subprocess_run.call_args.kwargs['input'])
+
+        # LLMの呼び出しが失敗した場合
+        mock_subprocess_run.side_effect = subprocess.CalledProcessError(1, 'llm', stderr='session not found')
+        agent._on_message_received(Message("User", "TestAgent", "三つ目", job_id="job-d").to_json())
+        mock_subprocess_run.side_effect = None
+        agent._on_message_received(Message("User", "TestAgent", "四つ目", job_id="job-d").to_json())
+        prompt = mock_subprocess_run.call_args.kwargs['input']
+        self.assertIn("Test Role", prompt)
+        self.assertIn("一つ目", prompt)
+
+        # 履歴ごと捨てられた場合
+        agent.context.discard("job-d")
+        self.assertNotIn("job-d", agent._prompt_cursors)
+        self.assertEqual((agent.prompt_stats["full"], agent.prompt_stats["delta"]), (3, 1))
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_history_budget_keeps_recent_messages_with_summary(self, MockRedisBroker):
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, history_budget=20)
+        agent._summaries.background = False
+        for i in range(10):
+            agent.context.append("job-b", Message("User", "TestAgent", f"message number {i}", job_id="job-b"))
+        trigger = agent.context["job-b"][-1]
+        with patch('builtins.print'):
+            prompt = agent._build_prompt(trigger, "job-b")
+        self.assertIn("- User: message number 9", prompt)
+        self.assertNotIn("message number 0", prompt)
+        self.assertIn("omitted 7 earlier messages", prompt)
+        self.assertEqual(agent.prompt_stats["windowed"], 1)
+
+        # 2回目からは、省いたメッセージの要約が添えられる
+        with patch('builtins.print'):
+            prompt = agent._build_prompt(trigger, "job-b")
+        self.assertIn("[Summary of Earlier Messages]\n- User: message number 0", prompt)
+        self.assertIn("- User: message number 9", prompt)
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_history_budget_includes_relevant_older_messages(self, MockRedisBroker):
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, history_budget=40,
+                          history_summarizer=None, relevant_history_share=0.5)
+        agent.context.append("job-r", Message("User", "TestAgent", "the deploy key is kept in vault", job_id="job-r"))
+        for i in range(20):
+            agent.context.append("job-r", Message("User", "TestAgent", f"chatter {i}", job_id="job-r"))
+        trigger = Message("User", "TestAgent", "where is the deploy key?", job_id="job-r")
+        agent.context.append("job-r", trigger)
+        with patch('builtins.print'):
+            prompt = agent._build_prompt(trigger, "job-r")
+        self.assertIn("[Relevant Earlier Messages]\n- User: the deploy key is kept in vault", prompt)
+        self.assertIn("[Latest Messages]", prompt)
+        self.assertIn("- User: where is the deploy key?", prompt)
+        self.assertNotIn("chatter 0", prompt)
+
 if __name__ == '__main__':
     unittest.main()
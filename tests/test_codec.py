@@ -0,0 +1,206 @@
+import json
+import unittest
+
+from ai_masa.models.message import Message
+from ai_masa.models.codec import (
+    CODECS, BinaryCodec, CodecError, EnvelopeCodec, FastJsonCodec, JsonCodec, MessageCodec,
+    TAG_BINARY, TAG_ENVELOPE, TAG_JSON, WIRE_VERSION, decode_message, get_codec,
+)
+
+
+def _sample():
+    msg = Message("Chief", "Calculator", "2 + 3 は？ ☕", job_id="job-1", cc_agents=["Logger", "Auditor"], msg_id="m-1")
+    msg.timestamp = "2025-01-01T12:00:00.000001"
+    return msg
+
+
+class TestMessageCodecs(unittest.TestCase):
+
+    def assertSameMessage(self, actual, expected):
+        self.assertEqual(actual.to_dict(), expected.to_dict())
+
+    def test_round_trip_for_every_codec(self):
+        """各コーデックで encode したものを decode すると、タイムスタンプも含めて元に戻る"""
+        for name in CODECS:
+            with self.subTest(codec=name):
+                codec = get_codec(name)
+                self.assertSameMessage(codec.decode(codec.encode(_sample())), _sample())
+
+    def test_payload_starts_with_format_tag(self):
+        self.assertEqual(JsonCodec().encode(_sample())[0], TAG_JSON)
+        self.assertEqual(FastJsonCodec().encode(_sample())[0], TAG_JSON)
+        self.assertEqual(BinaryCodec().encode(_sample())[0], TAG_BINARY)
+        self.assertEqual(EnvelopeCodec().encode(_sample())[0], TAG_ENVELOPE)
+
+    def test_payload_carries_wire_version(self):
+        for name in CODECS:
+            with self.subTest(codec=name):
+                payload = get_codec(name).encode(_sample())
+                self.assertEqual(payload[1], WIRE_VERSION)
+                # 新しいバージョンの送信データは、誤って読まずにエラーにする
+                with self.assertRaisesRegex(CodecError, "version"):
+                    decode_message(payload[:1] + bytes((WIRE_VERSION + 1,)) + payload[2:])
+        with self.assertRaisesRegex(CodecError, "version"):
+            EnvelopeCodec.read_header(bytes((TAG_ENVELOPE, WIRE_VERSION + 1)) + EnvelopeCodec().encode(_sample())[2:])
+
+    def test_binary_is_smaller_than_json(self):
+        self.assertLess(len(BinaryCodec().encode(_sample())), len(JsonCodec().encode(_sample())))
+
+    def test_any_codec_reads_any_format(self):
+        """コーデックの異なるエージェントが混在していても相互に読める"""
+        for writer in CODECS:
+            payload = get_codec(writer).encode(_sample())
+            for reader in CODECS:
+                with self.subTest(writer=writer, reader=reader):
+                    self.assertSameMessage(get_codec(reader).decode(payload), _sample())
+
+    def test_legacy_untagged_json_is_accepted(self):
+        legacy = _sample().to_json()
+        self.assertSameMessage(decode_message(legacy), _sample())
+        self.assertSameMessage(decode_message(legacy.encode("utf-8")), _sample())
+
+    def test_binary_keeps_none_and_empty_fields(self):
+        msg = Message("A", None, "", job_id=None, msg_id="m-2")
+        decoded = BinaryCodec().decode(BinaryCodec().encode(msg))
+        self.assertIsNone(decoded.to_agent)
+        self.assertIsNone(decoded.job_id)
+        self.assertEqual(decoded.content, "")
+        self.assertEqual(decoded.cc_agents, [])
+
+    def test_binary_falls_back_to_json_for_non_string_content(self):
+        msg = Message("A", "B", {"answer": 5, "steps": ["2 + 3"]}, job_id="job-1", msg_id="m-3")
+        payload = BinaryCodec().encode(msg)
+        self.assertEqual(payload[0], TAG_JSON)
+        for reader in CODECS:
+            with self.subTest(reader=reader):
+                self.assertEqual(get_codec(reader).decode(payload).content, {"answer": 5, "steps": ["2 + 3"]})
+
+    def test_encode_payload_passes_legacy_json_through(self):
+        legacy = _sample().to_json()
+        self.assertEqual(BinaryCodec().encode_payload(legacy), legacy.encode("utf-8"))
+
+    def test_unknown_tag_and_truncated_payload_are_rejected(self):
+        with self.assertRaises(CodecError):
+            decode_message(b"\x7fxyz")
+        with self.assertRaises(CodecError):
+            decode_message(BinaryCodec().encode(_sample())[:10])
+        with self.assertRaises(CodecError):
+            decode_message(b"")
+
+    def test_get_codec(self):
+        codec = BinaryCodec()
+        self.assertIs(get_codec(codec), codec)
+        self.assertIsInstance(get_codec("json"), JsonCodec)
+        with self.assertRaises(ValueError):
+            get_codec("xml")
+
+    def test_codec_must_implement_encode_body(self):
+        with self.assertRaises(TypeError):
+            MessageCodec()
+
+    def test_json_body_is_plain_json(self):
+        body = json.loads(JsonCodec().encode(_sample())[2:])
+        self.assertEqual(body["content"], "2 + 3 は？ ☕")
+
+
+class TestContentCompression(unittest.TestCase):
+
+    LARGE = "計算結果の詳細なレポート。" * 500
+
+    def _message(self, content):
+        return Message("Chief", "Calculator", content, job_id="job-1", cc_agents=["Logger"], msg_id="m-1")
+
+    def test_large_content_is_compressed_and_flagged(self):
+        for name in CODECS:
+            with self.subTest(codec=name):
+                sender = get_codec(name, compress_threshold=1024)
+                plain = get_codec(name).encode(self._message(self.LARGE))
+                payload = sender.encode(self._message(self.LARGE))
+                self.assertLess(len(payload), len(plain) / 5)
+                self.assertEqual(sender.stats["compressed"], 1)
+                self.assertLess(sender.compression_ratio, 0.2)
+
+                receiver = get_codec("json")
+                msg = receiver.decode(payload)
+                self.assertEqual(msg.to_agent, "Calculator")
+                self.assertTrue(msg.content_is_packed)
+                self.assertEqual(receiver.stats["decompressed"], 0)
+
+                self.assertEqual(msg.content, self.LARGE)
+                self.assertFalse(msg.content_is_packed)
+                self.assertEqual(receiver.stats["decompressed"], 1)
+                self.assertEqual(msg.to_dict(), self._message(self.LARGE).to_dict() | {"timestamp": msg.timestamp})
+
+    def test_small_or_incompressible_content_is_sent_as_is(self):
+        codec = BinaryCodec(compress_threshold=1024)
+        self.assertFalse(codec.decode(codec.encode(self._message("short"))).content_is_packed)
+
+        # 圧縮しても小さくならない場合 (level=0 は無圧縮) はそのまま送る
+        codec = BinaryCodec(compress_threshold=1024, compress_level=0)
+        msg = codec.decode(codec.encode(self._message(self.LARGE)))
+        self.assertFalse(msg.content_is_packed)
+        self.assertEqual(msg.content, self.LARGE)
+        self.assertEqual(codec.stats["skipped"], 1)
+        self.assertEqual(codec.stats["compressed"], 0)
+
+    def test_json_envelope_marks_encoding(self):
+        payload = JsonCodec(compress_threshold=100).encode(self._message(self.LARGE))
+        body = json.loads(payload[2:])
+        self.assertEqual(body["content_encoding"], "zlib")
+        self.assertNotEqual(body["content"], self.LARGE)
+
+    def test_re_encoding_a_packed_message_keeps_content(self):
+        codec = JsonCodec(compress_threshold=100)
+        msg = codec.decode(codec.encode(self._message(self.LARGE)))
+        self.assertEqual(decode_message(BinaryCodec().encode(msg)).content, self.LARGE)
+
+    def test_compression_report(self):
+        codec = BinaryCodec(compress_threshold=100)
+        codec.decode(codec.encode(self._message(self.LARGE))).content
+        report = codec.compression_report()
+        self.assertIn("compressed 1", report)
+        self.assertIn("decompressed 1", report)
+
+
+class TestEnvelopeCodec(unittest.TestCase):
+
+    def test_routing_fields_are_decoded_without_content(self):
+        payload = EnvelopeCodec().encode(_sample())
+        msg = decode_message(payload)
+        self.assertEqual((msg.from_agent, msg.to_agent, msg.cc_agents, msg.job_id),
+                         ("Chief", "Calculator", ["Logger", "Auditor"], "job-1"))
+        self.assertTrue(msg.content_is_packed)
+        self.assertEqual(msg.content, "2 + 3 は？ ☕")
+        self.assertFalse(msg.content_is_packed)
+
+    def test_read_header_does_not_touch_body(self):
+        payload = EnvelopeCodec().encode(_sample())
+        # 本体が壊れていてもヘッダーは読める
+        header = EnvelopeCodec.read_header(payload[:-3] + b"\xff\xfe\xfd")
+        self.assertEqual(header["to_agent"], "Calculator")
+        self.assertNotIn("content", header)
+        with self.assertRaises(CodecError):
+            EnvelopeCodec.read_header(JsonCodec().encode(_sample()))
+
+    def test_non_string_content(self):
+        for content in (None, {"answer": 5}):
+            with self.subTest(content=content):
+                msg = decode_message(EnvelopeCodec().encode(Message("A", "B", content, msg_id="m")))
+                self.assertEqual(msg.content, content)
+
+    def test_compressed_content(self):
+        codec = EnvelopeCodec(compress_threshold=100)
+        msg = codec.decode(codec.encode(Message("A", "B", "長い本文。" * 200, msg_id="m")))
+        self.assertEqual(codec.stats["compressed"], 1)
+        self.assertEqual(codec.stats["decompressed"], 0)
+        self.assertEqual(msg.content, "長い本文。" * 200)
+        self.assertEqual(codec.stats["decompressed"], 1)
+
+    def test_truncated_header_is_rejected(self):
+        payload = EnvelopeCodec().encode(_sample())
+        with self.assertRaises(CodecError):
+            decode_message(payload[:8])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import patch
+
+from ai_masa.context.store import InMemoryContextStore, MESSAGE_OVERHEAD_BYTES
+from ai_masa.models.message import Message
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _msg(content="x", job_id="job"):
+    return Message("A", "B", content, job_id=job_id)
+
+
+class TestInMemoryContextStore(unittest.TestCase):
+
+    def setUp(self):
+        self.evictions = []
+
+    def _store(self, **limits):
+        store = InMemoryContextStore(**limits)
+        store.add_eviction_listener(
+            lambda job_id, first_seq, reason: self.evictions.append((job_id, first_seq, reason))
+        )
+        return store
+
+    def test_behaves_like_the_old_context_dict(self):
+        store = self._store()
+        first, second = _msg("1"), _msg("2")
+        store.append("job", first)
+        store.append("job", second)
+        self.assertIn("job", store)
+        self.assertNotIn("other", store)
+        self.assertEqual(store["job"], [first, second])
+        self.assertEqual(store.get("other", []), [])
+        with self.assertRaises(KeyError):
+            store["other"]
+
+    def test_per_job_cap_drops_oldest_messages(self):
+        store = self._store(max_messages_per_job=2)
+        for i in range(3):
+            store.append("job", _msg(str(i)))
+        self.assertEqual([m.content for m in store["job"]], ["1", "2"])
+        self.assertEqual(store.window("job")[0], 1)
+        self.assertEqual(self.evictions, [("job", 1, "trimmed")])
+        self.assertEqual(store.metrics()["evicted_messages"], 1)
+
+    def test_idle_jobs_expire(self):
+        clock = FakeClock()
+        store = self._store(job_ttl=10, clock=clock)
+        store.append("old", _msg())
+        clock.now = 5
+        store.append("recent", _msg())
+        clock.now = 12
+        store.append("new", _msg())
+        self.assertEqual(store.job_ids(), ["recent", "new"])
+        self.assertEqual(self.evictions, [("old", None, "expired")])
+        self.assertEqual(store.metrics()["expired_jobs"], 1)
+
+    def test_reading_a_job_keeps_it_alive(self):
+        clock = FakeClock()
+        store = self._store(job_ttl=10, max_jobs=2, clock=clock)
+        store.append("a", _msg())
+        store.append("b", _msg())
+        clock.now = 8
+        store.get("a")
+        clock.now = 15
+        store.expire()
+        self.assertEqual(store.job_ids(), ["a"])
+
+    def test_least_recently_used_job_is_dropped_over_max_jobs(self):
+        store = self._store(max_jobs=2)
+        store.append("a", _msg())
+        store.append("b", _msg())
+        store.get("a")
+        store.append("c", _msg())
+        self.assertEqual(store.job_ids(), ["a", "c"])
+        self.assertEqual(store.metrics()["evicted_jobs"], 1)
+        self.assertEqual(self.evictions, [("b", None, "evicted")])
+
+    def test_byte_budget(self):
+        size = MESSAGE_OVERHEAD_BYTES + 100
+        store = self._store(max_bytes=size * 3)
+        store.append("a", _msg("x" * 100, "a"))
+        store.append("b", _msg("x" * 100, "b"))
+        store.append("b", _msg("x" * 100, "b"))
+        store.append("b", _msg("x" * 100, "b"))
+        # 最も古いジョブから捨てる
+        self.assertEqual(store.job_ids(), ["b"])
+        # 残りが1ジョブになったら、そのジョブの古いメッセージを捨てる
+        store.append("b", _msg("x" * 100, "b"))
+        self.assertEqual(len(store["b"]), 3)
+        metrics = store.metrics()
+        self.assertEqual(metrics["resident_bytes"], size * 3)
+        self.assertEqual(metrics["resident_messages"], 3)
+
+    def test_discard(self):
+        store = self._store()
+        store.append("job", _msg())
+        store.discard("job")
+        store.discard("missing")
+        self.assertNotIn("job", store)
+        self.assertEqual(self.evictions, [("job", None, "discarded")])
+        self.assertEqual(store.metrics()["resident_bytes"], 0)
+
+    def test_listener_errors_do_not_break_append(self):
+        store = InMemoryContextStore(max_messages_per_job=1)
+        store.add_eviction_listener(lambda job_id, first_seq, reason: 1 / 0)
+        with patch('builtins.print'):
+            store.append("job", _msg("1"))
+            store.append("job", _msg("2"))
+        self.assertEqual([m.content for m in store["job"]], ["2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
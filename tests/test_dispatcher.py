@@ -0,0 +1,233 @@
+import unittest
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch, MagicMock
+
+from ai_masa.agents.dispatcher import MessageDispatcher, TaskDropped
+from ai_masa.agents.base_agent import BaseAgent
+from ai_masa.models.message import Message
+
+
+class TestMessageDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.done = []
+
+    def tearDown(self):
+        self.release.set()
+
+    def _blocking_task(self, value):
+        self.started.set()
+        self.release.wait(2)
+        self.done.append(value)
+
+    def _wait_until(self, predicate, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return predicate()
+
+    def test_tasks_run_on_worker_threads(self):
+        dispatcher = MessageDispatcher("Test", workers=2).start()
+        caller = threading.current_thread()
+        threads = []
+        dispatcher.submit(lambda: threads.append(threading.current_thread()))
+        self.assertTrue(self._wait_until(lambda: threads))
+        self.assertIsNot(threads[0], caller)
+        dispatcher.stop()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_drop_newest_rejects_when_full(self, mock_stdout):
+        dispatcher = MessageDispatcher("Test", workers=1, max_pending=1, overflow="drop_newest").start()
+        dispatcher.submit(self._blocking_task, "running")
+        self.assertTrue(self.started.wait(1))
+        self.assertTrue(dispatcher.submit(self._blocking_task, "queued"))
+        self.assertFalse(dispatcher.submit(self._blocking_task, "rejected"))
+
+        self.release.set()
+        self.assertTrue(self._wait_until(lambda: len(self.done) == 2))
+        self.assertEqual(self.done, ["running", "queued"])
+        self.assertEqual(dispatcher.stats["dropped"], 1)
+        self.assertIn("Dropped new task", mock_stdout.getvalue())
+        dispatcher.stop()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_drop_oldest_replaces_queued_task(self, mock_stdout):
+        dispatcher = MessageDispatcher("Test", workers=1, max_pending=1, overflow="drop_oldest").start()
+        dispatcher.submit(self._blocking_task, "running")
+        self.assertTrue(self.started.wait(1))
+        dispatcher.submit(self._blocking_task, "stale")
+        self.assertTrue(dispatcher.submit(self._blocking_task, "fresh"))
+
+        self.release.set()
+        self.assertTrue(self._wait_until(lambda: len(self.done) == 2))
+        self.assertEqual(self.done, ["running", "fresh"])
+        self.assertEqual(dispatcher.stats["dropped"], 1)
+        dispatcher.stop()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_block_applies_backpressure_until_timeout(self, mock_stdout):
+        dispatcher = MessageDispatcher("Test", workers=1, max_pending=1, overflow="block", block_timeout=0.05).start()
+        dispatcher.submit(self._blocking_task, "running")
+        self.assertTrue(self.started.wait(1))
+        dispatcher.submit(self._blocking_task, "queued")
+
+        start = time.monotonic()
+        self.assertFalse(dispatcher.submit(self._blocking_task, "timed out"))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertIn("Dropped new task after waiting 0.05s", mock_stdout.getvalue())
+        self.release.set()
+        dispatcher.stop()
+
+    def test_block_waits_a_bounded_time_by_default(self):
+        self.assertIsNotNone(MessageDispatcher("Test").block_timeout)
+
+    def test_block_resumes_when_worker_frees_a_slot(self):
+        dispatcher = MessageDispatcher("Test", workers=1, max_pending=1, overflow="block").start()
+        dispatcher.submit(self._blocking_task, "running")
+        self.assertTrue(self.started.wait(1))
+        dispatcher.submit(self._blocking_task, "queued")
+
+        threading.Timer(0.05, self.release.set).start()
+        self.assertTrue(dispatcher.submit(self._blocking_task, "after backpressure"))
+        self.assertTrue(self._wait_until(lambda: len(self.done) == 3))
+        dispatcher.stop()
+
+    def test_same_key_runs_in_order_one_at_a_time(self):
+        """同じキーのタスクは投入順に、同時に1つだけ実行される"""
+        dispatcher = MessageDispatcher("Test", workers=4).start()
+        running = []
+        overlaps = []
+        lock = threading.Lock()
+
+        def task(value):
+            with lock:
+                if running:
+                    overlaps.append(value)
+                running.append(value)
+            time.sleep(0.005)
+            with lock:
+                running.remove(value)
+                self.done.append(value)
+
+        for i in range(10):
+            dispatcher.submit_keyed("job-1", task, i)
+        self.assertTrue(self._wait_until(lambda: len(self.done) == 10))
+        self.assertEqual(self.done, list(range(10)))
+        self.assertEqual(overlaps, [])
+        dispatcher.stop()
+
+    def test_other_keys_are_not_blocked_by_a_slow_job(self):
+        """あるジョブが長引いても、別のジョブは空いているワーカーで進む"""
+        dispatcher = MessageDispatcher("Test", workers=2).start()
+        dispatcher.submit_keyed("slow-job", self._blocking_task, "slow-1")
+        dispatcher.submit_keyed("slow-job", self.done.append, "slow-2")
+        self.assertTrue(self.started.wait(1))
+        for i in range(3):
+            dispatcher.submit_keyed("fast-job", self.done.append, f"fast-{i}")
+
+        self.assertTrue(self._wait_until(lambda: len(self.done) == 3))
+        self.assertEqual(self.done, ["fast-0", "fast-1", "fast-2"])
+
+        self.release.set()
+        self.assertTrue(self._wait_until(lambda: len(self.done) == 5))
+        self.assertEqual(self.done[3:], ["slow-1", "slow-2"])
+        dispatcher.stop()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_worker_survives_failing_task(self, mock_stdout):
+        dispatcher = MessageDispatcher("Test", workers=1).start()
+        dispatcher.submit(MagicMock(side_effect=RuntimeError("boom")))
+        dispatcher.submit(self.done.append, "next")
+        self.assertTrue(self._wait_until(lambda: self.done == ["next"]))
+        self.assertEqual(dispatcher.stats["failed"], 1)
+        self.assertIn("Error in worker: boom", mock_stdout.getvalue())
+        dispatcher.stop()
+
+    def test_submit_tracked_resolves_with_result_or_error(self):
+        dispatcher = MessageDispatcher("Test", workers=1).start()
+        self.assertEqual(dispatcher.submit_tracked("job", lambda: "ok").result(timeout=1), "ok")
+        with patch('sys.stdout', new_callable=StringIO):
+            failed = dispatcher.submit_tracked("job", MagicMock(side_effect=RuntimeError("boom")))
+            with self.assertRaises(RuntimeError):
+                failed.result(timeout=1)
+        dispatcher.stop()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_submit_tracked_reports_dropped_tasks(self, mock_stdout):
+        dispatcher = MessageDispatcher("Test", workers=1, max_pending=1, overflow="drop_oldest").start()
+        dispatcher.submit(self._blocking_task, "running")
+        self.assertTrue(self.started.wait(1))
+        stale = dispatcher.submit_tracked("job", self._blocking_task, "stale")
+        fresh = dispatcher.submit_tracked("job", self._blocking_task, "fresh")
+        self.assertIsInstance(stale.exception(timeout=1), TaskDropped)
+        self.release.set()
+        self.assertIsNone(fresh.result(timeout=2))
+        dispatcher.stop()
+        self.assertIsInstance(dispatcher.submit_tracked("job", self.done.append, "late").exception(), TaskDropped)
+
+
+class TestBaseAgentDispatch(unittest.TestCase):
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_receive_does_not_wait_for_thinking(self, MockRedisBroker):
+        """llm_workersを指定すると、受信処理は思考の完了を待たずに戻る"""
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, llm_workers=1)
+        release = threading.Event()
+        finished = threading.Event()
+
+        def slow_think(trigger_msg, job_id, is_observer=False):
+            release.wait(2)
+            finished.set()
+
+        with patch.object(agent, 'think_and_respond', side_effect=slow_think) as mock_think:
+            msg = Message("User", "TestAgent", "hello", job_id="job-async")
+            completion = agent._on_message_received(msg.to_json())
+            self.assertFalse(finished.is_set())
+            # 思考の完了は Future で分かる (RedisStreamBroker はこれを待ってから ACK する)
+            self.assertFalse(completion.done())
+
+            release.set()
+            self.assertTrue(finished.wait(2))
+            completion.result(timeout=2)
+            mock_think.assert_called_once()
+            self.assertEqual(mock_think.call_args.args[1], "job-async")
+        agent.shutdown()
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_later_messages_are_not_in_the_history_of_queued_thinking(self, MockRedisBroker):
+        """思考待ちのメッセージのプロンプトに、後から届いたメッセージが入らない"""
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, llm_workers=1)
+        release = threading.Event()
+        seen = {}
+
+        def slow_think(trigger_msg, job_id, is_observer=False):
+            if trigger_msg.content == "m0":
+                release.wait(2)
+            seen[trigger_msg.content] = [m.content for m in agent.context[job_id]]
+
+        with patch.object(agent, 'think_and_respond', side_effect=slow_think):
+            agent._on_message_received(Message("User", "TestAgent", "m0", job_id="j").to_json())
+            m1 = agent._on_message_received(Message("User", "TestAgent", "m1", job_id="j").to_json())
+            agent._on_message_received(Message("User", "Other", "note", job_id="j").to_json())
+            m2 = agent._on_message_received(Message("User", "TestAgent", "m2", job_id="j").to_json())
+            release.set()
+            m1.result(timeout=2)
+            m2.result(timeout=2)
+        agent.shutdown()
+
+        self.assertEqual(seen["m0"], ["m0"])
+        self.assertEqual(seen["m1"], ["m0", "m1"])
+        self.assertEqual(seen["m2"], ["m0", "m1", "note", "m2"])
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_agent_passes_block_timeout(self, MockRedisBroker):
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, llm_workers=1, block_timeout=5)
+        self.assertEqual(agent.dispatcher.block_timeout, 5)
+        agent.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from unittest.mock import patch
+
+from ai_masa.agents.gemini_cli_agent import GeminiCliAgent
+
+
+class FakeGemini:
+    """gemini --list-sessions / --resume / --delete-session を真似る subprocess.run の代わり"""
+
+    def __init__(self, with_uuid=True, init_delay=0.0):
+        self.sessions = []
+        self.with_uuid = with_uuid
+        self.init_delay = init_delay
+        self.conflicts = 0
+        self.deleted = []
+        self._lock = threading.Lock()
+
+    def __call__(self, args, **kwargs):
+        if args == ["gemini", "--list-sessions"]:
+            with self._lock:
+                if not self.sessions:
+                    return subprocess.CompletedProcess(args, 0, "No sessions found.\n", "")
+                lines = [f"Available sessions for this project ({len(self.sessions)}):"]
+                for i, session in enumerate(self.sessions, 1):
+                    lines.append(f"  {i}. Session {i} (just now)" + (f" [{session}]" if self.with_uuid else ""))
+            return subprocess.CompletedProcess(args, 0, "\n".join(lines) + "\n", "")
+        if isinstance(args, list) and args[:2] == ["gemini", "--delete-session"]:
+            with self._lock:
+                self.sessions.remove(args[2])
+                self.deleted.append(args[2])
+            return subprocess.CompletedProcess(args, 0, "", "")
+        if isinstance(args, str) and args.startswith("gemini --resume "):
+            index = int(args.split()[2])
+            time.sleep(self.init_delay)
+            with self._lock:
+                if index == len(self.sessions) + 1:
+                    self.sessions.append(str(uuid.uuid4()))
+                else:
+                    # 他のエージェントが同じインデックスで先に作った
+                    self.conflicts += 1
+            return subprocess.CompletedProcess(args, 0, "{}", "")
+        raise AssertionError(f"unexpected command: {args!r}")
+
+
+class TestGeminiCliAgentSessions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.lock_path = os.path.join(self.tmpdir.name, "sessions.lock")
+        patcher = patch('ai_masa.agents.base_agent.RedisBroker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        print_patcher = patch('builtins.print')
+        print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def _agent(self, **options):
+        agent = GeminiCliAgent(name="Gemini", start_heartbeat=False, llm_workers=0,
+                               session_lock_path=self.lock_path, **options)
+        self.addCleanup(agent.shutdown)
+        return agent
+
+    def test_session_id_is_uuid_when_listed(self):
+        gemini = FakeGemini()
+        with patch('subprocess.run', side_effect=gemini):
+            agent = self._agent()
+            first = agent._create_llm_session("job-1")
+            second = agent._create_llm_session("job-2")
+        self.assertEqual([first, second], gemini.sessions)
+
+    def test_falls_back_to_index(self):
+        gemini = FakeGemini(with_uuid=False)
+        with patch('subprocess.run', side_effect=gemini):
+            agent = self._agent()
+            self.assertEqual(agent._create_llm_session("job-1"), "1")
+            self.assertEqual(agent._create_llm_session("job-2"), "2")
+
+    def test_index_allocation_is_atomic_across_agents(self):
+        gemini = FakeGemini(init_delay=0.05)
+        with patch('subprocess.run', side_effect=gemini):
+            agents = [self._agent(), self._agent()]
+            results = []
+            threads = [
+                threading.Thread(target=lambda a=a, i=i: results.append(a._create_llm_session(f"job-{i}")))
+                for i, a in enumerate(agents * 2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(gemini.conflicts, 0)
+        self.assertEqual(sorted(results), sorted(gemini.sessions))
+        self.assertEqual(len(set(results)), 4)
+
+    def test_new_job_takes_prewarmed_session(self):
+        gemini = FakeGemini()
+        with patch('subprocess.run', side_effect=gemini):
+            agent = self._agent(session_pool_size=1)
+            deadline = time.monotonic() + 2
+            while agent.session_pool.ready() < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            session_id = agent._create_llm_session("job-1")
+        self.assertEqual(session_id, gemini.sessions[0])
+        self.assertEqual(agent.session_pool.stats["taken"], 1)
+
+    def test_idle_sessions_are_deleted(self):
+        gemini = FakeGemini()
+        with patch('subprocess.run', side_effect=gemini):
+            agent = self._agent(session_idle_ttl=60)
+            for job_id in ("job-1", "job-2"):
+                agent.job_sessions[job_id] = agent._create_llm_session(job_id)
+            idle = agent.job_sessions["job-1"]
+            agent._session_last_used[idle] -= 61
+            self.assertEqual(agent.collect_idle_sessions(), 1)
+        self.assertEqual(gemini.deleted, [idle])
+        self.assertNotIn("job-1", agent.job_sessions)
+        self.assertIn("job-2", agent.job_sessions)
+
+    def test_index_sessions_are_not_deleted(self):
+        gemini = FakeGemini(with_uuid=False)
+        with patch('subprocess.run', side_effect=gemini):
+            agent = self._agent(session_idle_ttl=60)
+            agent.job_sessions["job-1"] = agent._create_llm_session("job-1")
+            agent._session_last_used["1"] -= 61
+            self.assertEqual(agent.collect_idle_sessions(), 0)
+        self.assertEqual(gemini.deleted, [])
+        self.assertNotIn("job-1", agent.job_sessions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from ai_masa.agents.logging_agent import LoggingAgent
+from ai_masa.context.archive import RedisHistoryArchive
+from ai_masa.models.message import Message
+
+
+class TestRedisHistoryArchive(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('ai_masa.context.archive.redis.Redis')
+        self.MockRedis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_client = self.MockRedis.return_value
+        self.mock_pipe = self.mock_client.pipeline.return_value
+
+    def test_append_pushes_trims_and_sets_ttl(self):
+        archive = RedisHistoryArchive(max_messages_per_job=100, ttl=3600)
+        msg = Message("A", "B", "hello", job_id="job-1")
+        archive.append(msg)
+
+        self.mock_pipe.rpush.assert_called_once_with("ai_masa:history:job-1", json.dumps(msg.to_dict(), ensure_ascii=False))
+        self.mock_pipe.ltrim.assert_called_once_with("ai_masa:history:job-1", -100, -1)
+        self.mock_pipe.expire.assert_called_once_with("ai_masa:history:job-1", 3600)
+        self.mock_pipe.execute.assert_called_once()
+
+    def test_fetch_restores_messages_in_order(self):
+        first = Message("A", "B", "1", job_id="job-1")
+        second = Message("B", "A", "2", job_id="job-1")
+        self.mock_client.lrange.return_value = [json.dumps(first.to_dict()), json.dumps(second.to_dict())]
+
+        fetched = RedisHistoryArchive().fetch("job-1")
+
+        self.mock_client.lrange.assert_called_once_with("ai_masa:history:job-1", 0, -1)
+        self.assertEqual([m.to_dict() for m in fetched], [first.to_dict(), second.to_dict()])
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_logging_agent_archives_logged_messages(self, MockRedisBroker):
+        archive = RedisHistoryArchive()
+        agent = LoggingAgent(archive=archive)
+        with patch('builtins.print'):
+            agent._on_message_received(Message("A", "B", "記録する", job_id="job-1").to_json())
+            agent._on_message_received(Message("A", "A", "heartbeat", job_id="_system_", cc_agents=["_broadcast_"]).to_json())
+
+        self.mock_pipe.rpush.assert_called_once()
+        self.assertEqual(self.mock_pipe.rpush.call_args.args[0], "ai_masa:history:job-1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import threading
+import time
+from unittest.mock import patch
+
+from ai_masa.agents.base_agent import BaseAgent
+from ai_masa.agents.logging_agent import LoggingAgent
+from ai_masa.comms.inmemory_broker import InMemoryBroker, InMemoryHub
+from ai_masa.models.message import Message
+
+
+def _wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+class TestInMemoryBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.hub = InMemoryHub()
+        self.shutdown_event = threading.Event()
+        self.threads = []
+        print_patcher = patch('builtins.print')
+        print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def tearDown(self):
+        self.shutdown_event.set()
+        for thread in self.threads:
+            thread.join(timeout=2)
+
+    def _subscribe(self, broker, **kwargs):
+        received = []
+        thread = threading.Thread(
+            target=broker.subscribe, args=(received.append,),
+            kwargs=dict(shutdown_event=self.shutdown_event, **kwargs), daemon=True
+        )
+        thread.start()
+        self.threads.append(thread)
+        return received
+
+    def test_global_routing_delivers_to_every_subscriber(self):
+        publisher = InMemoryBroker(self.hub)
+        publisher.connect()
+        a = InMemoryBroker(self.hub); a.connect()
+        b = InMemoryBroker(self.hub); b.connect()
+        received_a = self._subscribe(a, agent_name="A")
+        received_b = self._subscribe(b, agent_name="B")
+        self.assertTrue(_wait_until(lambda: self.hub.subscriber_count("ai_masa_channel") == 2))
+
+        msg = Message("X", "A", "hello", job_id="job-1")
+        publisher.publish(msg)
+
+        self.assertTrue(_wait_until(lambda: received_a and received_b))
+        # シリアライズせず、同じオブジェクトが届く
+        self.assertIs(received_a[0], msg)
+        self.assertIs(received_b[0], msg)
+
+    def test_addressed_routing_delivers_only_to_recipients_and_firehose(self):
+        publisher = InMemoryBroker(self.hub, routing="addressed"); publisher.connect()
+        a = InMemoryBroker(self.hub, routing="addressed"); a.connect()
+        b = InMemoryBroker(self.hub, routing="addressed"); b.connect()
+        logger = InMemoryBroker(self.hub, routing="addressed"); logger.connect()
+        received_a = self._subscribe(a, agent_name="A")
+        received_b = self._subscribe(b, agent_name="B")
+        received_log = self._subscribe(logger, agent_name="Logger", firehose=True)
+        self.assertTrue(_wait_until(lambda: self.hub.subscriber_count("ai_masa_channel:firehose") == 1
+                                    and self.hub.subscriber_count("ai_masa_channel:inbox:B") == 1))
+
+        publisher.publish(Message("X", "A", "only for A", job_id="job-1"))
+        publisher.publish('{"from_agent": "X", "to_agent": "B", "content": "json for B", "cc_agents": []}')
+
+        self.assertTrue(_wait_until(lambda: len(received_log) == 2))
+        self.assertEqual([m.content for m in received_a], ["only for A"])
+        self.assertEqual(len(received_b), 1)
+        self.assertIn("json for B", received_b[0])
+
+    def test_unsubscribed_channel_is_detached_on_shutdown(self):
+        broker = InMemoryBroker(self.hub); broker.connect()
+        self._subscribe(broker, agent_name="A")
+        self.assertTrue(_wait_until(lambda: self.hub.subscriber_count("ai_masa_channel") == 1))
+        self.shutdown_event.set()
+        self.threads[0].join(timeout=2)
+        self.assertEqual(self.hub.subscriber_count("ai_masa_channel"), 0)
+
+
+class TestAgentsOverInMemoryBroker(unittest.TestCase):
+    """Redisなしで、複数のエージェントを1プロセス内で会話させる"""
+
+    def setUp(self):
+        self.hub = InMemoryHub()
+        print_patcher = patch('builtins.print')
+        self.mock_print = print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def _start(self, agent):
+        thread = threading.Thread(target=agent.observe_loop, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 2)
+        self.addCleanup(agent.shutdown)
+        return thread
+
+    def test_request_and_reply_between_agents(self):
+        # llm_command は str.format されるため、JSONの波括弧はエスケープする
+        calc = BaseAgent("Calculator", "Worker", start_heartbeat=False,
+                         broker=InMemoryBroker(self.hub, routing="addressed"),
+                         llm_command="echo '{{\"to_agent\": \"Chief\", \"content\": \"計算完了: 100mm2\"}}'")
+        chief = BaseAgent("Chief", "Manager", start_heartbeat=False,
+                          broker=InMemoryBroker(self.hub, routing="addressed"),
+                          llm_command="echo '{{\"to_agent\": \"\", \"content\": \"\"}}'")
+        logger = LoggingAgent(broker=InMemoryBroker(self.hub, routing="addressed"))
+        for agent in (calc, chief, logger):
+            self._start(agent)
+        self.assertTrue(_wait_until(lambda: self.hub.subscriber_count("ai_masa_channel:inbox:Calculator") == 1
+                                    and self.hub.subscriber_count("ai_masa_channel:inbox:Chief") == 1
+                                    and self.hub.subscriber_count("ai_masa_channel:firehose") == 1))
+
+        chief.broadcast(target="Calculator", content="断面積を計算して", job_id="job-123")
+
+        self.assertTrue(_wait_until(lambda: "job-123" in chief.context))
+        reply = chief.context["job-123"][-1]
+        self.assertEqual(reply.from_agent, "Calculator")
+        self.assertEqual(reply.content, "計算完了: 100mm2")
+        self.assertEqual([m.content for m in calc.context["job-123"]], ["断面積を計算して"])
+
+        # LoggingAgent は firehose で両方のメッセージを見ている
+        self.assertTrue(_wait_until(lambda: sum("job-123" in str(c.args[0]) for c in self.mock_print.call_args_list if c.args) >= 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from ai_masa.agents.base_agent import BaseAgent
+from ai_masa.llm.executor import LLMExecutor, LLMExecutionError, LLMTimeoutError, LLMCancelledError
+
+SLEEP = [sys.executable, "-c", "import time, sys; time.sleep(float(sys.argv[1]))"]
+
+
+class TestLLMExecutor(unittest.TestCase):
+
+    def _executor(self, **options):
+        executor = LLMExecutor(**options)
+        self.addCleanup(executor.stop)
+        return executor
+
+    def test_runs_command_without_shell(self):
+        executor = self._executor()
+        result = executor.run(["cat"], "こんにちは $HOME")
+        self.assertEqual(result.stdout, "こんにちは $HOME")
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(executor.stats["completed"], 1)
+
+    def test_accepts_command_string(self):
+        executor = self._executor()
+        self.assertEqual(executor.run("echo 'a b'").stdout, "a b\n")
+
+    def test_nonzero_exit_is_returned(self):
+        executor = self._executor()
+        result = executor.run([sys.executable, "-c", "import sys; sys.stderr.write('bad'); sys.exit(3)"])
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stderr, "bad")
+        self.assertEqual(executor.stats["failed"], 1)
+
+    def test_missing_command(self):
+        executor = self._executor()
+        with self.assertRaises(LLMExecutionError):
+            executor.run(["/nonexistent/llm"])
+        # 枠は返されている
+        self.assertEqual(executor.run(["true"]).returncode, 0)
+
+    def test_queue_wait_is_measured_separately(self):
+        executor = self._executor(max_concurrency=1)
+        futures = [executor.submit(SLEEP + ["0.2"]) for _ in range(2)]
+        results = sorted((f.result() for f in futures), key=lambda r: r.queue_wait)
+        self.assertLess(results[0].queue_wait, 0.1)
+        self.assertGreaterEqual(results[1].queue_wait, 0.15)
+        for result in results:
+            self.assertGreaterEqual(result.exec_time, 0.15)
+        metrics = executor.metrics()
+        self.assertGreaterEqual(metrics["max_queue_wait"], 0.15)
+        self.assertEqual(metrics["running"], 0)
+        self.assertEqual(metrics["waiting"], 0)
+
+    def test_timeout_kills_process(self):
+        executor = self._executor(timeout=0.2)
+        started = time.monotonic()
+        with self.assertRaises(LLMTimeoutError):
+            executor.run(SLEEP + ["5"])
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(executor.stats["timeouts"], 1)
+        self.assertEqual(executor.stats["running"], 0)
+
+    def test_cancel_job(self):
+        executor = self._executor(max_concurrency=1)
+        running = executor.submit(SLEEP + ["5"], job_id="job-1")
+        waiting = executor.submit(SLEEP + ["5"], job_id="job-1")
+        other = executor.submit(["echo", "ok"], job_id="job-2")
+        time.sleep(0.2)
+        started = time.monotonic()
+        executor.cancel_job("job-1")
+        for future in (running, waiting):
+            with self.assertRaises(LLMCancelledError):
+                future.result(timeout=2)
+        self.assertEqual(other.result(timeout=2).stdout, "ok\n")
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(executor.stats["cancelled"], 2)
+        self.assertEqual(executor.active_jobs(), [])
+
+
+class TestAgentWithExecutor(unittest.TestCase):
+
+    def _agent(self, **options):
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, **options)
+        self.addCleanup(agent.llm_executor.stop)
+        return agent
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_agent_invokes_llm_through_executor(self, MockRedisBroker):
+        agent = self._agent(llm_command="cat", llm_session_create_command="echo session-1",
+                            llm_timeout=5)
+        with patch('subprocess.run') as mock_run, patch('builtins.print'):
+            self.assertEqual(agent._create_llm_session("job"), "session-1")
+            self.assertEqual(agent._invoke_llm('{"to_agent":"User"}', "session-1", job_id="job"), '{"to_agent":"User"}')
+        mock_run.assert_not_called()
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_agent_timeout_returns_none(self, MockRedisBroker):
+        agent = self._agent(llm_command=" ".join(SLEEP[:2]) + " 'import time; time.sleep(5)'", llm_timeout=0.2)
+        with patch('builtins.print'):
+            self.assertIsNone(agent._invoke_llm("prompt", "session-1", job_id="job"))
+        self.assertEqual(agent.llm_executor.stats["timeouts"], 1)
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_dropped_job_cancels_llm_call(self, MockRedisBroker):
+        agent = self._agent(llm_command="sleep 5", llm_concurrency=1)
+        results = []
+        with patch('builtins.print'):
+            thread = threading.Thread(target=lambda: results.append(agent._invoke_llm("prompt", "s", job_id="job")))
+            thread.start()
+            time.sleep(0.2)
+            agent.context._notify_evicted("job", None, "discarded")
+            thread.join(timeout=2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(results, [None])
+        self.assertEqual(agent.llm_executor.stats["cancelled"], 1)
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_only_finished_jobs_cancel_llm_calls(self, MockRedisBroker):
+        """max_jobs / max_bytes で押し出されただけのジョブの呼び出しは取り消さない"""
+        agent = self._agent(llm_concurrency=1)
+        with patch.object(agent.llm_executor, 'cancel_job') as mock_cancel:
+            agent.context._notify_evicted("job", None, "evicted")
+            agent.context._notify_evicted("job", 3, "trimmed")
+            mock_cancel.assert_not_called()
+            agent.context._notify_evicted("job", None, "expired")
+            agent.context._notify_evicted("other", None, "discarded")
+        self.assertEqual([c.args for c in mock_cancel.call_args_list], [("job",), ("other",)])
+
+
+if __name__ == '__main__':
+    unittest.main()
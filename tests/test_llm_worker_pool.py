@@ -0,0 +1,122 @@
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from ai_masa.agents.base_agent import BaseAgent
+from ai_masa.llm.worker_pool import LLMWorkerPool, LLMWorkerError, LLMCommandError
+
+# 要求ごとに cat を実行し、プロンプトをそのまま返すワーカー
+ECHO_WORKER = [sys.executable, "-m", "ai_masa.llm.stdio_worker", "--command", "cat", "--session-command", "echo session-1"]
+SLOW_WORKER = [sys.executable, "-m", "ai_masa.llm.stdio_worker", "--command", "sleep 5"]
+FAILING_COMMAND_WORKER = [sys.executable, "-m", "ai_masa.llm.stdio_worker", "--command", "false"]
+BROKEN_WORKER = [sys.executable, "-c", "import sys; sys.exit(1)"]
+
+
+class TestLLMWorkerPool(unittest.TestCase):
+
+    def _pool(self, argv, **options):
+        pool = LLMWorkerPool(argv, **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_reuses_warm_workers(self):
+        pool = self._pool(ECHO_WORKER, size=1)
+        self.assertEqual(pool.call("hello", "s1"), "hello")
+        self.assertEqual(pool.call("こんにちは\n2行目", "s1"), "こんにちは\n2行目")
+        self.assertEqual(pool.create_session("role"), "session-1")
+        self.assertEqual(pool.stats["spawned"], 1)
+        self.assertEqual(pool.stats["calls"], 3)
+
+    def test_recycles_after_max_requests(self):
+        pool = self._pool(ECHO_WORKER, size=1, max_requests=2)
+        for _ in range(3):
+            pool.call("x")
+        self.assertEqual(pool.stats["recycled"], 1)
+        self.assertEqual(pool.stats["spawned"], 2)
+
+    def test_health_check_before_reusing_idle_worker(self):
+        pool = self._pool(ECHO_WORKER, size=1, health_interval=0)
+        pool.call("x")
+        pool.call("y")
+        self.assertEqual(pool.stats["health_checks"], 1)
+        self.assertEqual(pool.stats["spawned"], 1)
+
+    def test_timeout_kills_worker(self):
+        pool = self._pool(SLOW_WORKER, size=1, timeout=0.2)
+        with self.assertRaises(LLMWorkerError):
+            pool.call("x")
+        self.assertEqual(pool.stats["failed"], 1)
+        self.assertEqual(len(pool._workers), 0)
+
+    def test_disabled_after_consecutive_failures(self):
+        pool = self._pool(BROKEN_WORKER, size=1, max_failures=2)
+        with patch('builtins.print'):
+            for _ in range(2):
+                with self.assertRaises(LLMWorkerError):
+                    pool.call("x")
+        self.assertTrue(pool.disabled)
+        with self.assertRaises(LLMWorkerError):
+            pool.call("x")
+
+    def test_command_errors_keep_the_worker(self):
+        """LLMコマンドの失敗はそのまま返し、ワーカーを作り直さず、失敗の回数にも数えない"""
+        pool = self._pool(FAILING_COMMAND_WORKER, size=1, max_failures=2)
+        for _ in range(3):
+            with self.assertRaises(LLMCommandError):
+                pool.call("x")
+        self.assertFalse(pool.disabled)
+        self.assertEqual(pool.stats["spawned"], 1)
+        self.assertEqual(pool.stats["failed"], 0)
+        self.assertEqual(pool.stats["command_errors"], 3)
+
+    def test_success_resets_the_failure_count(self):
+        pool = self._pool(ECHO_WORKER, size=1, max_failures=2)
+        pool._record_failure()
+        pool.call("x")
+        pool._record_failure()
+        self.assertFalse(pool.disabled)
+
+    def test_missing_command_disables_pool(self):
+        pool = self._pool(["/nonexistent/llm-worker"], max_failures=1)
+        with patch('builtins.print'):
+            with self.assertRaises(LLMWorkerError):
+                pool.call("x")
+        self.assertTrue(pool.disabled)
+
+
+class TestAgentWithWorkerPool(unittest.TestCase):
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_agent_invokes_llm_through_pool(self, MockRedisBroker):
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, llm_worker_command=ECHO_WORKER)
+        self.addCleanup(agent.llm_pool.close)
+        with patch('subprocess.run') as mock_run:
+            self.assertEqual(agent._create_llm_session("job"), "session-1")
+            self.assertEqual(agent._invoke_llm('{"to_agent": "User"}', "session-1"), '{"to_agent": "User"}')
+        mock_run.assert_not_called()
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_agent_falls_back_to_one_shot_command(self, MockRedisBroker, mock_run):
+        mock_run.return_value = subprocess.CompletedProcess(args='', returncode=0, stdout='{"to_agent": ""}', stderr='')
+        agent = BaseAgent("TestAgent", "Test Role", llm_command="llm --resume {session_id}", start_heartbeat=False,
+                          llm_worker_command=["/nonexistent/llm-worker"])
+        with patch('builtins.print'):
+            self.assertEqual(agent._invoke_llm("prompt", "session-1"), '{"to_agent": ""}')
+        mock_run.assert_called_once()
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_agent_does_not_retry_failed_command_one_shot(self, MockRedisBroker, mock_run):
+        agent = BaseAgent("TestAgent", "Test Role", llm_command="llm {session_id}", start_heartbeat=False,
+                          llm_worker_command=FAILING_COMMAND_WORKER)
+        self.addCleanup(agent.llm_pool.close)
+        with patch('builtins.print'):
+            self.assertIsNone(agent._invoke_llm("prompt", "session-1"))
+        mock_run.assert_not_called()
+        self.assertFalse(agent.llm_pool.disabled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from ai_masa.models.message import Message
+
+
+class TestMessage(unittest.TestCase):
+
+    def test_json_contract_is_unchanged(self):
+        msg = Message("A", "B", "hello", job_id="job-1", cc_agents=["C"], msg_id="m-1")
+        data = json.loads(msg.to_json())
+        self.assertEqual(list(data), ["message_id", "timestamp", "from_agent", "to_agent", "cc_agents", "content", "job_id"])
+        self.assertEqual(data["message_id"], "m-1")
+        # タイムスタンプは従来どおりISO形式の文字列
+        self.assertIsInstance(datetime.fromisoformat(data["timestamp"]), datetime)
+
+    def test_messages_have_no_instance_dict(self):
+        with self.assertRaises(AttributeError):
+            Message("A", "B", "hello").__dict__
+
+    def test_timestamp_is_numeric_until_formatted(self):
+        msg = Message("A", "B", "hello")
+        self.assertIsInstance(msg.created_at, float)
+        self.assertAlmostEqual(datetime.fromisoformat(msg.timestamp).timestamp(), msg.created_at, places=5)
+
+    def test_received_timestamp_is_kept_verbatim(self):
+        msg = Message.from_dict({"from_agent": "A", "timestamp": "2025-01-01T12:00:00.000001"})
+        self.assertEqual(msg.timestamp, "2025-01-01T12:00:00.000001")
+        self.assertEqual(msg.created_at, datetime(2025, 1, 1, 12, 0, 0, 1).timestamp())
+
+    def test_from_json_matches_from_dict(self):
+        msg = Message("A", "B", "hello", job_id="job-1", cc_agents=["C"], msg_id="m-1")
+        msg.timestamp = "2025-01-01T12:00:00.000001"
+        self.assertEqual(Message.from_json(msg.to_json()).to_dict(), msg.to_dict())
+
+    @patch('uuid.uuid4', return_value="generated-id")
+    def test_message_id_is_generated_lazily(self, mock_uuid):
+        msg = Message("A", "B", "hello", msg_id=None)
+        self.assertIsNone(msg._message_id)
+        mock_uuid.assert_not_called()
+        self.assertEqual(msg.message_id, "generated-id")
+        self.assertEqual(msg.message_id, "generated-id")
+        # 最初に参照されたときに一度だけ生成する
+        mock_uuid.assert_called_once_with()
+
+    def test_agent_names_are_interned(self):
+        a = Message("".join(["Chi", "ef"]), "B", "x", job_id="".join(["job", "-1"]))
+        b = Message("".join(["Ch", "ief"]), "B", "y", job_id="".join(["jo", "b-1"]))
+        self.assertIs(a.from_agent, b.from_agent)
+        self.assertIs(a.job_id, b.job_id)
+
+    def test_packed_content_is_safe_to_read_from_threads(self):
+        def slow_unpack(packed):
+            time.sleep(0.001)
+            return packed.decode()
+
+        for _ in range(20):
+            msg = Message("A", "B", None)
+            msg.set_packed_content(b"hello", slow_unpack)
+            barrier = threading.Barrier(8)
+            results, errors = [], []
+
+            def read():
+                barrier.wait()
+                try:
+                    results.append(msg.content)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=read) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(results, ["hello"] * 8)
+            self.assertFalse(msg.content_is_packed)
+            self.assertEqual(msg.content, "hello")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import threading
+import time
+from unittest.mock import MagicMock
+
+from ai_masa.comms.outbox import PublishOutbox
+
+
+class TestPublishOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.flushed = threading.Event()
+
+    def _flush(self, items):
+        self.batches.append(list(items))
+        self.flushed.set()
+
+    def test_flushes_when_batch_is_full(self):
+        outbox = PublishOutbox(self._flush, max_batch=3, max_delay=10).start()
+        for i in range(3):
+            outbox.put(i)
+        self.assertTrue(self.flushed.wait(1))
+        self.assertEqual(self.batches, [[0, 1, 2]])
+        outbox.stop()
+
+    def test_flushes_after_max_delay(self):
+        on_flush = MagicMock()
+        outbox = PublishOutbox(self._flush, max_batch=100, max_delay=0.02, on_flush=on_flush).start()
+        start = time.monotonic()
+        outbox.put("a")
+        outbox.put("b")
+        self.assertTrue(self.flushed.wait(1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)
+        self.assertEqual(self.batches, [["a", "b"]])
+
+        size, waited, duration = on_flush.call_args.args
+        self.assertEqual(size, 2)
+        self.assertGreaterEqual(waited, 0.02)
+        self.assertEqual(outbox.stats["flushes"], 1)
+        self.assertEqual(outbox.stats["messages"], 2)
+        self.assertEqual(outbox.stats["last_wait"], waited)
+        outbox.stop()
+
+    def test_stop_flushes_remaining_items(self):
+        outbox = PublishOutbox(self._flush, max_batch=100, max_delay=60).start()
+        outbox.put("pending")
+        outbox.stop()
+        self.assertEqual(self.batches, [["pending"]])
+
+    def test_flush_error_is_counted(self):
+        outbox = PublishOutbox(MagicMock(side_effect=ConnectionError("down")), max_batch=1, max_delay=60)
+        outbox.put("lost")
+        with unittest.mock.patch('builtins.print'):
+            outbox.flush()
+        self.assertEqual(outbox.stats["errors"], 1)
+        self.assertEqual(outbox.stats["flushes"], 0)
+
+    def test_failed_batch_is_retried_in_order(self):
+        failures = [ConnectionError("down"), ConnectionError("still down")]
+
+        def flaky(items):
+            if failures:
+                raise failures.pop(0)
+            self._flush(items)
+
+        with unittest.mock.patch('builtins.print'):
+            outbox = PublishOutbox(flaky, max_batch=2, max_delay=0, retry_interval=0.01).start()
+            for i in range(3):
+                outbox.put(i)
+            deadline = time.monotonic() + 2
+            while sum(map(len, self.batches)) < 3 and time.monotonic() < deadline:
+                time.sleep(0.005)
+            outbox.stop()
+        self.assertEqual([item for batch in self.batches for item in batch], [0, 1, 2])
+        self.assertEqual(outbox.stats["errors"], 2)
+        self.assertEqual(outbox.pending(), 0)
+
+    def test_pending_messages_are_capped(self):
+        with unittest.mock.patch('builtins.print'):
+            outbox = PublishOutbox(self._flush, max_pending=2, overflow="drop_oldest")
+            for i in range(3):
+                self.assertTrue(outbox.put(i))
+            outbox.flush()
+            self.assertEqual(self.batches, [[1, 2]])
+
+            outbox = PublishOutbox(self._flush, max_pending=2, overflow="drop_newest")
+            self.assertTrue(outbox.put("a"))
+            self.assertTrue(outbox.put("b"))
+            self.assertFalse(outbox.put("c"))
+            self.assertEqual(outbox.stats["dropped"], 1)
+
+            outbox = PublishOutbox(self._flush, max_pending=1, overflow="block", block_timeout=0.02)
+            outbox.put("a")
+            start = time.monotonic()
+            self.assertFalse(outbox.put("b"))
+            self.assertGreaterEqual(time.monotonic() - start, 0.02)
+        with self.assertRaises(ValueError):
+            PublishOutbox(self._flush, overflow="unknown")
+
+if __name__ == '__main__':
+    unittest.main()
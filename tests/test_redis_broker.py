@@ -0,0 +1,310 @@
+import unittest
+import threading
+from unittest.mock import patch, MagicMock
+
+from ai_masa.comms.redis_broker import RedisBroker
+from ai_masa.models.codec import BinaryCodec, decode_message
+from ai_masa.models.message import Message
+
+
+def _msg(data):
+    return {'type': 'message', 'channel': 'ai_masa_channel', 'data': data}
+
+
+class TestRedisBrokerReceiveLoop(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('ai_masa.comms.redis_broker.redis.Redis')
+        self.MockRedis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_client = self.MockRedis.return_value
+        self.mock_pubsub = self.mock_client.pubsub.return_value
+
+    @patch('ai_masa.comms.redis_broker.time.sleep')
+    def test_event_mode_drains_pending_messages_without_sleep(self, mock_sleep):
+        """eventモードでは1回の起床で溜まったメッセージを全て処理し、sleepしない"""
+        shutdown_event = threading.Event()
+        received = []
+
+        def callback(data):
+            received.append(data)
+            if len(received) == 3:
+                shutdown_event.set()
+
+        # 1回目はブロッキング取得、以降は timeout=0 で溜まっている分を取り出す
+        self.mock_pubsub.get_message.side_effect = [_msg("a"), _msg("b"), _msg("c")]
+
+        broker = RedisBroker(receive_mode="event")
+        broker.connect()
+        broker.subscribe(callback, shutdown_event=shutdown_event)
+
+        self.assertEqual(received, ["a", "b", "c"])
+        mock_sleep.assert_not_called()
+        timeouts = [c.kwargs['timeout'] for c in self.mock_pubsub.get_message.call_args_list]
+        self.assertEqual(timeouts, [broker.block_timeout, 0.0, 0.0])
+
+    @patch('ai_masa.comms.redis_broker.time.sleep')
+    def test_event_mode_blocks_again_after_queue_is_empty(self, mock_sleep):
+        """溜まった分を処理し終えたら、再びブロッキング待機に戻る"""
+        shutdown_event = threading.Event()
+        received = []
+
+        def get_message(ignore_subscribe_messages, timeout):
+            if get_message.calls == 3:
+                shutdown_event.set()
+            get_message.calls += 1
+            return [_msg("a"), None, None, None][get_message.calls - 1]
+        get_message.calls = 0
+        self.mock_pubsub.get_message.side_effect = get_message
+
+        broker = RedisBroker(receive_mode="event", block_timeout=0.5)
+        broker.connect()
+        broker.subscribe(received.append, shutdown_event=shutdown_event)
+
+        self.assertEqual(received, ["a"])
+        timeouts = [c.kwargs['timeout'] for c in self.mock_pubsub.get_message.call_args_list]
+        self.assertEqual(timeouts, [0.5, 0.0, 0.5, 0.5])
+        mock_sleep.assert_not_called()
+
+    @patch('ai_masa.comms.redis_broker.time.sleep')
+    def test_poll_mode_keeps_legacy_behaviour(self, mock_sleep):
+        """pollモードは従来通り1メッセージごとにsleepする"""
+        shutdown_event = threading.Event()
+        received = []
+
+        def callback(data):
+            received.append(data)
+            if len(received) == 2:
+                shutdown_event.set()
+
+        self.mock_pubsub.get_message.side_effect = [_msg("a"), _msg("b")]
+
+        broker = RedisBroker(receive_mode="poll")
+        broker.connect()
+        broker.subscribe(callback, shutdown_event=shutdown_event)
+
+        self.assertEqual(received, ["a", "b"])
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    def test_unknown_receive_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            RedisBroker(receive_mode="busy-wait")
+
+
+class TestRedisBrokerRouting(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('ai_masa.comms.redis_broker.redis.Redis')
+        self.MockRedis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_client = self.MockRedis.return_value
+        self.mock_pubsub = self.mock_client.pubsub.return_value
+        # subscribe直後にループを抜けるよう、シャットダウン済みのイベントを使う
+        self.stopped = threading.Event()
+        self.stopped.set()
+
+    def _published_channels(self):
+        return [c.args[0] for c in self.mock_client.publish.call_args_list]
+
+    def test_global_routing_publishes_to_single_channel(self):
+        broker = RedisBroker(routing="global")
+        broker.connect()
+        broker.publish('{"to_agent": "B"}', recipients=["B", "C"])
+        self.assertEqual(self._published_channels(), ["ai_masa_channel"])
+
+    def test_addressed_routing_publishes_to_each_inbox_and_firehose(self):
+        broker = RedisBroker(routing="addressed")
+        broker.connect()
+        broker.publish('{"to_agent": "B"}', recipients=["B", "C", "B", None])
+        self.assertEqual(self._published_channels(), [
+            "ai_masa_channel:inbox:B",
+            "ai_masa_channel:inbox:C",
+            "ai_masa_channel:firehose",
+        ])
+
+    def test_addressed_routing_reads_recipients_from_message(self):
+        """宛先が渡されない場合はメッセージ本体の to_agent / cc_agents を使う"""
+        broker = RedisBroker(routing="addressed")
+        broker.connect()
+        broker.publish('{"to_agent": "B", "cc_agents": ["C"]}')
+        self.assertEqual(self._published_channels(), [
+            "ai_masa_channel:inbox:B",
+            "ai_masa_channel:inbox:C",
+            "ai_masa_channel:firehose",
+        ])
+
+    def test_addressed_routing_subscribes_to_inbox_or_firehose(self):
+        broker = RedisBroker(routing="addressed")
+        broker.connect()
+        broker.subscribe(MagicMock(), shutdown_event=self.stopped, agent_name="A")
+        self.mock_pubsub.subscribe.assert_called_with("ai_masa_channel:inbox:A")
+
+        broker.subscribe(MagicMock(), shutdown_event=self.stopped, agent_name="Logger", firehose=True)
+        self.mock_pubsub.subscribe.assert_called_with("ai_masa_channel:firehose")
+
+    def test_addressed_routing_requires_agent_name(self):
+        broker = RedisBroker(routing="addressed")
+        broker.connect()
+        with self.assertRaises(ValueError):
+            broker.subscribe(MagicMock(), shutdown_event=self.stopped)
+
+
+class TestRedisBrokerBatchedPublish(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('ai_masa.comms.redis_broker.redis.Redis')
+        self.MockRedis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_client = self.MockRedis.return_value
+        self.mock_pipe = self.mock_client.pipeline.return_value
+
+    def test_publish_many_uses_one_pipeline(self):
+        broker = RedisBroker(routing="addressed")
+        broker.connect()
+        broker.publish_many([('{"to_agent": "A"}', ["A"]), '{"to_agent": "B", "cc_agents": []}'])
+
+        self.mock_client.pipeline.assert_called_once_with(transaction=False)
+        channels = [c.args[0] for c in self.mock_pipe.publish.call_args_list]
+        self.assertEqual(channels, [
+            "ai_masa_channel:inbox:A", "ai_masa_channel:firehose",
+            "ai_masa_channel:inbox:B", "ai_masa_channel:firehose",
+        ])
+        self.mock_pipe.execute.assert_called_once()
+        self.mock_client.publish.assert_not_called()
+
+    def test_outbox_coalesces_publishes(self):
+        flushed = threading.Event()
+        broker = RedisBroker(outbox=True, outbox_max_batch=3, outbox_max_delay=10,
+                             on_flush=lambda size, waited, duration: flushed.set())
+        broker.connect()
+        for i in range(3):
+            broker.publish(f'{{"n": {i}}}')
+
+        self.assertTrue(flushed.wait(1))
+        self.mock_client.publish.assert_not_called()
+        self.assertEqual(self.mock_pipe.publish.call_count, 3)
+        self.assertEqual(broker.outbox.stats["flushes"], 1)
+        with patch('builtins.print'):
+            broker.disconnect()
+
+    def test_publish_many_goes_through_the_outbox(self):
+        """outbox を使う場合、publish_many も publish と同じ順番で outbox から送る"""
+        flushed = threading.Event()
+        broker = RedisBroker(outbox=True, outbox_max_batch=3, outbox_max_delay=10,
+                             on_flush=lambda size, waited, duration: flushed.set())
+        broker.connect()
+        broker.publish('{"n": 0}')
+        broker.publish_many(['{"n": 1}', '{"n": 2}'])
+
+        self.assertTrue(flushed.wait(1))
+        self.mock_client.pipeline.assert_called_once_with(transaction=False)
+        self.assertEqual([c.args[1] for c in self.mock_pipe.publish.call_args_list],
+                         ['{"n": 0}', '{"n": 1}', '{"n": 2}'])
+        self.assertEqual(broker.outbox.stats["flushes"], 1)
+        with patch('builtins.print'):
+            broker.disconnect()
+
+
+class TestRedisBrokerCodec(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('ai_masa.comms.redis_broker.redis.Redis')
+        self.MockRedis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_client = self.MockRedis.return_value
+        self.mock_pubsub = self.mock_client.pubsub.return_value
+
+    def test_default_keeps_json_strings(self):
+        broker = RedisBroker()
+        broker.connect()
+        self.assertFalse(broker.passes_messages)
+        broker.publish('{"to_agent": "B"}')
+        self.mock_client.publish.assert_called_once_with("ai_masa_channel", '{"to_agent": "B"}')
+
+    def test_default_reads_payloads_from_agents_using_a_codec(self):
+        """コーデックに切り替えたエージェントと、まだ切り替えていないエージェントが相互に読める"""
+        msg = Message("A", "B", "hello ☕", job_id="j", msg_id="m-1")
+        sent = {}
+        for name in ("binary", "envelope", None):
+            sender = RedisBroker(codec=name)
+            sender.connect()
+            sender.publish(msg if name else msg.to_json())
+            sent[name] = self.mock_client.publish.call_args.args[1]
+
+        # 受信側は bytes のまま受け取る (redis-py に UTF-8 として解釈させない)
+        legacy_reader = RedisBroker()
+        legacy_reader.connect()
+        self.assertFalse(self.MockRedis.call_args.kwargs['decode_responses'])
+        shutdown_event = threading.Event()
+        received = []
+
+        def callback(payload):
+            received.append(payload)
+            if len(received) == 3:
+                shutdown_event.set()
+
+        self.mock_pubsub.get_message.side_effect = [
+            _msg(sent["binary"]), _msg(b"\x02\xff\x00"), _msg(sent["envelope"]), _msg(sent[None].encode("utf-8")),
+        ]
+        with patch('builtins.print'):
+            legacy_reader.subscribe(callback, shutdown_event=shutdown_event)
+
+        self.assertEqual([type(payload) for payload in received], [Message, Message, str])
+        for payload in received:
+            self.assertEqual(Message.from_payload(payload).to_dict(), msg.to_dict())
+
+        # 逆向き: コーデックを使うエージェントは従来形式のJSONを読める
+        received.clear()
+        shutdown_event.clear()
+        self.mock_pubsub.get_message.side_effect = [_msg(sent[None].encode("utf-8")), None]
+        reader = RedisBroker(codec="binary")
+        reader.connect()
+        reader.subscribe(lambda payload: (received.append(payload), shutdown_event.set()), shutdown_event=shutdown_event)
+        self.assertEqual(received[0].to_dict(), msg.to_dict())
+
+    def test_codec_encodes_messages_and_routes_from_message(self):
+        broker = RedisBroker(routing="addressed", codec="binary")
+        broker.connect()
+        self.assertTrue(broker.passes_messages)
+        self.assertFalse(self.MockRedis.call_args.kwargs['decode_responses'])
+
+        msg = Message("A", "B", "hello", job_id="j", cc_agents=["C"])
+        broker.publish(msg)
+
+        channels = [c.args[0] for c in self.mock_client.publish.call_args_list]
+        self.assertEqual(channels, ["ai_masa_channel:inbox:B", "ai_masa_channel:inbox:C", "ai_masa_channel:firehose"])
+        payload = self.mock_client.publish.call_args.args[1]
+        self.assertEqual(payload, BinaryCodec().encode(msg))
+
+    def test_codec_decodes_received_payloads(self):
+        """受信したデータは形式に関係なく Message としてコールバックに渡される"""
+        shutdown_event = threading.Event()
+        received = []
+
+        def callback(msg):
+            received.append(msg)
+            if len(received) == 2:
+                shutdown_event.set()
+
+        msg = Message("A", "B", "hello", job_id="j")
+        self.mock_pubsub.get_message.side_effect = [
+            _msg(BinaryCodec().encode(msg)),
+            _msg(b"\x7fgarbage"),
+            _msg(msg.to_json().encode("utf-8")),
+        ]
+
+        broker = RedisBroker(codec="json")
+        broker.connect()
+        with patch('builtins.print'):
+            broker.subscribe(callback, shutdown_event=shutdown_event)
+
+        self.assertEqual([m.to_dict() for m in received], [msg.to_dict(), decode_message(msg.to_json()).to_dict()])
+
+    def test_compress_threshold_requires_codec(self):
+        with self.assertRaises(ValueError):
+            RedisBroker(compress_threshold=1024)
+        broker = RedisBroker(codec="binary", compress_threshold=1024)
+        self.assertEqual(broker.codec.compress_threshold, 1024)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import fnmatch
+import unittest
+from unittest.mock import patch
+
+from ai_masa.agents.base_agent import BaseAgent
+from ai_masa.context.redis_store import RedisContextStore
+from ai_masa.context.store import InMemoryContextStore, get_context_store
+from ai_masa.models.message import Message
+
+
+class FakeRedis:
+    """RedisContextStore が使うコマンドだけを持つ、プロセス内の Redis の代わり (TTL は記録のみ)"""
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.commands = []
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        self.ttls[key] = ex
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def rpush(self, key, value):
+        self.data.setdefault(key, []).append(value)
+        return len(self.data[key])
+
+    def ltrim(self, key, start, end):
+        items = self.data.get(key, [])
+        self.data[key] = items[start:] if end == -1 else items[start:end + 1]
+        return True
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def lrange(self, key, start, end):
+        self.commands.append(("lrange", key, start, end))
+        items = self.data.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+        return True
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+def _msg(content, job_id="job"):
+    return Message("A", "B", content, job_id=job_id)
+
+
+class TestRedisContextStore(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.evictions = []
+
+    def _store(self, **options):
+        store = RedisContextStore(client=self.redis, **options)
+        store.add_eviction_listener(
+            lambda job_id, first_seq, reason: self.evictions.append((job_id, first_seq, reason))
+        )
+        return store
+
+    def test_history_is_shared_between_agents(self):
+        first, second = self._store(), self._store()
+        msg = _msg("hello")
+        # 同じメッセージを受け取った2つのエージェントが追加しても、書き込まれるのは1回
+        first.append("job", msg)
+        second.append("job", msg)
+        self.assertEqual(len(self.redis.data["ai_masa:context:log:job"]), 1)
+        self.assertEqual(second.stats["duplicates"], 1)
+        self.assertEqual([m.to_dict() for m in second["job"]], [msg.to_dict()])
+        self.assertIn("job", second)
+        self.assertNotIn("other", second)
+        self.assertEqual(second.job_ids(), ["job"])
+        self.assertEqual(self.redis.ttls["ai_masa:context:log:job"], 24 * 3600)
+
+    def test_reads_fetch_only_new_messages(self):
+        writer, reader = self._store(), self._store()
+        writer.append("job", _msg("1"))
+        writer.append("job", _msg("2"))
+        self.assertEqual([m.content for m in reader["job"]], ["1", "2"])
+        writer.append("job", _msg("3"))
+        self.assertEqual(reader.since("job", 2)[0], 2)
+        self.assertEqual([m.content for m in reader.since("job", 2)[1]], ["3"])
+        lranges = [c for c in self.redis.commands if c[0] == "lrange"]
+        self.assertEqual([c[2] for c in lranges], [-2, -1])
+        # 変化がなければ取得しない
+        reader.get("job")
+        self.assertEqual(reader.metrics()["cache_hits"], 2)
+        self.assertEqual(len([c for c in self.redis.commands if c[0] == "lrange"]), 2)
+
+    def test_own_appends_update_the_cache(self):
+        store = self._store()
+        store.append("job", _msg("1"))
+        store.get("job")
+        store.append("job", _msg("2"))
+        self.assertEqual([m.content for m in store["job"]], ["1", "2"])
+        self.assertEqual(store.metrics()["fetched_messages"], 1)
+
+    def test_trimmed_and_expired_history_notifies_listeners(self):
+        writer, reader = self._store(max_messages_per_job=2), self._store(max_messages_per_job=2)
+        writer.append("job", _msg("1"))
+        reader.get("job")
+        writer.append("job", _msg("2"))
+        writer.append("job", _msg("3"))
+        self.assertEqual(reader.window("job")[0], 1)
+        self.assertEqual([m.content for m in reader["job"]], ["2", "3"])
+        self.assertIn(("job", 1, "trimmed"), self.evictions)
+
+        # Redis 側で期限切れになった
+        del self.redis.data["ai_masa:context:log:job"]
+        self.assertIsNone(reader.get("job"))
+        self.assertIn(("job", None, "expired"), self.evictions)
+
+    def test_recreated_job_continues_numbering(self):
+        store = self._store()
+        store.append("job", _msg("old"))
+        store.discard("job")
+        store.append("job", _msg("new"))
+        self.assertEqual(store.window("job")[0], 1)
+        self.assertEqual([m.content for m in store["job"]], ["new"])
+
+    def test_local_cache_is_bounded(self):
+        store = self._store(max_cached_jobs=2)
+        for job_id in ("a", "b", "c"):
+            store.append(job_id, _msg(job_id, job_id=job_id))
+            store.get(job_id)
+        self.assertEqual(store.metrics()["cached_jobs"], 2)
+        # キャッシュから外れたジョブも Redis から読める
+        self.assertEqual([m.content for m in store["a"]], ["a"])
+
+
+class TestContextStoreSelection(unittest.TestCase):
+
+    def test_get_context_store(self):
+        self.assertIsInstance(get_context_store("memory"), InMemoryContextStore)
+        self.assertIsInstance(get_context_store("redis"), RedisContextStore)
+        store = InMemoryContextStore()
+        self.assertIs(get_context_store(store), store)
+        with self.assertRaises(ValueError):
+            get_context_store("disk")
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_agent_uses_redis_host_for_redis_store(self, MockRedisBroker):
+        agent = BaseAgent("TestAgent", "Test Role", redis_host="redis-server", start_heartbeat=False, context_store="redis")
+        self.assertIsInstance(agent.context, RedisContextStore)
+        self.assertEqual(agent.context.host, "redis-server")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+import threading
+from concurrent.futures import Future
+from unittest.mock import patch, MagicMock
+
+import redis
+
+from ai_masa.agents.base_agent import BaseAgent
+from ai_masa.agents.dispatcher import MessageDispatcher
+from ai_masa.comms.redis_stream_broker import RedisStreamBroker
+from ai_masa.models.message import Message
+
+
+class TestRedisStreamBroker(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('ai_masa.comms.redis_stream_broker.redis.Redis')
+        self.MockRedis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_client = self.MockRedis.return_value
+        self.mock_client.xpending_range.return_value = []
+        self.shutdown_event = threading.Event()
+
+    def _run_once(self, broker, **kwargs):
+        """xreadgroupを1回呼んだらループを抜ける"""
+        responses = list(self.mock_client.xreadgroup.side_effect or [])
+
+        def xreadgroup(*args, **kw):
+            self.shutdown_event.set()
+            return responses.pop(0) if responses else []
+        self.mock_client.xreadgroup.side_effect = xreadgroup
+        broker.subscribe(kwargs.pop('callback', MagicMock()), shutdown_event=self.shutdown_event, **kwargs)
+
+    def test_publish_adds_to_stream_with_bounded_length(self):
+        broker = RedisStreamBroker(maxlen=500)
+        broker.connect()
+        pipe = self.mock_client.pipeline.return_value
+
+        broker.publish('{"to_agent": "B"}', recipients=["B"])
+
+        pipe.xadd.assert_called_once_with('ai_masa_stream', {'data': '{"to_agent": "B"}'}, maxlen=500, approximate=True)
+        pipe.execute.assert_called_once()
+
+    def test_addressed_publish_fans_out_to_inbox_streams(self):
+        broker = RedisStreamBroker(routing="addressed")
+        broker.connect()
+        pipe = self.mock_client.pipeline.return_value
+
+        broker.publish('{"to_agent": "B", "cc_agents": ["C"]}')
+
+        streams = [c.args[0] for c in pipe.xadd.call_args_list]
+        self.assertEqual(streams, ['ai_masa_stream:inbox:B', 'ai_masa_stream:inbox:C', 'ai_masa_stream:firehose'])
+
+    def test_subscribe_uses_agent_name_as_consumer_group_and_acks(self):
+        broker = RedisStreamBroker(consumer_name="replica-1")
+        broker.connect()
+        callback = MagicMock()
+        self.mock_client.xreadgroup.side_effect = [[['ai_masa_stream', [('1-0', {'data': 'payload'})]]]]
+
+        self._run_once(broker, callback=callback, agent_name="Worker")
+
+        self.mock_client.xgroup_create.assert_called_once_with('ai_masa_stream', 'Worker', id='$', mkstream=True)
+        args = self.mock_client.xreadgroup.call_args.args
+        self.assertEqual(args[:2], ('Worker', 'replica-1'))
+        callback.assert_called_once_with('payload')
+        self.mock_client.xack.assert_called_once_with('ai_masa_stream', 'Worker', '1-0')
+
+    def test_existing_group_is_reused(self):
+        broker = RedisStreamBroker()
+        broker.connect()
+        self.mock_client.xgroup_create.side_effect = redis.ResponseError("BUSYGROUP Consumer Group name already exists")
+
+        self._run_once(broker, agent_name="Worker")
+
+        self.mock_client.xreadgroup.assert_called_once()
+
+    def test_failed_callback_is_not_acked(self):
+        broker = RedisStreamBroker()
+        broker.connect()
+        callback = MagicMock(side_effect=RuntimeError("boom"))
+        self.mock_client.xreadgroup.side_effect = [[['ai_masa_stream', [('1-0', {'data': 'payload'})]]]]
+
+        self._run_once(broker, callback=callback, agent_name="Worker")
+
+        callback.assert_called_once()
+        self.mock_client.xack.assert_not_called()
+
+    def test_stale_pending_entries_are_claimed_or_dropped(self):
+        broker = RedisStreamBroker(consumer_name="replica-2", max_deliveries=3)
+        broker.connect()
+        callback = MagicMock()
+        self.mock_client.xpending_range.return_value = [
+            {'message_id': '1-0', 'consumer': 'replica-1', 'time_since_delivered': 60000, 'times_delivered': 1},
+            {'message_id': '2-0', 'consumer': 'replica-1', 'time_since_delivered': 60000, 'times_delivered': 3},
+        ]
+        self.mock_client.xclaim.return_value = [('1-0', {'data': 'retry me'})]
+
+        self._run_once(broker, callback=callback, agent_name="Worker")
+
+        self.mock_client.xclaim.assert_called_once_with('ai_masa_stream', 'Worker', 'replica-2', broker.claim_min_idle_ms, ['1-0'])
+        callback.assert_called_once_with('retry me')
+        acked = [c.args[2] for c in self.mock_client.xack.call_args_list]
+        self.assertEqual(sorted(acked), ['1-0', '2-0'])
+
+    def test_deferred_work_is_acked_when_it_completes(self):
+        broker = RedisStreamBroker(consumer_name="replica-1")
+        broker.connect()
+        completions = [Future(), Future()]
+        callback = MagicMock(side_effect=completions)
+        self.mock_client.xreadgroup.side_effect = [[['ai_masa_stream', [('1-0', {'data': 'a'}), ('2-0', {'data': 'b'})]]]]
+
+        self._run_once(broker, callback=callback, agent_name="Worker")
+
+        # 思考処理が終わるまでは ACK しない
+        self.mock_client.xack.assert_not_called()
+        completions[0].set_result(None)
+        self.mock_client.xack.assert_called_once_with('ai_masa_stream', 'Worker', '1-0')
+        with patch('builtins.print'):
+            completions[1].set_exception(RuntimeError("dropped"))
+        self.mock_client.xack.assert_called_once()
+        self.assertEqual(broker._inflight, {})
+
+    def test_inflight_entries_are_kept_from_other_replicas(self):
+        broker = RedisStreamBroker(consumer_name="replica-1")
+        broker.connect()
+        pending = Future()
+        self.mock_client.xreadgroup.side_effect = [[['ai_masa_stream', [('1-0', {'data': 'a'})]]]]
+        self._run_once(broker, callback=MagicMock(return_value=pending), agent_name="Worker")
+        self.mock_client.xclaim.assert_not_called()
+
+        broker._touch_inflight()
+        self.mock_client.xclaim.assert_called_once_with('ai_masa_stream', 'Worker', 'replica-1', 0, ['1-0'], justid=True)
+        pending.set_result(None)
+
+    def test_dropped_work_is_redelivered_and_processed(self):
+        broker = RedisStreamBroker(consumer_name="replica-1")
+        with patch('builtins.print'):
+            agent = BaseAgent("Worker", "Test Role", start_heartbeat=False, broker=broker, llm_workers=1)
+            self.addCleanup(agent.shutdown)
+            payload = Message("User", "Worker", "hello", job_id="job-1", msg_id="m-1").to_json()
+
+            # ワーカーが止まっていて思考が破棄された (TaskDropped) メッセージは ACK されない
+            agent.dispatcher.stop()
+            self.mock_client.xreadgroup.side_effect = [[['ai_masa_stream', [('1-0', {'data': payload})]]]]
+            self._run_once(broker, callback=agent._on_message_received, agent_name="Worker")
+            self.mock_client.xack.assert_not_called()
+
+            # 再配送されたメッセージは重複として捨てずに処理し、終わってから ACK する
+            agent.dispatcher = MessageDispatcher("Worker", workers=1).start()
+            thought = threading.Event()
+            self.mock_client.xpending_range.return_value = [
+                {'message_id': '1-0', 'consumer': 'replica-1', 'time_since_delivered': 60000, 'times_delivered': 1},
+            ]
+            self.mock_client.xclaim.return_value = [('1-0', {'data': payload})]
+            self.mock_client.xreadgroup.side_effect = None
+            self.shutdown_event.clear()
+            with patch.object(agent, 'think_and_respond', side_effect=lambda *args, **kwargs: thought.set()):
+                self._run_once(broker, callback=agent._on_message_received, agent_name="Worker")
+                self.assertTrue(thought.wait(2))
+                agent.dispatcher.stop(timeout=2)
+        self.mock_client.xack.assert_called_once_with('ai_masa_stream', 'Worker', '1-0')
+
+if __name__ == '__main__':
+    unittest.main()
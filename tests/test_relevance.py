@@ -0,0 +1,67 @@
+import unittest
+
+from ai_masa.context.relevance import RelevanceIndex, tokenize
+from ai_masa.context.store import InMemoryContextStore
+from ai_masa.models.message import Message
+
+
+def _append(store, *contents, job_id="job"):
+    for content in contents:
+        store.append(job_id, Message("A", "B", content, job_id=job_id))
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_words_and_japanese_bigrams(self):
+        self.assertEqual(tokenize("Deploy the API x"), ["deploy", "the", "api"])
+        self.assertEqual(tokenize("計算が得意"), ["計算", "算が", "が得", "得意"])
+        self.assertEqual(tokenize({"k": "Value"}), ["value"])
+
+
+class TestRelevanceIndex(unittest.TestCase):
+
+    def test_ranks_matching_messages(self):
+        store = InMemoryContextStore()
+        _append(store, "the database migration failed", "lunch order", "the weather is nice",
+                "database backup finished", "random chatter")
+        index = RelevanceIndex(store)
+        hits = index.search("job", "why did the database migration fail?")
+        self.assertEqual([msg.content for _, msg, _ in hits][:2], ["the database migration failed", "database backup finished"])
+        self.assertEqual(hits[0][0], 0)
+        self.assertEqual(index.search("job", "nothing in common"), [])
+        self.assertEqual(index.search("missing", "database"), [])
+
+    def test_indexes_new_messages_incrementally(self):
+        store = InMemoryContextStore()
+        _append(store, "alpha")
+        index = RelevanceIndex(store)
+        self.assertEqual(len(index.search("job", "alpha")), 1)
+        _append(store, "beta", "alpha again")
+        self.assertEqual([seq for seq, _, _ in index.search("job", "alpha")], [0, 2])
+        self.assertEqual(index.stats["indexed"], 3)
+        # before_seq より新しいメッセージは含めない
+        self.assertEqual([seq for seq, _, _ in index.search("job", "alpha", before_seq=2)], [0])
+
+    def test_evicted_messages_are_removed(self):
+        store = InMemoryContextStore(max_messages_per_job=2)
+        index = RelevanceIndex(store)
+        _append(store, "alpha one")
+        index.search("job", "alpha")
+        _append(store, "beta", "alpha two")
+        self.assertEqual([msg.content for _, msg, _ in index.search("job", "alpha")], ["alpha two"])
+        self.assertNotIn("one", index._jobs["job"].postings)
+        store.discard("job")
+        self.assertNotIn("job", index._jobs)
+
+    def test_candidates_are_capped(self):
+        store = InMemoryContextStore()
+        _append(store, *[f"common filler {i}" for i in range(20)], "rare common")
+        _append(store, *[f"other {i}" for i in range(20)])
+        index = RelevanceIndex(store, max_candidates=1, max_df_ratio=1.0)
+        hits = index.search("job", "rare common")
+        # 珍しい語を含むメッセージだけが候補になり、よくある語はそのスコアに足される
+        self.assertEqual([msg.content for _, msg, _ in hits], ["rare common"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+from ai_masa.context.rendered import RenderedHistory, estimate_tokens
+from ai_masa.context.store import InMemoryContextStore
+from ai_masa.models.message import Message
+from ai_masa.models.prompts import PROMPT_TEMPLATE, OBSERVER_INSTRUCTION, CompiledPrompt
+
+
+def _msg(content, job_id="job", from_agent="A"):
+    return Message(from_agent, "B", content, job_id=job_id)
+
+
+def _full_render(store, job_id):
+    return "\n".join([f"- {msg.from_agent}: {msg.content}" for msg in store.get(job_id, [])])
+
+
+class TestRenderedHistory(unittest.TestCase):
+
+    def test_appends_only_new_messages(self):
+        store = InMemoryContextStore()
+        rendered = RenderedHistory(store)
+        self.assertEqual(rendered.text("job"), "")
+        store.append("job", _msg("1"))
+        store.append("job", _msg("2", from_agent="C"))
+        self.assertEqual(rendered.text("job"), "- A: 1\n- C: 2")
+        store.append("job", _msg("3"))
+        self.assertEqual(rendered.text("job"), _full_render(store, "job"))
+        # 各メッセージは一度だけ描画される
+        self.assertEqual(rendered.stats["rendered"], 3)
+
+    def test_trims_lines_evicted_by_per_job_cap(self):
+        store = InMemoryContextStore(max_messages_per_job=2)
+        rendered = RenderedHistory(store)
+        for i in range(5):
+            store.append("job", _msg(f"message {i}"))
+            self.assertEqual(rendered.text("job"), _full_render(store, "job"))
+        self.assertEqual(rendered.text("job"), "- A: message 3\n- A: message 4")
+
+    def test_eviction_of_unrendered_messages(self):
+        store = InMemoryContextStore(max_messages_per_job=2)
+        rendered = RenderedHistory(store)
+        store.append("job", _msg("1"))
+        rendered.text("job")
+        for i in range(2, 6):
+            store.append("job", _msg(str(i)))
+        self.assertEqual(rendered.text("job"), "- A: 4\n- A: 5")
+
+    def test_dropped_job_is_rebuilt(self):
+        store = InMemoryContextStore()
+        rendered = RenderedHistory(store)
+        store.append("job", _msg("old"))
+        rendered.text("job")
+        store.discard("job")
+        self.assertEqual(rendered.text("job"), "")
+        store.append("job", _msg("new"))
+        self.assertEqual(rendered.text("job"), "- A: new")
+
+    def test_recreated_job_without_listener_is_rebuilt(self):
+        store = InMemoryContextStore(max_jobs=1)
+        rendered = RenderedHistory(store)
+        store.append("job", _msg("old"))
+        rendered.text("job")
+        # ジョブが捨てられて作り直されても、通し番号が重ならないので描画し直される
+        store._listeners.clear()
+        store.append("other", _msg("x", job_id="other"))
+        store.append("job", _msg("new"))
+        self.assertEqual(rendered.text("job"), "- A: new")
+        self.assertEqual(rendered.stats["rebuilt"], 1)
+
+    def test_window_keeps_newest_lines_within_budget(self):
+        store = InMemoryContextStore()
+        rendered = RenderedHistory(store, count_tokens=len)
+        for i in range(5):
+            store.append("job", _msg(f"m{i}"))
+        # 各行は "- A: mN" の7文字
+        window = rendered.window("job", 15)
+        self.assertEqual(window.text, "- A: m3\n- A: m4")
+        self.assertEqual((window.first_seq, window.next_seq), (3, 5))
+        self.assertEqual((window.kept_messages, window.kept_tokens), (2, 14))
+        self.assertEqual((window.dropped_messages, window.dropped_tokens), (3, 21))
+        self.assertEqual(rendered.window("job", 1000).text, rendered.text("job"))
+        # 最新の1行は予算を超えても含める
+        self.assertEqual(rendered.window("job", 1).text, "- A: m4")
+
+    def test_window_after_eviction(self):
+        store = InMemoryContextStore(max_messages_per_job=3)
+        rendered = RenderedHistory(store, count_tokens=len)
+        for i in range(5):
+            store.append("job", _msg(f"m{i}"))
+            rendered.text("job")
+        window = rendered.window("job", 1000)
+        self.assertEqual((window.kept_messages, window.dropped_messages, window.dropped_tokens), (3, 0, 0))
+        self.assertEqual(rendered.window("missing", 10).kept_messages, 0)
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens("こんにちは"), 5)
+
+
+class TestCompiledPrompt(unittest.TestCase):
+
+    def test_matches_str_format(self):
+        fixed = {"name": "agent", "role_prompt": "role with {braces}"}
+        compiled = CompiledPrompt(PROMPT_TEMPLATE, **fixed)
+        for observer in ("", OBSERVER_INSTRUCTION):
+            values = {
+                "history": "- A: {x}", "from_agent": "A", "content": {"k": 1},
+                "observer_instructions": observer,
+            }
+            self.assertEqual(compiled.render(**values), PROMPT_TEMPLATE.format(**fixed, **values))
+
+    def test_dynamic_fields(self):
+        compiled = CompiledPrompt("{a} and {b}", a="x")
+        self.assertEqual(compiled.fields, {"b"})
+        self.assertEqual(compiled.render(b="y"), "x and y")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import call, patch
+
+from ai_masa.agents.base_agent import BaseAgent
+from ai_masa.llm.response_cache import LLMResponseCache
+from ai_masa.models.message import Message
+
+
+class TestLLMResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "cache", "llm.sqlite3")
+
+    def _cache(self, **options):
+        cache = LLMResponseCache(self.path, **options)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_fingerprint(self):
+        key = LLMResponseCache.fingerprint("role", "prompt", "llm {session_id}")
+        self.assertEqual(key, LLMResponseCache.fingerprint("role", "prompt", "llm {session_id}"))
+        self.assertNotEqual(key, LLMResponseCache.fingerprint("role", "prompt", "other {session_id}"))
+        # 区切りの位置が違えば別のキー
+        self.assertNotEqual(LLMResponseCache.fingerprint("ab", "c", ""), LLMResponseCache.fingerprint("a", "bc", ""))
+
+    def test_hit_and_miss(self):
+        cache = self._cache()
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", '{"to_agent": "User"}')
+        self.assertEqual(cache.get("k"), '{"to_agent": "User"}')
+        metrics = cache.metrics()
+        self.assertEqual((metrics["hits"], metrics["misses"], metrics["stored"]), (1, 1, 1))
+        self.assertEqual(metrics["hit_rate"], 0.5)
+
+    def test_evicts_least_recently_used(self):
+        cache = self._cache(max_entries=2)
+        cache.put("a", "1")
+        time.sleep(0.01)
+        cache.put("b", "2")
+        time.sleep(0.01)
+        cache.get("a")
+        time.sleep(0.01)
+        cache.put("c", "3")
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.stats["evicted"], 1)
+
+    def test_ttl(self):
+        cache = self._cache(ttl=60)
+        cache.put("k", "v")
+        with patch("ai_masa.llm.response_cache.time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats["expired"], 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_shared_between_processes(self):
+        cache = self._cache()
+        cache.put("k", "こんにちは")
+        script = (
+            "import sys; from ai_masa.llm.response_cache import LLMResponseCache; "
+            "c = LLMResponseCache(sys.argv[1]); print(c.get('k')); c.put('from-child', 'ok')"
+        )
+        result = subprocess.run([sys.executable, "-c", script, self.path], capture_output=True, text=True,
+                                check=True, encoding="utf-8")
+        self.assertEqual(result.stdout.strip(), "こんにちは")
+        self.assertEqual(cache.get("from-child"), "ok")
+
+
+class TestAgentWithResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "llm.sqlite3")
+
+    def _run_twice(self, agent_class, mock_run):
+        mock_run.return_value = subprocess.CompletedProcess(
+            args='', returncode=0, stdout='{"to_agent": "User", "content": "done"}', stderr=''
+        )
+        trigger = Message(from_agent="User", to_agent="TestAgent", content="hello", job_id="job")
+        responses = []
+        for _ in range(2):
+            agent = agent_class("TestAgent", "Test Role", llm_command="llm --resume {session_id}",
+                                start_heartbeat=False, llm_cache=self.path)
+            self.addCleanup(agent.llm_cache.close)
+            with patch.object(agent, 'broadcast') as mock_broadcast, patch('builtins.print'):
+                agent.job_sessions["job"] = "session-1"
+                agent.think_and_respond(trigger, "job")
+            responses.append(mock_broadcast.call_args)
+        return agent, responses
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_identical_prompt_is_served_from_cache(self, MockRedisBroker, mock_run):
+        agent, responses = self._run_twice(BaseAgent, mock_run)
+        # 2つ目のエージェント (再起動後を想定) は同じプロンプトでLLMを呼ばない
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(responses[0], responses[1])
+        self.assertEqual(agent.llm_cache.stats["hits"], 1)
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_agent_can_opt_out_per_call(self, MockRedisBroker, mock_run):
+        class NondeterministicAgent(BaseAgent):
+            def should_cache_llm_response(self, trigger_msg, job_id):
+                return False
+
+        agent, _ = self._run_twice(NondeterministicAgent, mock_run)
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertEqual(agent.llm_cache.stats["hits"], 0)
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_identical_delta_prompts_of_different_jobs_are_not_shared(self, MockRedisBroker, mock_run):
+        def llm(command, **kwargs):
+            session = command.split()[-1]
+            return subprocess.CompletedProcess(
+                args=command, returncode=0, stdout=f'{{"to_agent": "User", "content": "from {session}"}}', stderr=''
+            )
+        mock_run.side_effect = llm
+        agent = BaseAgent("TestAgent", "Test Role", llm_command="llm --resume {session_id}",
+                          start_heartbeat=False, llm_cache=self.path, delta_prompts=True)
+        self.addCleanup(agent.llm_cache.close)
+        agent.job_sessions.update({"j1": "s1", "j2": "s2"})
+        with patch.object(agent, 'broadcast') as mock_broadcast, patch('builtins.print'):
+            for job_id in ("j1", "j2"):
+                agent._on_message_received(Message("User", "TestAgent", f"start {job_id}", job_id=job_id).to_json())
+                # 2通目の差分のプロンプトは、どちらのジョブでも同じ文字列になる
+                agent._on_message_received(Message("User", "TestAgent", "continue", job_id=job_id).to_json())
+        self.assertEqual(agent.prompt_stats["delta"], 2)
+        self.assertEqual(mock_run.call_count, 4)
+        self.assertEqual(agent.llm_cache.stats["hits"], 0)
+        self.assertEqual(mock_broadcast.call_args_list[-1], call(target="User", content="from s2", cc=None, job_id="j2"))
+
+
+if __name__ == '__main__':
+    unittest.main()
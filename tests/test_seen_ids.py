@@ -0,0 +1,61 @@
+import unittest
+
+from ai_masa.agents.seen_ids import SeenIdCache, LEGACY_MESSAGE_ID
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSeenIdCache(unittest.TestCase):
+
+    def test_second_delivery_is_a_duplicate(self):
+        cache = SeenIdCache()
+        self.assertFalse(cache.check("m-1"))
+        self.assertTrue(cache.check("m-1"))
+        self.assertFalse(cache.check("m-2"))
+        self.assertEqual(cache.stats["duplicates"], 1)
+
+    def test_forgotten_id_is_accepted_again(self):
+        cache = SeenIdCache()
+        self.assertFalse(cache.check("m-1"))
+        cache.forget("m-1")
+        self.assertFalse(cache.check("m-1"))
+        cache.forget("unknown")
+
+    def test_oldest_ids_are_evicted_by_size(self):
+        cache = SeenIdCache(max_size=2, ttl=None)
+        for message_id in ("m-1", "m-2", "m-3"):
+            cache.check(message_id)
+        self.assertEqual(len(cache), 2)
+        self.assertFalse(cache.check("m-1"))  # 追い出されたので重複とはみなされない
+        self.assertTrue(cache.check("m-3"))
+        self.assertEqual(cache.stats["evicted"], 2)
+
+    def test_ids_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = SeenIdCache(ttl=10, clock=clock)
+        cache.check("m-1")
+        clock.now = 5
+        cache.check("m-2")
+        clock.now = 11
+        self.assertFalse(cache.check("m-1"))
+        self.assertTrue(cache.check("m-2"))
+
+    def test_missing_and_legacy_ids_are_ignored(self):
+        cache = SeenIdCache()
+        for message_id in (None, "", LEGACY_MESSAGE_ID, LEGACY_MESSAGE_ID):
+            self.assertFalse(cache.check(message_id))
+        self.assertEqual(len(cache), 0)
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            SeenIdCache(max_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from ai_masa.llm.session_pool import SessionPool
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestSessionPool(unittest.TestCase):
+
+    def _pool(self, create_session, **options):
+        pool = SessionPool(create_session, **options)
+        self.addCleanup(pool.stop)
+        return pool
+
+    def test_prewarms_and_refills(self):
+        counter = iter(range(100))
+        pool = self._pool(lambda: f"s{next(counter)}", size=2).start()
+        self.assertTrue(wait_until(lambda: pool.ready() == 2))
+        self.assertEqual(pool.take(), "s0")
+        self.assertTrue(wait_until(lambda: pool.ready() == 2))
+        self.assertEqual(pool.stats["created"], 3)
+        self.assertEqual(pool.stats["taken"], 1)
+
+    def test_take_returns_none_when_empty(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_create():
+            started.set()
+            release.wait(2)
+            return "s"
+
+        pool = self._pool(slow_create, size=1).start()
+        started.wait(1)
+        self.assertIsNone(pool.take())
+        self.assertEqual(pool.stats["misses"], 1)
+        release.set()
+
+    def test_retries_after_failure(self):
+        results = iter([None, "s1"])
+        with patch('builtins.print'):
+            pool = self._pool(lambda: next(results), size=1, retry_interval=0.05).start()
+            self.assertTrue(wait_until(lambda: pool.ready() == 1))
+        self.assertEqual(pool.stats["failed"], 1)
+        self.assertEqual(pool.take(), "s1")
+
+    def test_runs_maintenance(self):
+        calls = []
+        pool = self._pool(lambda: "s", size=0, maintenance=lambda: calls.append(1), maintenance_interval=0.05).start()
+        self.assertTrue(wait_until(lambda: len(calls) >= 2))
+
+    def test_stop_returns_unused_sessions(self):
+        counter = iter(range(100))
+        pool = SessionPool(lambda: f"s{next(counter)}", size=2).start()
+        self.assertTrue(wait_until(lambda: pool.ready() == 2))
+        self.assertEqual(sorted(pool.stop()), ["s0", "s1"])
+        self.assertEqual(pool.ready(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ai_masa.agents.base_agent import BaseAgent
+from ai_masa.llm.session_registry import (
+    FileSessionRegistry, InMemorySessionRegistry, RedisSessionRegistry, get_session_registry
+)
+from ai_masa.models.message import Message
+from tests.test_redis_context_store import FakeRedis
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestInMemorySessionRegistry(unittest.TestCase):
+
+    def test_behaves_like_dict(self):
+        registry = InMemorySessionRegistry()
+        registry["job-1"] = "s1"
+        registry.update({"job-2": "s2"})
+        self.assertEqual(registry.get("job-1"), "s1")
+        self.assertIsNone(registry.get("missing"))
+        self.assertIn("job-2", registry)
+        self.assertEqual(dict(registry.items()), {"job-1": "s1", "job-2": "s2"})
+        del registry["job-1"]
+        self.assertEqual(len(registry), 1)
+
+    def test_ttl_is_extended_by_reads(self):
+        clock = FakeClock()
+        registry = InMemorySessionRegistry(ttl=100, clock=clock)
+        registry["job"] = "s"
+        clock.now += 60
+        self.assertEqual(registry["job"], "s")
+        clock.now += 60
+        self.assertEqual(registry.get("job"), "s")
+        clock.now += 101
+        self.assertIsNone(registry.get("job"))
+        self.assertEqual(len(registry), 0)
+
+
+class TestFileSessionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "sessions", "agent.json")
+
+    def test_survives_restart(self):
+        FileSessionRegistry(self.path)["job"] = "session-1"
+        restarted = FileSessionRegistry(self.path)
+        # 読み込みは最初に使われたときに行う
+        self.assertFalse(restarted._loaded)
+        self.assertEqual(restarted.get("job"), "session-1")
+        self.assertEqual(restarted.stats["loaded"], 1)
+
+    def test_expired_entries_are_not_loaded(self):
+        clock = FakeClock()
+        FileSessionRegistry(self.path, ttl=100, clock=clock)["job"] = "s"
+        clock.now += 101
+        self.assertNotIn("job", FileSessionRegistry(self.path, ttl=100, clock=clock))
+
+    def test_delete_is_persisted(self):
+        registry = FileSessionRegistry(self.path)
+        registry["job-1"] = "s1"
+        registry["job-2"] = "s2"
+        del registry["job-1"]
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(list(json.load(f)), ["job-2"])
+
+    def test_broken_file_starts_empty(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write("{broken")
+        with patch('builtins.print'):
+            registry = FileSessionRegistry(self.path)
+            self.assertEqual(len(registry), 0)
+        registry["job"] = "s"
+        self.assertEqual(FileSessionRegistry(self.path)["job"], "s")
+
+
+class TestRedisSessionRegistry(unittest.TestCase):
+
+    def test_shared_through_redis_with_ttl(self):
+        redis = FakeRedis()
+        RedisSessionRegistry(client=redis, namespace="Agent", ttl=100)["job"] = "s1"
+        self.assertEqual(redis.data, {"ai_masa:sessions:Agent:job": "s1"})
+        self.assertEqual(redis.ttls["ai_masa:sessions:Agent:job"], 100)
+
+        restarted = RedisSessionRegistry(client=redis, namespace="Agent", ttl=100)
+        self.assertEqual(restarted["job"], "s1")
+        self.assertEqual(restarted["job"], "s1")
+        self.assertEqual((restarted.stats["misses"], restarted.stats["hits"]), (1, 1))
+        self.assertEqual(list(restarted), ["job"])
+        self.assertNotIn("job", RedisSessionRegistry(client=redis, namespace="Other"))
+        del restarted["job"]
+        self.assertEqual(redis.data, {})
+
+    def test_cache_is_bounded(self):
+        redis = FakeRedis()
+        registry = RedisSessionRegistry(client=redis, ttl=None, max_cached_jobs=2)
+        for i in range(3):
+            registry[f"job-{i}"] = f"s{i}"
+        self.assertEqual(list(registry._cache), ["job-1", "job-2"])
+        self.assertEqual(registry.stats["evicted"], 1)
+        # 追い出された対応は Redis から読み直す
+        self.assertEqual(registry["job-0"], "s0")
+        self.assertEqual(list(registry._cache), ["job-2", "job-0"])
+
+    def test_changes_by_other_replicas_are_seen_after_cache_ttl(self):
+        redis = FakeRedis()
+        clock = FakeClock()
+        mine = RedisSessionRegistry(client=redis, ttl=None, clock=clock, cache_ttl=60)
+        other = RedisSessionRegistry(client=redis, ttl=None, clock=clock, cache_ttl=60)
+        mine["job"] = "s1"
+        other["job"] = "s2"
+        self.assertEqual(mine["job"], "s1")
+        clock.now += 61
+        self.assertEqual(mine["job"], "s2")
+        del other["job"]
+        clock.now += 61
+        self.assertNotIn("job", mine)
+
+
+class TestAgentSessionRegistry(unittest.TestCase):
+
+    def test_get_session_registry(self):
+        registry = InMemorySessionRegistry()
+        self.assertIs(get_session_registry(registry), registry)
+        self.assertIsInstance(get_session_registry("memory"), InMemorySessionRegistry)
+        with self.assertRaises(ValueError):
+            get_session_registry("unknown")
+
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_redis_registry_is_namespaced_by_agent(self, MockRedisBroker):
+        agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, redis_host="redis.local",
+                          session_registry="redis")
+        self.assertIsInstance(agent.job_sessions, RedisSessionRegistry)
+        self.assertEqual(agent.job_sessions.key("job"), "ai_masa:sessions:TestAgent:job")
+        self.assertEqual(agent.job_sessions.host, "redis.local")
+        # 接続は最初に使われるまで行わない
+        self.assertIsNone(agent.job_sessions.client)
+
+    @patch('subprocess.run')
+    @patch('ai_masa.agents.base_agent.RedisBroker')
+    def test_restarted_agent_resumes_session(self, MockRedisBroker, mock_run):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "sessions.json")
+            agent = BaseAgent("TestAgent", "Test Role", start_heartbeat=False,
+                              session_registry=FileSessionRegistry(path))
+            agent.job_sessions["job"] = "session-1"
+
+            restarted = BaseAgent("TestAgent", "Test Role", start_heartbeat=False, llm_command="llm {session_id}",
+                                  session_registry=FileSessionRegistry(path))
+            with patch.object(restarted, '_create_llm_session') as mock_create, \
+                    patch.object(restarted, '_invoke_llm', return_value=None) as mock_invoke, \
+                    patch('builtins.print'):
+                restarted.think_and_respond(Message("User", "TestAgent", "hello", job_id="job"), "job")
+            mock_create.assert_not_called()
+            self.assertEqual(mock_invoke.call_args[0][1], "session-1")
+
+
+if __name__ == '__main__':
+    unittest.main()
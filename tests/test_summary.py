@@ -0,0 +1,82 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from ai_masa.context.store import InMemoryContextStore
+from ai_masa.context.summary import RollingSummary, extractive_summary
+from ai_masa.models.message import Message
+
+
+def _store_with(count, job_id="job"):
+    store = InMemoryContextStore()
+    for i in range(count):
+        store.append(job_id, Message("A", "B", f"m{i}", job_id=job_id))
+    return store
+
+
+class TestExtractiveSummary(unittest.TestCase):
+
+    def test_appends_to_previous_summary(self):
+        messages = [Message("A", "B", "first\nline"), Message("C", "B", {"k": 1})]
+        self.assertEqual(extractive_summary("- X: earlier", messages), "- X: earlier\n- A: first line\n- C: {'k': 1}")
+
+    def test_truncates_long_content_and_total_size(self):
+        summary = extractive_summary("", [Message("A", "B", "x" * 50)], line_chars=10)
+        self.assertEqual(summary, "- A: " + "x" * 10 + "...")
+        summary = extractive_summary("", [Message("A", "B", str(i)) for i in range(10)], max_chars=20)
+        self.assertEqual(summary, "- A: 7\n- A: 8\n- A: 9")
+
+
+class TestRollingSummary(unittest.TestCase):
+
+    def test_summarizes_incrementally(self):
+        store = _store_with(6)
+        calls = []
+
+        def summarize(previous, messages):
+            calls.append([m.content for m in messages])
+            return f"{previous}+{len(messages)}"
+
+        summaries = RollingSummary(store, summarize, background=False)
+        self.assertEqual(summaries.get("job"), ("", 0))
+        summaries.request("job", 3)
+        self.assertEqual(summaries.get("job"), ("+3", 3))
+        # 既に要約済みの範囲は要約し直さない
+        summaries.request("job", 2)
+        summaries.request("job", 5)
+        self.assertEqual(summaries.get("job"), ("+3+2", 5))
+        self.assertEqual(calls, [["m0", "m1", "m2"], ["m3", "m4"]])
+
+    def test_dropped_job_forgets_summary(self):
+        store = _store_with(3)
+        summaries = RollingSummary(store, background=False)
+        summaries.request("job", 2)
+        store.discard("job")
+        self.assertEqual(summaries.get("job"), ("", 0))
+
+    def test_background_summary(self):
+        store = _store_with(3)
+        summaries = RollingSummary(store)
+        try:
+            summaries.request("job", 2)
+            deadline = time.monotonic() + 2
+            while summaries.get("job")[1] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(summaries.get("job"), ("- A: m0\n- A: m1", 2))
+        finally:
+            summaries.stop()
+
+    def test_summarizer_errors_are_counted(self):
+        store = _store_with(2)
+        summaries = RollingSummary(store, lambda previous, messages: 1 / 0, background=False)
+        with patch('builtins.print'):
+            summaries.request("job", 2)
+        self.assertEqual(summaries.stats["failed"], 1)
+        # 失敗した後も再度依頼できる
+        with patch('builtins.print'):
+            summaries.request("job", 2)
+        self.assertEqual(summaries.stats["failed"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()